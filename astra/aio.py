@@ -0,0 +1,631 @@
+"""
+Asyncio models on top of redis.asyncio (redis-py >= 4.2, Python >= 3.7).
+Fields and validation rules are the same as for synchronous models:
+
+    db = redis.asyncio.Redis(host='127.0.0.1', decode_responses=True)
+
+    class Stream(aio.Model):
+        name = aio.CharHash()
+        items = aio.List()
+
+        def get_db(self):
+            return db
+
+    stream = await Stream.create(1, name='Stream')
+    await stream.name
+    await stream.set_name('New name')
+    await stream.items.lpush('1')
+    streams = await Stream.get_many([1, 2, 3])
+"""
+from contextlib import asynccontextmanager
+
+from redis.exceptions import NoScriptError, WatchError
+
+from astra import base_fields, fields, model
+
+
+async def run_script(db, script, *args):
+    """ See astra.scripts.run """
+    try:
+        return await db.evalsha(script.sha, *args)
+    except NoScriptError:
+        await db.script_load(script.source)
+        return await db.evalsha(script.sha, *args)
+
+
+class WriteBuffer(model.WriteBuffer):
+    async def execute(self):
+        self._push_merged()
+        new_key_names = self._get_new_key_names(self._commands)
+        if self.version_check is None and not any(new_key_names):
+            pipe = self.db.pipeline(transaction=self.transaction)
+            self._queue(pipe, self._commands)
+            self.results = self._answers(await pipe.execute(),
+                                         self._commands)
+        elif self._commands:
+            self.results = await self._execute_checked(
+                self.db, self._commands, *new_key_names)
+        else:
+            self.results = []
+        return self.results
+
+    async def _execute_checked(self, db, commands, checked_key_names=(),
+                               recreated_key_names=()):
+        watched_key_names = list(checked_key_names)
+        if self.version_check is not None:
+            watched_key_names.append(self.version_check[0])
+        async with db.pipeline(transaction=True) as pipe:
+            while True:
+                if watched_key_names:
+                    await pipe.watch(*watched_key_names)
+                await self._check_version(pipe)
+                created_key_names = await self._get_missing_key_names(
+                    pipe, checked_key_names)
+                pipe.multi()
+                self._queue(pipe, commands)
+                self._queue_checked_tail(pipe, created_key_names,
+                                         recreated_key_names)
+                try:
+                    results = await pipe.execute()
+                    break
+                except WatchError:
+                    self._raise_conflict()
+        return self._answers_checked(results, commands)
+
+    async def _check_version(self, pipe):
+        if self.version_check is None:
+            return
+        key_name, field_name, expected = self.version_check
+        if expected is not None and \
+                (await pipe.hget(key_name, field_name) or '0') != expected:
+            self._raise_conflict()
+
+    async def _get_missing_key_names(self, pipe, key_names):
+        if not key_names:
+            return []
+        count = await pipe.exists(*key_names)
+        if count == len(key_names):
+            return []
+        if not count:
+            return list(key_names)
+        return [key_name for key_name in key_names
+                if not await pipe.exists(key_name)]
+
+    async def discard(self):
+        model.WriteBuffer.discard(self)
+
+
+class Model(model.Model):
+    """
+    Parent class for asyncio objects. Properties return awaitable values,
+    assign them by "await obj.set_<field>(value)", "await obj.update(...)"
+    or "await obj.setattr(field, value)". Collections are returned directly,
+    their methods are awaitable.
+    """
+    _astra_buffer_class = WriteBuffer
+
+    def __init__(self, pk=None):
+        super(Model, self).__init__(pk)
+
+    @classmethod
+    async def create(cls, pk, **kwargs):
+        obj = cls(pk)
+        if kwargs:
+            if cls.default_ttl is None or cls.ttl_write_through:
+                await obj.update(**kwargs)
+            else:
+                async with obj.batch():
+                    await obj.update(**kwargs)
+                    await obj.expire()
+        return obj
+
+    async def _astra_send(self, command_name, *args, **kwargs):
+        if self._astra_buffer is not None:
+            return self._astra_buffer.send(command_name, *args, **kwargs)
+        if self.default_ttl is not None and \
+                command_name not in model._NO_TTL_COMMANDS:
+            return await self._astra_send_with_ttl(command_name, *args,
+                                                   **kwargs)
+        if command_name == 'evalsha':
+            return await run_script(self._astra_get_db(), *args)
+        command = getattr(self._astra_get_db(), command_name)
+        return await command(*args, **kwargs)
+
+    async def setattr(self, field_name, value):
+        if self.version_field is not None and self._astra_buffer is None:
+            await self.update(**{field_name: value})
+            return value
+
+        field = self._get_original_field(field_name)
+        await field.assign(self, value)
+
+        if 'validators' in field.options:
+            for validator in field.options['validators']:
+                validator(value)
+        return value
+
+    async def apply(self, field_name, helper_name, *args, **kwargs):
+        field = self._get_original_field(field_name)
+        f = field.get_helper_func(self, helper_name)
+        return await f(*args, **kwargs)
+
+    async def update(self, **kwargs):
+        """ See astra.model.Model.update """
+        if self._astra_buffer is not None:  # Already buffered by the caller
+            for k in kwargs:
+                await getattr(self, 'set_%s' % k)(kwargs[k])
+            return
+
+        write_buffer = self._astra_make_buffer(
+            version_check=self._astra_get_version_check())
+        self._astra_buffer = write_buffer
+        try:
+            for k in kwargs:
+                await getattr(self, 'set_%s' % k)(kwargs[k])
+        except BaseException:
+            self._astra_reset_cache()  # Cache contains unsaved values
+            raise
+        finally:
+            self._astra_buffer = None
+        await self._astra_execute(write_buffer)
+
+    async def cas(self, field_name, expected, value):
+        """ See astra.model.Model.cas """
+        return await self.update_if({field_name: expected},
+                                    **{field_name: value})
+
+    async def update_if(self, conditions, **values):
+        """ See astra.model.Model.update_if """
+        command_name, args, saved_values = \
+            self._astra_get_update_if_command(conditions, values)
+        answer = await self._astra_send(command_name, *args)
+        return self._astra_fill_update_if(saved_values, answer)
+
+    async def hincrby(self, field_name, amount=1, min=None, max=None):
+        """ See astra.model.Model.hincrby """
+        command_name, args = self._astra_get_hincrby_command(
+            field_name, amount, min, max)
+        answer = await self._astra_send(command_name, *args)
+        return self._astra_fill_hincrby(field_name, answer)
+
+    @asynccontextmanager
+    async def batch(self, transaction=False):
+        """
+        See astra.model.Model.batch. Don't share object between tasks while
+        batch is open, their writes will be buffered too
+        """
+        if self._astra_buffer is not None:  # Nested batch joins outer one
+            yield self._astra_buffer
+            return
+
+        write_buffer = self._astra_make_buffer(
+            transaction=transaction,
+            version_check=self._astra_get_version_check())
+        self._astra_buffer = write_buffer
+        try:
+            yield write_buffer
+        except BaseException:
+            await write_buffer.discard()
+            self._astra_reset_cache()  # Cache contains unsaved values
+            raise
+        finally:
+            self._astra_buffer = None
+        await self._astra_execute(write_buffer)
+
+    async def _astra_send_with_ttl(self, command_name, *args, **kwargs):
+        """ See astra.model.Model._astra_send_with_ttl """
+        write_buffer = self._astra_make_buffer()
+        write_buffer.send(command_name, *args, **kwargs)
+        if self.ttl_write_through:
+            self._astra_queue_for_keys(write_buffer, 'expire',
+                                       self.default_ttl)
+        return (await write_buffer.execute())[0]
+
+    async def expire(self, seconds=None):
+        """ See astra.model.Model.expire """
+        if seconds is None:
+            seconds = self.default_ttl
+        if seconds is None:
+            raise ValueError('Seconds are not passed and default_ttl is not '
+                             'set')
+        return await self._astra_send_for_keys('expire', seconds)
+
+    async def persist(self):
+        """ See astra.model.Model.persist """
+        return await self._astra_send_for_keys('persist')
+
+    async def _astra_send_for_keys(self, command_name, *args):
+        if self._astra_buffer is not None:
+            self._astra_queue_for_keys(self._astra_buffer, command_name,
+                                       *args)
+            return None
+        write_buffer = WriteBuffer(self._astra_get_db())
+        self._astra_queue_for_keys(write_buffer, command_name, *args)
+        return sum(1 for answer in await write_buffer.execute() if answer)
+
+    async def _astra_execute(self, write_buffer):
+        """ See astra.model.Model._astra_execute """
+        if self.ttl_write_through and not write_buffer.is_empty():
+            self._astra_queue_for_keys(write_buffer, 'expire',
+                                       self.default_ttl)
+        self._astra_refresh_version_check(write_buffer)
+        try:
+            await write_buffer.execute()
+        except BaseException as exc:
+            if isinstance(exc, model.VersionConflict):
+                self._astra_count_version_write(conflict=True)
+            self._astra_reset_cache()
+            raise
+        if write_buffer.hash_reset:
+            self._astra_reset_hash_cache()
+        if write_buffer.version is not None:
+            self._astra_count_version_write(conflict=False)
+            self._astra_fill_version(write_buffer)
+
+    @classmethod
+    async def get_many(cls, pks, fields=None):
+        """ See astra.model.Model.get_many """
+        objects = [cls.from_pk(pk) for pk in pks]
+        await cls.prefetch(objects, fields)
+        return objects
+
+    @classmethod
+    async def filter(cls, prefetch=None, **conditions):
+        """ See astra.model.Model.filter """
+        probe = cls._astra_probe()
+        index_key_names = cls._astra_index_key_names(probe, conditions)
+        pks = sorted(await probe._astra_get_db().sinter(index_key_names))
+        if not prefetch:
+            return pks
+        return await cls.get_many(pks, None if prefetch is True else prefetch)
+
+    @classmethod
+    async def range(cls, field_name, min=None, max=None, limit=None,
+                    offset=0, reverse=False, prefetch=None):
+        """ See astra.model.Model.range """
+        probe = cls._astra_probe()
+        args = cls._astra_range_args(probe, field_name, min, max, limit,
+                                     offset, reverse)
+        db = probe._astra_get_db()
+        command = db.zrevrangebyscore if reverse else db.zrangebyscore
+        pks = await command(*args)
+        if not prefetch:
+            return pks
+        return await cls.get_many(pks, None if prefetch is True else prefetch)
+
+    @classmethod
+    async def iter_all(cls, batch_size=500, fields=None):
+        """ See astra.model.Model.iter_all, use it by "async for" """
+        probe = cls._astra_probe()
+        db = probe._astra_get_db()
+        match, key_parts = cls._astra_scan_pattern()
+        pks = []
+        cursor = 0
+        while True:
+            cursor, keys = await db.scan(cursor, match=match, count=batch_size)
+            found = cls._astra_scan_found(keys, key_parts)
+            pipe = db.pipeline(transaction=False)
+            cls._astra_queue_earlier_keys(pipe, found, key_parts)
+            pks.extend(cls._astra_first_key_pks(found, await pipe.execute()))
+            while len(pks) >= batch_size or (pks and not cursor):
+                batch, pks = pks[:batch_size], pks[batch_size:]
+                for obj in await cls.get_many(batch, fields):
+                    yield obj
+            if not cursor:
+                break
+
+    @classmethod
+    async def prefetch(cls, objects, fields=None):
+        prefetch_plan = cls._astra_prefetch_plan(fields)
+        objects = cls._astra_not_loaded(objects, prefetch_plan)
+        if not objects:
+            return
+
+        pipe = objects[0]._astra_get_db().pipeline(transaction=False)
+        cls._astra_queue_prefetch(pipe, objects, prefetch_plan)
+        cls._astra_fill_prefetch(objects, prefetch_plan, await pipe.execute())
+
+    async def remove(self):
+        """ See astra.model.Model.remove """
+        db = self._astra_get_db()
+        key_groups = self._astra_get_remove_key_groups(db)
+        if self._astra_buffer is not None:
+            self._astra_queue_remove(self._astra_buffer, [self], key_groups)
+        elif self._astra_indexed_field_names or self.hash_bucket_size or \
+                len(key_groups) > 1:
+            write_buffer = WriteBuffer(db, transaction=True)
+            self._astra_queue_remove(write_buffer, [self], key_groups)
+            await write_buffer.execute()
+        elif key_groups:
+            await db.unlink(*key_groups[0])
+        self._astra_mark_removed()
+
+    @classmethod
+    async def remove_many(cls, pks, chunk_size=500):
+        removed_count = 0
+        for chunk in cls._astra_chunks(pks, chunk_size):
+            db = chunk[0]._astra_get_db()
+            key_groups = cls._astra_chunk_key_groups(chunk, db)
+            if cls._astra_indexed_field_names or cls.hash_bucket_size or \
+                    len(key_groups) > 1:
+                write_buffer = WriteBuffer(db)
+                cls._astra_queue_remove(write_buffer, chunk, key_groups)
+                removed_count += cls._astra_count_removed(
+                    chunk, key_groups, await write_buffer.execute())
+            elif key_groups:
+                removed_count += await db.unlink(*key_groups[0])
+        return removed_count
+
+    async def hash_exist(self):
+        if self._astra_hash_exist is None:
+            await self._astra_get_hash_field().force_check_hash_exists(self)
+        return self._astra_hash_exist
+
+
+class ReadOnlyFieldMixin(object):
+    # Assignment could not be awaited, so attributes are read-only
+    def __set__(self, model, value):
+        raise AttributeError('Use "await obj.set_%s(value)" for assign '
+                             'asyncio field' % self.name)
+
+    def __delete__(self, model):
+        raise AttributeError('Use "await obj.del_%s()" for remove '
+                             'asyncio field' % self.name)
+
+
+class ForeignObjectMixin(object):
+    async def _prefetch_related(self, objects, prefetch=None):
+        prefetch_plan = self._get_prefetch_plan(objects, prefetch)
+        if prefetch_plan:
+            model_cls, objects, fields = prefetch_plan
+            await model_cls.prefetch(objects, fields)
+
+
+# Fields:
+class BaseField(ReadOnlyFieldMixin, base_fields.BaseField):
+    async def assign(self, model, value):
+        saved_value = self._convert_set(value)
+        command_name, args = self._get_assign_command(model, saved_value)
+        await self.send(model, command_name, *args)
+        self._cache_assigned(model, saved_value)
+
+    async def obtain(self, model):
+        fld_cache = model._astra_fld_cache
+        if self.name in fld_cache:  # Value was prefetched, e.g. get_many
+            value = fld_cache[self.name]
+        else:
+            value = await model._astra_get_db().get(self.get_key_name(model))
+            if model.document_storage:
+                value = self.fill_document(model, value)
+            else:
+                self._cache_loaded(model, value)
+        return self._convert_get(value)
+
+    async def remove(self, model):
+        model._astra_fld_cache.pop(self.name, None)
+        if model.document_storage:
+            self.reset_document_cache(model)
+        command_name, args = self._get_remove_command(model)
+        await self.send(model, command_name, *args)
+
+
+class CharField(BaseField, fields.CharField):
+    pass
+
+
+class BooleanField(BaseField, fields.BooleanField):
+    pass
+
+
+class IntegerField(BaseField, fields.IntegerField):
+    pass
+
+
+class ForeignField(ForeignObjectMixin, BaseField, fields.ForeignField):
+    async def assign(self, model, value):
+        if value is None:  # Remove field when None was passed
+            await self.remove(model)
+        else:
+            await super(ForeignField, self).assign(model, value)
+
+    async def obtain(self, model, prefetch=None):
+        value = await super(ForeignField, self).obtain(model)
+        related_object = self._to_wrapper(value)
+        await self._prefetch_related([related_object], prefetch)
+        return related_object
+
+
+class DateField(BaseField, fields.DateField):
+    pass
+
+
+class DateTimeField(BaseField, fields.DateTimeField):
+    pass
+
+
+class EnumField(BaseField, fields.EnumField):
+    pass
+
+
+# Hashes
+class BaseHash(ReadOnlyFieldMixin, base_fields.BaseHash):
+    async def assign(self, model, value):
+        saved_value = self._convert_set(value)
+        command_name, args = self._get_assign_command(model, saved_value)
+        await self.send(model, command_name, *args)
+        self._cache_assigned(model, saved_value)
+
+    async def obtain(self, model):
+        await self._load_hash(model)
+        return self._convert_get(model._astra_hash.get(self.name, None))
+
+    async def _load_hash(self, model):
+        load_command = self._get_load_command(model)
+        if load_command is not None:
+            command_name, args = load_command
+            answer = await getattr(model._astra_get_db(), command_name)(*args)
+            self.fill_loaded(model, command_name, args, answer)
+
+    async def remove(self, model):
+        command_name, args = self._get_remove_command(model)
+        await self.send(model, command_name, *args)
+        self._cache_removed(model)
+
+    async def force_check_hash_exists(self, model):
+        command_name, args = self._get_exists_command(model)
+        command = getattr(model._astra_get_db(), command_name)
+        self.fill_exists(model, await command(*args))
+
+
+class CharHash(BaseHash, fields.CharHash):
+    pass
+
+
+class BooleanHash(BaseHash, fields.BooleanHash):
+    pass
+
+
+class IntegerHash(BaseHash, fields.IntegerHash):
+    pass
+
+
+class DateHash(BaseHash, fields.DateHash):
+    pass
+
+
+class DateTimeHash(BaseHash, fields.DateTimeHash):
+    pass
+
+
+class EnumHash(BaseHash, fields.EnumHash):
+    pass
+
+
+class ForeignHash(ForeignObjectMixin, BaseHash, fields.ForeignHash):
+    async def assign(self, model, value):
+        if value is None:  # Remove hash key when None was passed
+            await self.remove(model)
+        else:
+            await super(ForeignHash, self).assign(model, value)
+
+    async def obtain(self, model, prefetch=None):
+        value = await super(ForeignHash, self).obtain(model)
+        related_object = self._to_wrapper(value)
+        await self._prefetch_related([related_object], prefetch)
+        return related_object
+
+
+# Collections
+class BaseCollection(ReadOnlyFieldMixin, ForeignObjectMixin,
+                     base_fields.BaseCollection):
+    async def assign(self, model, value):
+        if value is None:
+            await self.remove(model)
+        else:
+            raise ValueError('Collections fields is not possible '
+                             'assign directly')
+
+    async def remove(self, model):
+        await self.send(model, 'delete', self.get_key_name(model))
+
+    @classmethod
+    def _compile_method(cls, item):
+        """ See astra.base_fields.BaseCollection._compile_method """
+        is_modify = item in cls._modify_redis_methods
+        is_blocking = item in cls._blocking_redis_methods
+        wrap_answer = cls._get_answer_wrapper(item)
+
+        async def _method_wrapper(field, model, *args, **kwargs):
+            prefetch = kwargs.pop('prefetch', None) if kwargs else None
+            if is_blocking:
+                field._check_not_buffered(model, item)
+            new_args, new_kwargs = field._prepare_arguments(model, args,
+                                                            kwargs)
+            if is_modify:
+                answer = await field.send(model, item, *new_args,
+                                          **new_kwargs)
+            else:
+                answer = await getattr(model._astra_get_db(), item)(
+                    *new_args, **new_kwargs)
+            if wrap_answer is None or answer is None:
+                return answer
+            answer, related_objects = wrap_answer(field, answer)
+            await field._prefetch_related(related_objects, prefetch)
+            return answer
+
+        _method_wrapper.__name__ = item
+        return _method_wrapper
+
+    def length(self, model):
+        raise TypeError('Use awaitable length method of collection')
+
+    async def iterate(self, model, size=500):
+        async for chunk in self.iter_chunks(model, size):
+            for item in chunk:
+                yield item
+
+    async def iter_chunks(self, model, size=500, prefetch=None):
+        """ See astra.base_fields.BaseCollection.iter_chunks """
+        async for chunk in self._read_chunks(model, size):
+            related_objects = self._make_related_chunk(chunk)
+            await self._prefetch_related(related_objects, prefetch)
+            yield related_objects
+
+
+class List(BaseCollection, fields.List):
+    async def _read_chunks(self, model, size):
+        lrange = model._astra_get_db().lrange
+        key_name = self.get_key_name(model)
+        start = 0
+        while True:
+            chunk = await lrange(key_name, start, start + size - 1)
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+            start += size
+
+    async def _get_item(self, model, item):
+        ret = await self.get_method(model, 'lrange')(item, item)
+        return ret[0] if len(ret) == 1 else None
+
+    def get_item(self, model, item):
+        if isinstance(item, slice):
+            return self.get_method(model, 'lrange')(item.start, item.stop)
+        return self._get_item(model, item)
+
+
+class Set(BaseCollection, fields.Set):
+    async def _read_chunks(self, model, size):
+        sscan = model._astra_get_db().sscan
+        key_name = self.get_key_name(model)
+        cursor = 0
+        while True:
+            cursor, chunk = await sscan(key_name, cursor, count=size)
+            if chunk:
+                yield chunk
+            if not cursor:
+                return
+
+
+class SortedSet(BaseCollection, fields.SortedSet):
+    async def _read_chunks(self, model, size):
+        zscan = model._astra_get_db().zscan
+        key_name = self.get_key_name(model)
+        cursor = 0
+        while True:
+            cursor, chunk = await zscan(key_name, cursor, count=size)
+            if chunk:
+                yield [member for member, score in chunk]
+            if not cursor:
+                return
+
+    async def _get_item(self, model, item):
+        ret = await self.get_method(model, 'zrangebyscore')(item, item)
+        return ret[0] if len(ret) == 1 else None
+
+    def get_item(self, model, item):
+        zrangebyscore = self.get_method(model, 'zrangebyscore')
+        if isinstance(item, slice):
+            return zrangebyscore(item.start or '-inf', item.stop or '+inf')
+        return self._get_item(model, item)
@@ -1,19 +1,46 @@
 import datetime as dt
+import functools
+import json
+
+from astra import scripts
 from astra.validators import ForeignObjectValidatorMixin
 
 
 class ModelField(object):
+    """
+    Field is shared by all objects of the model class: it keeps only options
+    and name of the attribute, values and caches are kept by model object
+    which is passed to every method. Field works as descriptor, access to
+    the attribute calls get_<name>, set_<name> or del_<name> of the model
+    """
     directly_redis_helpers = ()  # Direct method helpers
+    modify_redis_helpers = ()  # Helpers sent by Model._astra_send
     field_type_name = '--'
 
     def __init__(self, **kwargs):
-        if 'instance' in kwargs:
-            self.name = kwargs['name']
-            self.model = kwargs['model']
-            self.db = kwargs['db']
+        self.name = None  # Attribute name, set on model class compilation
         self.options = kwargs
 
-    def get_key_name(self, is_hash=False):
+    def set_name(self, name):
+        self.name = name
+        self._getter_name = 'get_%s' % name
+        self._setter_name = 'set_%s' % name
+        self._deleter_name = 'del_%s' % name
+
+    def __get__(self, model, model_cls=None):
+        if model is None:
+            return self
+        # Accessors are looked up on every call, so they could be
+        # overridden by subclasses or patched
+        return getattr(type(model), self._getter_name)(model)
+
+    def __set__(self, model, value):
+        getattr(type(model), self._setter_name)(model, value)
+
+    def __delete__(self, model):
+        getattr(type(model), self._deleter_name)(model)
+
+    def get_key_name(self, model, is_hash=False):
         """
         Create redis key. Schema:
         prefix::object_name::field_type::id::field_name, e.g.
@@ -21,25 +48,71 @@ class ModelField(object):
             prefix::user::list::12::sites
             prefix::user::zset::12::winners
             prefix::user::hash::54
+        Separator, type tags and field names could be changed by key schema
+        of the model (see astra.key_schema). Hashes of models with
+        hash_bucket_size are shared by range of pks:
+            prefix::user::bucket::0
+        Key is built once for the object and field
+        """
+        key_names = model._astra_key_names
+        if key_names is None:
+            key_names = model._astra_key_names = {}
+        cache_key = None if is_hash else self.name  # Hash key is shared
+        key_name = key_names.get(cache_key)
+        if key_name is None:
+            key_schema = model.key_schema
+            if is_hash and model.hash_bucket_size:
+                bucket = str(int(model.pk) // model.hash_bucket_size)
+                items = [model.get_key_prefix(),
+                         key_schema.get_type_tag('bucket'),
+                         key_schema.tag_pk(bucket)]
+            else:
+                items = [model.get_key_prefix(),
+                         key_schema.get_type_tag(self.field_type_name),
+                         key_schema.tag_pk(str(model.pk))]
+            if not is_hash:
+                items.append(key_schema.get_field_alias(self.name))
+            key_name = key_names[cache_key] = key_schema.join(*items)
+        return key_name
+
+    def send(self, model, command_name, *args, **kwargs):
+        """
+        Send write command to the database. When model buffers changes
+        (see Model.update) command will be sent later with others
+        """
+        return model._astra_send(command_name, *args, **kwargs)
+
+    def read(self, model, command_name, *args):
+        """
+        Send read command to the database or to the client cache if model
+        has it (see Model.get_client_cache)
         """
-        items = [self.model.get_key_prefix(),
-                 self.field_type_name, str(self.model.pk)]
-        if not is_hash:
-            items.append(self.name)
-        return '::'.join(items)
+        client_cache = model.get_client_cache()
+        if client_cache is not None:
+            return client_cache.read(command_name, *args)
+        return getattr(model._astra_get_db(), command_name)(*args)
 
-    def assign(self, value):
+    def assign(self, model, value):
         raise NotImplementedError('Subclasses must implement assign')
 
-    def obtain(self):
+    def obtain(self, model):
         raise NotImplementedError('Subclasses must implement obtain')
 
-    def get_helper_func(self, method_name):
+    def get_helper_func(self, model, method_name):
         if method_name not in self.directly_redis_helpers:
             raise AttributeError('Invalid attribute with name "%s"'
                                  % (method_name,))
-        original_command = getattr(self.db, method_name)
-        current_key = self.get_key_name()
+        current_key = self.get_key_name(model)
+        if method_name in self.modify_redis_helpers:
+            # Buffered by batch, keys of models with default_ttl keep
+            # (or get) expiry
+            def _method_wrapper(*args, **kwargs):
+                return self.send(model, method_name, current_key, *args,
+                                 **kwargs)
+
+            return _method_wrapper
+
+        original_command = getattr(model._astra_get_db(), method_name)
 
         def _method_wrapper(*args, **kwargs):
             new_args = [current_key]
@@ -49,22 +122,124 @@ class ModelField(object):
 
         return _method_wrapper
 
-    def remove(self):
-        self.db.delete(self.get_key_name())
+    def remove(self, model):
+        self.send(model, 'delete', self.get_key_name(model))
 
 
 # Fields:
 class BaseField(ModelField):
+    """
+    Value stored in own key. Pass cache=True for keep read value on the
+    object until it is changed by this object or refreshed (Model.refresh).
+    Values of models with document_storage = True are kept together in one
+    JSON document key, first read caches values of all fields of the object
+    until it writes them or is refreshed
+    """
     field_type_name = 'fld'
+    modify_redis_helpers = ('setex', 'setnx', 'append', 'setbit', 'setrange',
+                            'incr', 'incrby', 'decr', 'decrby', 'getset',
+                            'expire')
 
-    def assign(self, value):
+    def get_key_name(self, model, is_hash=False):
+        """
+        Document key is shared by all scalar fields of the object:
+            prefix::user::doc::12
+        """
+        if not model.document_storage:
+            return super(BaseField, self).get_key_name(model, is_hash)
+        key_names = model._astra_key_names
+        if key_names is None:
+            key_names = model._astra_key_names = {}
+        key_name = key_names.get('::doc')
+        if key_name is None:
+            key_schema = model.key_schema
+            key_name = key_names['::doc'] = key_schema.join(
+                model.get_key_prefix(), key_schema.get_type_tag('doc'),
+                key_schema.tag_pk(str(model.pk)))
+        return key_name
+
+    def assign(self, model, value):
         saved_value = self._convert_set(value)
-        self.db.set(self.get_key_name(), saved_value)
-
-    def obtain(self):
-        value = self.db.get(self.get_key_name())
+        command_name, args = self._get_assign_command(model, saved_value)
+        self.send(model, command_name, *args)
+        self._cache_assigned(model, saved_value)
+
+    def _get_assign_command(self, model, saved_value):
+        if model.document_storage:
+            return 'evalsha', (scripts.DOCUMENT_SET, 1,
+                               self.get_key_name(model), self.name,
+                               saved_value)
+        return 'set', (self.get_key_name(model), saved_value)
+
+    def _get_remove_command(self, model):
+        if model.document_storage:
+            return 'evalsha', (scripts.DOCUMENT_DEL, 1,
+                               self.get_key_name(model), self.name)
+        return 'delete', (self.get_key_name(model),)
+
+    def fill_document(self, model, answer):
+        """
+        Decode answer of GET of the document once and cache values of all
+        scalar fields of the object, return value of this field. Documents
+        read inside batch are not cached, they miss buffered writes
+        """
+        document = json.loads(answer) if answer is not None else {}
+        if model._astra_buffer is not None:
+            self._cache_loaded(model, document.get(self.name))
+        else:
+            for field_name in model._astra_scalar_field_names:
+                model._astra_fld_cache[field_name] = document.get(field_name)
+        return document.get(self.name)
+
+    def reset_document_cache(self, model):
+        """ Drop values filled by GET of the document, see fill_document """
+        fld_cache = model._astra_fld_cache
+        for field_name in model._astra_scalar_field_names:
+            if not model._astra_fields[field_name].options.get('cache'):
+                fld_cache.pop(field_name, None)
+
+    def _cache_assigned(self, model, saved_value):
+        is_cached = self.options.get('cache') or \
+            self.name in model._astra_fld_cache
+        if model.document_storage:
+            self.reset_document_cache(model)
+        if is_cached:
+            model._astra_fld_cache[self.name] = saved_value
+
+    def _cache_loaded(self, model, value):
+        if self.options.get('cache'):
+            model._astra_fld_cache[self.name] = value
+
+    def get_helper_func(self, model, method_name):
+        if model.document_storage:
+            raise AttributeError('Helpers are not available for document '
+                                 'field "%s"' % (self.name,))
+        # Helpers could change value on the server side (incr, setex, ...)
+        model._astra_fld_cache.pop(self.name, None)
+        client_cache = model.get_client_cache()
+        if client_cache is not None:
+            client_cache.invalidate(self.get_key_name(model))
+        return super(BaseField, self).get_helper_func(model, method_name)
+
+    def obtain(self, model):
+        fld_cache = model._astra_fld_cache
+        if self.name in fld_cache:  # Value was prefetched, e.g. get_many
+            value = fld_cache[self.name]
+        else:
+            value = self.read(model, 'get', self.get_key_name(model))
+            if model.document_storage:
+                value = self.fill_document(model, value)
+            else:
+                self._cache_loaded(model, value)
         return self._convert_get(value)
 
+    def remove(self, model):
+        model._astra_fld_cache.pop(self.name, None)
+        if model.document_storage:
+            self.reset_document_cache(model)
+        command_name, args = self._get_remove_command(model)
+        self.send(model, command_name, *args)
+
     def _convert_set(self, value):
         """ Check saved value before send to server """
         raise NotImplementedError('Subclasses must implement _convert_set')
@@ -76,31 +251,171 @@ class BaseField(ModelField):
 
 # Hashes
 class BaseHash(ModelField):
+    """
+    Value stored in the hash of the object. Pass index=True for find
+    objects by the value (see Model.filter) or range_index=True for find
+    them by range of values (see Model.range)
+    """
     field_type_name = 'hash'
+    indexable = False  # Could be used with index=True
+    range_indexable = False  # Could be used with range_index=True
 
-    def assign(self, value):
+    def __init__(self, **kwargs):
+        super(BaseHash, self).__init__(**kwargs)
+        if kwargs.get('index') and not self.indexable:
+            raise AttributeError('%s could not be indexed'
+                                 % type(self).__name__)
+        if kwargs.get('range_index') and not self.range_indexable:
+            raise AttributeError('%s could not be range indexed'
+                                 % type(self).__name__)
+
+    def assign(self, model, value):
         saved_value = self._convert_set(value)
-        self.db.hset(self.get_key_name(True), self.name, saved_value)
-        if self.model._astra_hash_loaded:
-            self.model._astra_hash[self.name] = saved_value
-        self.model._astra_hash_exist = True
+        command_name, args = self._get_assign_command(model, saved_value)
+        self.send(model, command_name, *args)
+        self._cache_assigned(model, saved_value)
+
+    def _get_assign_command(self, model, saved_value):
+        key_name = self.get_key_name(model, True)
+        hash_field_name = model._astra_pack_field_name(self.name)
+        if self.options.get('index'):
+            # Move pk from index set of the old value to the new one
+            return 'evalsha', (scripts.ASSIGN_INDEXED, 2, key_name,
+                               self.get_index_key_name(model, saved_value),
+                               hash_field_name, saved_value,
+                               self._get_index_key_prefix(model), model.pk)
+        if self.options.get('range_index'):
+            return 'evalsha', (scripts.ASSIGN_RANGE_INDEXED, 2, key_name,
+                               self.get_range_index_key_name(model),
+                               hash_field_name, saved_value, model.pk)
+        return 'hset', (key_name, hash_field_name, saved_value)
+
+    def _get_remove_command(self, model):
+        key_name = self.get_key_name(model, True)
+        hash_field_name = model._astra_pack_field_name(self.name)
+        if self.options.get('index'):
+            return 'evalsha', (scripts.REMOVE_INDEXED, 1, key_name,
+                               hash_field_name,
+                               self._get_index_key_prefix(model), model.pk)
+        if self.options.get('range_index'):
+            return 'evalsha', (scripts.REMOVE_RANGE_INDEXED, 2, key_name,
+                               self.get_range_index_key_name(model),
+                               hash_field_name, model.pk)
+        return 'hdel', (key_name, hash_field_name)
+
+    def get_index_key_name(self, model, saved_value):
+        """
+        Set of pks of objects with the value, e.g.
+            prefix::user::idx::status::ACTIVATED
+        """
+        return self._get_index_key_prefix(model) + str(saved_value)
 
-    def obtain(self):
-        self._load_hash()
-        return self._convert_get(self.model._astra_hash.get(self.name, None))
+    def _get_index_key_prefix(self, model):
+        key_schema = model.key_schema
+        return key_schema.join(model.get_key_prefix(),
+                               key_schema.get_type_tag('idx'),
+                               key_schema.get_field_alias(self.name), '')
 
-    def _load_hash(self):
-        if self.model._astra_hash_loaded:
-            return
-        self.model._astra_hash_loaded = True
-        self.model._astra_hash = \
-            self.db.hgetall(
-                self.get_key_name(True))
-        if not self.model._astra_hash:  # None if hash field is not exist
-            self.model._astra_hash = {}
-            self.model._astra_hash_exist = False
+    def get_range_index_key_name(self, model):
+        """
+        Sorted set of pks scored by the value, e.g.
+            prefix::user::ridx::rating
+        """
+        key_schema = model.key_schema
+        return key_schema.join(model.get_key_prefix(),
+                               key_schema.get_type_tag('ridx'),
+                               key_schema.get_field_alias(self.name))
+
+    def _cache_assigned(self, model, saved_value):
+        if model._astra_buffer is not None:  # Kept over loads in the batch
+            model._astra_buffer.hash_values[self.name] = saved_value
+        if model._astra_hash_loaded or self.name in model._astra_hash_fields:
+            model._astra_hash[self.name] = saved_value
+        model._astra_hash_exist = True
+
+    def obtain(self, model):
+        self._load_hash(model)
+        return self._convert_get(model._astra_hash.get(self.name, None))
+
+    def _load_hash(self, model):
+        load_command = self._get_load_command(model)
+        if load_command is not None:
+            command_name, args = load_command
+            self.fill_loaded(model, command_name, args,
+                             self.read(model, command_name, *args))
+
+    def _get_load_command(self, model):
+        """
+        Command for load hash values which are needed for this field: whole
+        hash by HGETALL or only some fields by HMGET in partial mode (see
+        Model.partial_hash_loading and Model.only) and in bucketed hash (see
+        Model.hash_bucket_size). None if already loaded
+        """
+        if model._astra_hash_loaded or self.name in model._astra_hash_fields:
+            return None
+
+        key_name = self.get_key_name(model, True)
+        if model._astra_hash_only:
+            field_names = [n for n in model._astra_hash_only
+                           if n not in model._astra_hash_fields]
+        elif model.partial_hash_loading:
+            field_names = []
+        elif model.hash_bucket_size:  # All fields of the object
+            field_names = [n for n in model._astra_hash_field_names
+                           if n not in model._astra_hash_fields]
+        else:
+            return 'hgetall', (key_name,)
+        if self.name not in field_names:
+            field_names.append(self.name)
+        # Version is read together with values for checked writes
+        version_field = model.version_field
+        if version_field is not None and version_field not in field_names \
+                and version_field not in model._astra_hash_fields:
+            field_names.append(version_field)
+        return 'hmget', (key_name, model._astra_pack_field_names(field_names))
+
+    def fill_loaded(self, model, command_name, args, answer):
+        """ Save answer of the command from _get_load_command """
+        if command_name == 'hmget':
+            self.fill_hash_fields(
+                model, model._astra_unpack_field_names(args[1]), answer)
+        else:
+            self.fill_hash(model, answer)
+
+    def fill_hash(self, model, value):
+        """ Save HGETALL answer to the model's hash cache """
+        model._astra_hash_loaded = True
+        model._astra_hash = value
+        if not model._astra_hash:  # None if hash field is not exist
+            model._astra_hash = {}
+            model._astra_hash_exist = False
         else:
-            self.model._astra_hash_exist = True
+            model._astra_hash_exist = True
+        self._fill_buffered(model)
+
+    def fill_hash_fields(self, model, field_names, values):
+        """ Save HMGET answer to the model's hash cache """
+        for field_name, value in zip(field_names, values):
+            model._astra_hash_fields.add(field_name)
+            if value is None:
+                model._astra_hash.pop(field_name, None)
+            else:
+                model._astra_hash[field_name] = value
+                model._astra_hash_exist = True
+        self._fill_buffered(model)
+
+    @staticmethod
+    def _fill_buffered(model):
+        # Values written by the open batch are newer than loaded ones
+        if model._astra_buffer is None:
+            return
+        for field_name, saved_value in \
+                model._astra_buffer.hash_values.items():
+            if saved_value is None:
+                model._astra_hash.pop(field_name, None)
+            else:
+                model._astra_hash[field_name] = saved_value
+                model._astra_hash_exist = True
 
     def _convert_set(self, value):
         """ Check saved value before send to server """
@@ -110,84 +425,250 @@ class BaseHash(ModelField):
         """ Convert server answer to user type """
         raise NotImplementedError('Subclasses must implement _convert_get')
 
-    def remove(self):
-        self.db.hdel(self.get_key_name(True), self.name)
-        self.model._astra_hash_exist = None  # Need to verify again
+    def remove(self, model):
+        command_name, args = self._get_remove_command(model)
+        self.send(model, command_name, *args)
+        self._cache_removed(model)
+
+    def _cache_removed(self, model):
+        if model._astra_buffer is not None:
+            model._astra_buffer.hash_values[self.name] = None
+        model._astra_hash.pop(self.name, None)
+        model._astra_hash_fields.add(self.name)  # Known as empty
+        model._astra_hash_exist = None  # Need to verify again
+
+    def force_check_hash_exists(self, model):
+        command_name, args = self._get_exists_command(model)
+        self.fill_exists(model, getattr(model._astra_get_db(),
+                                        command_name)(*args))
+
+    def _get_exists_command(self, model):
+        key_name = self.get_key_name(model, True)
+        if model.hash_bucket_size:  # Any field of the object in the bucket
+            return 'hmget', (key_name, model._astra_pack_field_names(
+                model._astra_hash_field_names))
+        return 'exists', (key_name,)
+
+    def fill_exists(self, model, answer):
+        """ Save answer of the command from _get_exists_command """
+        if isinstance(answer, list):
+            answer = any(value is not None for value in answer)
+        model._astra_hash_exist = bool(answer)
+
+
+class BoundCollection(object):
+    """
+    Collection of the model object, e.g. user.sites_list. Redis methods of
+    the collection field are called with the object
+    """
+    __slots__ = ('field', 'model')
+
+    def __init__(self, field, model):
+        self.field = field
+        self.model = model
+
+    def __getattr__(self, item):
+        return self.field.get_method(self.model, item)
+
+    def __len__(self):
+        return self.field.length(self.model)
+
+    def __getitem__(self, item):
+        return self.field.get_item(self.model, item)
+
+    def __iter__(self):
+        return self.field.iterate(self.model)
+
+    def __aiter__(self):
+        return self.field.iterate(self.model)
 
-    def force_check_hash_exists(self):
-        self.model._astra_hash_exist = bool(self.db.exists(
-            self.get_key_name(True)))
+    def iter_chunks(self, size=500, prefetch=None):
+        return self.field.iter_chunks(self.model, size, prefetch)
+
+    def __repr__(self):
+        return '<%s %s of %r>' % (type(self.field).__name__, self.field.name,
+                                  self.model)
 
 
 # Implements for three types of lists
 class BaseCollection(ForeignObjectValidatorMixin, ModelField):
     field_type_name = ''
     _allowed_redis_methods = ()
+    _modify_redis_methods = ()  # Could be buffered, see Model.batch
+    _blocking_redis_methods = ()  # Modify, but could not be buffered
     _single_object_answered_redis_methods = ()
     _list_answered_redis_methods = ()
     # Other methods will be answered directly
 
-    def obtain(self):
-        return self  # for delegate to __getattr__ on this class
+    def obtain(self, model):
+        return BoundCollection(self, model)
 
-    def assign(self, value):
+    def assign(self, model, value):
         if value is None:
-            self.remove()
+            self.remove(model)
         else:
             raise ValueError('Collections fields is not possible '
                              'assign directly')
 
-    def __getattr__(self, item):
-        if item not in self._allowed_redis_methods:
-            return super(BaseCollection, self).__getattr__(item)
-
-        original_command = getattr(self.db, item)
-        current_key = self.get_key_name()
-
-        from astra import model
-        def modify_arg(value):
-            # Helper could modify your args
-            if isinstance(value, model.Model):
-                return value.pk
-            elif isinstance(value, (dt.datetime, dt.date,)):
-                return int(value.strftime('%s'))
-            elif isinstance(value, dict):
-                # Scan dict and replace datetime values to timestamp. See .zadd
-                new_dict = {}
-                for k, v in value.items():
-                    new_key = modify_arg(k)
-                    new_dict[new_key] = modify_arg(v)
-                return new_dict
+    def get_method(self, model, item):
+        method_key = (type(self), item)
+        method = _compiled_methods.get(method_key)
+        if method is None:
+            if item not in self._allowed_redis_methods:
+                raise AttributeError('Invalid attribute with name "%s"'
+                                     % item)
+            method = _compiled_methods[method_key] = \
+                type(self)._compile_method(item)
+        return functools.partial(method, self, model)
+
+    @classmethod
+    def _compile_method(cls, item):
+        """
+        Build wrapper of the redis method once for the collection class,
+        the way of sending and of wrapping answer is chosen here
+        """
+        is_modify = item in cls._modify_redis_methods
+        is_blocking = item in cls._blocking_redis_methods
+        wrap_answer = cls._get_answer_wrapper(item)
+
+        def _method_wrapper(field, model, *args, **kwargs):
+            # Related objects could be loaded at once, e.g. prefetch=['name']
+            prefetch = kwargs.pop('prefetch', None) if kwargs else None
+            if is_blocking:
+                field._check_not_buffered(model, item)
+            new_args, new_kwargs = field._prepare_arguments(model, args,
+                                                            kwargs)
+            if is_modify:
+                answer = field.send(model, item, *new_args, **new_kwargs)
             else:
-                return value
+                answer = getattr(model._astra_get_db(), item)(*new_args,
+                                                              **new_kwargs)
+            if wrap_answer is None or answer is None:  # Direct or buffered
+                return answer
+            answer, related_objects = wrap_answer(field, answer)
+            field._prefetch_related(related_objects, prefetch)
+            return answer
+
+        _method_wrapper.__name__ = item
+        return _method_wrapper
 
-        def _method_wrapper(*args, **kwargs):
-            # Scan passed args and convert to pk if passed models
-            new_args = [current_key]
-            new_kwargs = dict()
-            for v in args:
-                new_args.append(modify_arg(v))
-            new_kwargs = modify_arg(kwargs)
-
-            # Call original method on the database
-            answer = original_command(*new_args, **new_kwargs)
-
-            # Wrap to model
-            if item in self._single_object_answered_redis_methods:
-                return None if not answer else self._to(answer)
-
-            if item in self._list_answered_redis_methods:
-                wrapper_answer = []
-                for pk in answer:
-                    if not pk:
-                        wrapper_answer.append(None)
-                    else:
-                        if isinstance(pk, tuple) and len(pk) > 0:
-                            wrapper_answer.append((self._to(pk[0]), pk[1]))
-                        else:
-                            wrapper_answer.append(self._to(pk))
-
-                return wrapper_answer
-            return answer  # Direct answer
+    @staticmethod
+    def _check_not_buffered(model, item):
+        if model._astra_buffer is not None:
+            raise TypeError('Blocking %s could not be sent inside batch'
+                            % item)
 
-        return _method_wrapper
+    def length(self, model):
+        raise TypeError('%s has no len()' % type(self).__name__)
+
+    def get_item(self, model, item):
+        raise TypeError('%s is not subscriptable' % type(self).__name__)
+
+    def iterate(self, model, size=500):
+        for chunk in self.iter_chunks(model, size):
+            for item in chunk:
+                yield item
+
+    def iter_chunks(self, model, size=500, prefetch=None):
+        """
+        Read collection by pages of size items (SSCAN and ZSCAN take it as
+        a hint), e.g. for iterate over big collection without loading all
+        of it at once. Related objects of every page could be loaded by
+        prefetch list (or True for all fields). Changes of the collection
+        during iteration could lead to missed or repeated items
+        """
+        for chunk in self._read_chunks(model, size):
+            related_objects = self._make_related_chunk(chunk)
+            self._prefetch_related(related_objects, prefetch)
+            yield related_objects
+
+    def _read_chunks(self, model, size):
+        raise NotImplementedError('Subclasses must implement _read_chunks')
+
+    def _make_related_chunk(self, chunk):
+        return [self._make_related(pk) if pk else None for pk in chunk]
+
+    def _prepare_arguments(self, model, args, kwargs):
+        # Scan passed args and convert to pk if passed models
+        new_args = [self.get_key_name(model)]
+        for v in args:
+            new_args.append(_modify_arg(v))
+        return new_args, _modify_arg(kwargs) if kwargs else kwargs
+
+    @classmethod
+    def _get_answer_wrapper(cls, item):
+        """
+        Function for wrap answer of the method to model(s), it returns
+        answer and list of wrapped objects. None for direct answer
+        """
+        if item in cls._single_object_answered_redis_methods:
+            return cls._wrap_single_answer
+        if item in cls._list_answered_redis_methods:
+            return cls._wrap_list_answer
+        return None
+
+    def _wrap_single_answer(self, answer):
+        if not answer:
+            return None, []
+        wrapper_answer = self._make_related(answer)
+        return wrapper_answer, [wrapper_answer]
+
+    def _wrap_list_answer(self, answer):
+        wrapper_answer = []
+        related_objects = []
+        for pk in answer:
+            if not pk:
+                wrapper_answer.append(None)
+            else:
+                if isinstance(pk, tuple) and len(pk) > 0:
+                    wrapper_answer.append((self._make_related(pk[0]), pk[1]))
+                    related_objects.append(wrapper_answer[-1][0])
+                else:
+                    wrapper_answer.append(self._make_related(pk))
+                    related_objects.append(wrapper_answer[-1])
+        return wrapper_answer, related_objects
+
+
+_compiled_methods = {}  # (collection class, method name) -> wrapper
+_arg_converters = {}  # type of argument -> converter, see _modify_arg
+
+
+def _modify_arg(value):
+    # Helper could modify your args. Converter is chosen once per type
+    try:
+        converter = _arg_converters[type(value)]
+    except KeyError:
+        converter = _arg_converters[type(value)] = \
+            _get_arg_converter(type(value))
+    return converter(value)
+
+
+def _get_arg_converter(value_type):
+    from astra import model
+    if issubclass(value_type, model.Model):
+        return _model_to_pk
+    elif issubclass(value_type, (dt.datetime, dt.date,)):
+        return _date_to_timestamp
+    elif issubclass(value_type, dict):
+        return _convert_dict
+    return _same_value
+
+
+def _model_to_pk(value):
+    return value.pk
+
+
+def _date_to_timestamp(value):
+    return int(value.strftime('%s'))
+
+
+def _convert_dict(value):
+    # Scan dict and replace datetime values to timestamp. See .zadd
+    new_dict = {}
+    for k, v in value.items():
+        new_dict[_modify_arg(k)] = _modify_arg(v)
+    return new_dict
+
+
+def _same_value(value):
+    return value
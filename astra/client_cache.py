@@ -0,0 +1,176 @@
+import threading
+from collections import OrderedDict
+
+import redis
+
+
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+
+class ClientCache(object):
+    """
+    Process-level cache for read-mostly models. Values are kept correct by
+    server-assisted client side caching (Redis >= 6.0): keys are read by
+    connection with CLIENT TRACKING and invalidation messages are received
+    by other connection. Memory is bounded by LRU eviction of keys.
+
+    cache = ClientCache(db, max_size=10000)
+
+    class SiteObject(models.Model):
+        name = models.CharHash()
+
+        def get_db(self):
+            return db
+
+        def get_client_cache(self):
+            return cache
+
+    Hash (HGETALL, HMGET) and scalar fields (GET) reads of synchronous
+    models are cached.
+    """
+
+    def __init__(self, db, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._db = db
+        self._entries = OrderedDict()  # key -> {command and args: answer}
+        self._lock = threading.RLock()
+        self._read_connection = None
+        self._invalidation_connection = None
+
+    def read(self, command_name, key, *args):
+        """ Call read command for the key or return cached answer """
+        command_args = [key]
+        for arg in args:  # Flat lists, e.g. HMGET fields
+            if isinstance(arg, (list, tuple)):
+                command_args.extend(arg)
+            else:
+                command_args.append(arg)
+        entry_key = (command_name,) + tuple(command_args[1:])
+
+        with self._lock:
+            self._process_invalidations()
+            entry = self._entries.get(key)
+            if entry is not None and entry_key in entry:
+                self.hits += 1
+                self._entries[key] = self._entries.pop(key)  # Recently used
+                return _copy_answer(entry[entry_key])
+
+            self.misses += 1
+            answer = self._execute(command_name, command_args)
+            if entry is None:
+                entry = {}
+                self._entries[key] = entry
+                self._evict()
+            entry[entry_key] = answer
+            return _copy_answer(answer)
+
+    def invalidate(self, *keys):
+        """ Drop keys which are being changed by this process """
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / requests if requests else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+            self._entries.clear()
+
+    def _execute(self, command_name, command_args):
+        if self._read_connection is None:
+            self._connect()
+        try:
+            self._read_connection.send_command(command_name.upper(),
+                                               *command_args)
+            return self._db.parse_response(self._read_connection,
+                                           command_name.upper())
+        except redis.ConnectionError:
+            # Invalidation messages could be lost, start from scratch
+            self._disconnect()
+            self._entries.clear()
+            raise
+
+    def _connect(self):
+        pool = self._db.connection_pool
+        invalidation_connection = pool.make_connection()
+        invalidation_connection.send_command('CLIENT', 'ID')
+        client_id = invalidation_connection.read_response()
+        invalidation_connection.send_command('SUBSCRIBE',
+                                             INVALIDATE_CHANNEL)
+        invalidation_connection.read_response()
+
+        read_connection = pool.make_connection()
+        read_connection.send_command('CLIENT', 'TRACKING', 'ON',
+                                     'REDIRECT', client_id)
+        read_connection.read_response()
+
+        self._invalidation_connection = invalidation_connection
+        self._read_connection = read_connection
+
+    def _disconnect(self):
+        for connection in (self._read_connection,
+                           self._invalidation_connection):
+            if connection is not None:
+                connection.disconnect()
+        self._read_connection = None
+        self._invalidation_connection = None
+
+    def _process_invalidations(self):
+        connection = self._invalidation_connection
+        if connection is None:
+            return
+        try:
+            while connection.can_read(timeout=0):
+                message = connection.read_response()
+                # ['message', '__redis__:invalidate', keys or None on flush]
+                if _to_str(message[0]) != 'message':
+                    continue
+                if message[2] is None:
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                    continue
+                for key in message[2]:
+                    if self._entries.pop(_to_str(key), None) is not None:
+                        self.invalidations += 1
+        except redis.ConnectionError:
+            self._disconnect()
+            self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def _to_str(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _copy_answer(answer):
+    # Model changes loaded hash in place
+    if isinstance(answer, dict):
+        return dict(answer)
+    if isinstance(answer, list):
+        return list(answer)
+    return answer
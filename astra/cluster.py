@@ -0,0 +1,67 @@
+"""
+Helpers for Redis Cluster. Keys of the object are kept in one slot when
+key schema of the model wraps pk to hash tag:
+
+    class UserObject(models.Model):
+        key_schema = models.KeySchema(hash_tags=True)
+
+    astra::userobject::hash::{12}
+
+so commands of one object could be pipelined or sent inside MULTI on the
+node of the slot. Multi-key commands of many objects are grouped by slot
+"""
+from collections import OrderedDict
+
+import six
+
+SLOTS_COUNT = 16384
+
+
+def is_cluster(db):
+    """ True for Redis Cluster client of redis-py """
+    return hasattr(db, 'get_node_from_key')
+
+
+def get_node_db(db, key):
+    """ Client of the primary node which serves slot of the key """
+    return db.get_node_from_key(key).redis_connection
+
+
+def get_primary_dbs(db):
+    """ Clients of primary nodes of the cluster, [db] for other clients """
+    if not is_cluster(db):
+        return [db]
+    return [node.redis_connection for node in db.get_primaries()]
+
+
+def key_slot(key):
+    """ Slot of the key, hash tag is used when key contains it """
+    if isinstance(key, six.text_type):
+        key = key.encode('utf-8')
+    start = key.find(b'{')
+    if start != -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    return _crc16(key) % SLOTS_COUNT
+
+
+def group_by_slot(keys):
+    """ Lists of keys by slot, in order of their first appearance """
+    groups = OrderedDict()
+    for key in keys:
+        groups.setdefault(key_slot(key), []).append(key)
+    return list(groups.values())
+
+
+def _crc16(data):
+    # CRC16-CCITT (XMODEM) used by Redis Cluster
+    crc = 0
+    for byte in bytearray(data):
+        crc ^= byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+    return crc
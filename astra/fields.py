@@ -19,20 +19,21 @@ class IntegerField(validators.IntegerValidatorMixin, base_fields.BaseField):
 
 class ForeignField(validators.ForeignObjectValidatorMixin,
                    base_fields.BaseField):
-    def assign(self, value):
+    def assign(self, model, value):
         if value is None:  # Remove field when None was passed
-            self.db.delete(self.get_key_name())
+            self.remove(model)
         else:
-            super(ForeignField, self).assign(value)
+            super(ForeignField, self).assign(model, value)
 
-    def obtain(self):
+    def obtain(self, model, prefetch=None):
         """
-        Convert saved pk to target object
+        Convert saved pk to target object. Fields of target object could be
+        loaded at once by prefetch list (or True for all fields)
         """
-        if not self._to:
-            raise RuntimeError('Relation model is not loaded')
-        value = super(ForeignField, self).obtain()
-        return self._to_wrapper(value)
+        value = super(ForeignField, self).obtain(model)
+        related_object = self._to_wrapper(value)
+        self._prefetch_related([related_object], prefetch)
+        return related_object
 
 
 class ForeignKey(ForeignField):  # legacy alias
@@ -52,44 +53,47 @@ class EnumField(validators.EnumValidatorMixin, base_fields.BaseField):
 
 # Hashes
 class CharHash(validators.CharValidatorMixin, base_fields.BaseHash):
-    pass
+    indexable = True
 
 
 class BooleanHash(validators.BooleanValidatorMixin, base_fields.BaseHash):
-    pass
+    indexable = True
 
 
 class IntegerHash(validators.IntegerValidatorMixin, base_fields.BaseHash):
-    pass
+    range_indexable = True
 
 
 class DateHash(validators.DateValidatorMixin, base_fields.BaseHash):
-    pass
+    range_indexable = True
 
 
 class DateTimeHash(validators.DateTimeValidatorMixin, base_fields.BaseHash):
-    pass
+    range_indexable = True
 
 
 class EnumHash(validators.EnumValidatorMixin, base_fields.BaseHash):
-    pass
+    indexable = True
 
 class ForeignHash(validators.ForeignObjectValidatorMixin,
                   base_fields.BaseHash):
-    def assign(self, value):
+    indexable = True
+
+    def assign(self, model, value):
         if value is None:  # Remove hash key when None was passed
-            super(ForeignHash, self).remove()
+            super(ForeignHash, self).remove(model)
         else:
-            super(ForeignHash, self).assign(value)
+            super(ForeignHash, self).assign(model, value)
 
-    def obtain(self):
+    def obtain(self, model, prefetch=None):
         """
-        Convert saved pk to target object
+        Convert saved pk to target object. Fields of target object could be
+        loaded at once by prefetch list (or True for all fields)
         """
-        if not self._to:
-            raise RuntimeError('Relation model is not loaded')
-        value = super(ForeignHash, self).obtain()
-        return self._to_wrapper(value)
+        value = super(ForeignHash, self).obtain(model)
+        related_object = self._to_wrapper(value)
+        self._prefetch_related([related_object], prefetch)
+        return related_object
 
 class List(base_fields.BaseCollection):
     """
@@ -100,17 +104,34 @@ class List(base_fields.BaseCollection):
     _allowed_redis_methods = ('lindex', 'linsert', 'llen', 'lpop', 'lpush',
                               'lpushx', 'lrange', 'lrem', 'lset', 'ltrim',
                               'rpop', 'rpoplpush', 'rpush', 'rpushx',)
+    _modify_redis_methods = ('linsert', 'lpop', 'lpush', 'lpushx', 'lrem',
+                             'lset', 'ltrim', 'rpop', 'rpoplpush', 'rpush',
+                             'rpushx',)
     _single_object_answered_redis_methods = ('lindex', 'lpop', 'rpop',)
     _list_answered_redis_methods = ('lrange',)
 
-    def __len__(self):
-        return self.llen()
-
-    def __getitem__(self, item):
+    def length(self, model):
+        return self.get_method(model, 'llen')()
+
+    def _read_chunks(self, model, size):
+        # Paged LRANGE
+        lrange = model._astra_get_db().lrange
+        key_name = self.get_key_name(model)
+        start = 0
+        while True:
+            chunk = lrange(key_name, start, start + size - 1)
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+            start += size
+
+    def get_item(self, model, item):
+        lrange = self.get_method(model, 'lrange')
         if isinstance(item, slice):
-            return self.lrange(item.start, item.stop)
+            return lrange(item.start, item.stop)
         else:
-            ret = self.lrange(item, item)
+            ret = lrange(item, item)
             return ret[0] if len(ret) == 1 else None
 
 
@@ -120,12 +141,25 @@ class Set(base_fields.BaseCollection):
                               'sinterstore', 'sismember', 'smembers', 'smove',
                               'spop', 'srandmember', 'srem', 'sscan', 'sunion',
                               'sunionstore')
+    _modify_redis_methods = ('sadd', 'sdiffstore', 'sinterstore', 'smove',
+                             'spop', 'srem', 'sunionstore',)
     _single_object_answered_redis_methods = ('spop',)
     _list_answered_redis_methods = ('sdiff', 'sinter', 'smembers',
                                     'srandmember', 'sscan', 'sunion',)
 
-    def __len__(self):
-        return self.scard()
+    def length(self, model):
+        return self.get_method(model, 'scard')()
+
+    def _read_chunks(self, model, size):
+        sscan = model._astra_get_db().sscan
+        key_name = self.get_key_name(model)
+        cursor = 0
+        while True:
+            cursor, chunk = sscan(key_name, cursor, count=size)
+            if chunk:
+                yield chunk
+            if not cursor:
+                return
 
 
 class SortedSet(base_fields.BaseCollection):
@@ -138,19 +172,36 @@ class SortedSet(base_fields.BaseCollection):
                               'zremrangebyscore', 'zrevrange',
                               'zrevrangebylex', 'zrevrangebyscore', 'zrevrank',
                               'zscan', 'zscore', 'zunionstore')
+    _modify_redis_methods = ('bzpopmax', 'bzpopmin', 'zadd', 'zincrby',
+                             'zinterstore', 'zpopmax', 'zpopmin', 'zrem',
+                             'zremrangebylex', 'zremrangebyrank',
+                             'zremrangebyscore', 'zunionstore',)
+    _blocking_redis_methods = ('bzpopmax', 'bzpopmin',)
     _single_object_answered_redis_methods = ()
     _list_answered_redis_methods = ('zpopmax', 'zpopmin', 'zrange',
                                     'zrangebylex', 'zrangebyscore',
                                     'zrevrange', 'zrevrangebylex',
                                     'zrevrangebyscore', 'zscan', )
 
-    def __len__(self):
-        return self.zcard()
-
-    def __getitem__(self, item):
+    def length(self, model):
+        return self.get_method(model, 'zcard')()
+
+    def _read_chunks(self, model, size):
+        # Members without scores, in order of ZSCAN
+        zscan = model._astra_get_db().zscan
+        key_name = self.get_key_name(model)
+        cursor = 0
+        while True:
+            cursor, chunk = zscan(key_name, cursor, count=size)
+            if chunk:
+                yield [member for member, score in chunk]
+            if not cursor:
+                return
+
+    def get_item(self, model, item):
+        zrangebyscore = self.get_method(model, 'zrangebyscore')
         if isinstance(item, slice):
-            return self.zrangebyscore(item.start or '-inf',
-                                      item.stop or '+inf')
+            return zrangebyscore(item.start or '-inf', item.stop or '+inf')
         else:
-            ret = self.zrangebyscore(item, item)
+            ret = zrangebyscore(item, item)
             return ret[0] if len(ret) == 1 else None
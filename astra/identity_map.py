@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7, maps are active per thread
+    ContextVar = None
+
+
+if ContextVar is not None:
+    # Stack is immutable tuple, so asyncio tasks copying the context don't
+    # see maps of each other
+    _stack = ContextVar('astra_identity_maps', default=())
+else:
+    _local = threading.local()
+
+
+def _get_stack():
+    if ContextVar is not None:
+        return _stack.get()
+    return getattr(_local, 'stack', ())
+
+
+def _set_stack(stack):
+    if ContextVar is not None:
+        _stack.set(stack)
+    else:
+        _local.stack = stack
+
+
+class IdentityMap(object):
+    """
+    Map of objects by model class and pk with bounded LRU. While the map is
+    active in the current thread or asyncio task, foreign fields,
+    collections and get_many return the same already loaded instance for
+    the same object:
+
+    with IdentityMap(max_size=1000):  # e.g. per request
+        for user in UserObject.get_many(pks):
+            print(user.site1.name)  # every site is loaded once
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._objects = OrderedDict()  # (model class, pk) -> object
+
+    def get(self, model_cls, pk):
+        key = (model_cls, pk)
+        obj = self._objects.pop(key, None)
+        if obj is not None:
+            self._objects[key] = obj  # Recently used
+        return obj
+
+    def add(self, obj):
+        key = (obj.__class__, obj.pk)
+        self._objects.pop(key, None)
+        self._objects[key] = obj
+        while len(self._objects) > self.max_size:
+            self._objects.popitem(last=False)
+
+    def discard(self, obj):
+        self._objects.pop((obj.__class__, obj.pk), None)
+
+    def clear(self):
+        self._objects.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, obj):
+        return self._objects.get((obj.__class__, obj.pk)) is obj
+
+    def __enter__(self):
+        _set_stack(_get_stack() + (self, ))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _set_stack(tuple(item for item in _get_stack() if item is not self))
+
+
+def get_identity_map():
+    """ Return active identity map of the current thread (task) or None """
+    stack = _get_stack()
+    return stack[-1] if stack else None
@@ -0,0 +1,107 @@
+"""
+Layout of key names of the model. Default layout is
+
+    astra::userobject::fld::12::credits_test
+
+and compact one could be declared on the model for save memory of large
+databases:
+
+    class UserObject(models.Model):
+        key_schema = models.KeySchema(prefix='a', alias='u', separator=':',
+                                      type_tags=models.SHORT_TYPE_TAGS,
+                                      fields={'credits_test': 'c'})
+
+for keys like a:u:f:12:c. Existing keys are renamed by
+astra.migration.migrate_keys. With hash_tags=True pk is wrapped to hash
+tag, e.g. a:u:f:{12}:c, and all keys of the object are kept in one slot of
+Redis Cluster (see astra.cluster)
+"""
+
+SHORT_TYPE_TAGS = {
+    'fld': 'f',
+    'doc': 'd',
+    'hash': 'h',
+    'bucket': 'b',
+    'list': 'l',
+    'set': 's',
+    'zset': 'z',
+    'idx': 'i',
+    'ridx': 'r',
+}
+
+
+class KeySchema(object):
+    """
+    prefix and alias (lowercased class name by default) start all keys of
+    the model, type_tags replace names of key types and fields replace
+    names of fields by aliases. Alias belongs to the class which declares
+    the schema, subclasses must declare their own one. Indexes are shared
+    by objects, so they are not available with hash tags
+    """
+
+    def __init__(self, prefix='astra', alias=None, separator='::',
+                 type_tags=None, fields=None, hash_tags=False):
+        self.prefix = prefix
+        self.alias = alias
+        self.separator = separator
+        self.hash_tags = hash_tags
+        self.type_tags = dict(type_tags or {})  # type name -> tag
+        self.fields = dict(fields or {})  # field name -> alias
+        self._type_names = {v: k for k, v in self.type_tags.items()}
+        self._field_names = {v: k for k, v in self.fields.items()}
+
+    def check(self, model_cls):
+        """ Raise AttributeError when key names of the model could clash """
+        if self.alias is not None and 'key_schema' not in vars(model_cls):
+            raise AttributeError('Key schema with alias is inherited by %s, '
+                                 'declare own key_schema'
+                                 % model_cls.__name__)
+        for field_name in self.fields:
+            if field_name not in model_cls._astra_fields:
+                raise AttributeError('Key alias of unknown field %s'
+                                     % field_name)
+        field_aliases = [self.get_field_alias(field_name)
+                         for field_name in model_cls._astra_fields]
+        if len(set(field_aliases)) != len(field_aliases):
+            raise AttributeError('Key aliases of fields are not unique')
+        if self.hash_tags and model_cls._astra_indexed_field_names:
+            raise AttributeError('Indexes are not available with hash tags, '
+                                 'they are changed together with objects '
+                                 'of other slots')
+        if len(self._type_names) != len(self.type_tags):
+            raise AttributeError('Key type tags are not unique')
+        parts = [self.prefix, self.get_prefix(model_cls)] + field_aliases + \
+            list(self.type_tags.values())
+        if not self.separator or any(
+                not part or self.separator in part for part in parts[2:]):
+            raise AttributeError('Key aliases must be non-empty and not '
+                                 'contain the separator')
+
+    def get_prefix(self, model_cls):
+        return self.join(self.prefix,
+                         self.alias or model_cls.__name__.lower())
+
+    def tag_pk(self, pk):
+        """ Part of key names with pk """
+        return '{%s}' % pk if self.hash_tags else pk
+
+    def untag_pk(self, pk_item):
+        if self.hash_tags and pk_item.startswith('{') and \
+                pk_item.endswith('}'):
+            return pk_item[1:-1]
+        return pk_item
+
+    def get_type_tag(self, type_name):
+        return self.type_tags.get(type_name, type_name)
+
+    def get_type_name(self, type_tag):
+        return self._type_names.get(type_tag, type_tag)
+
+    def get_field_alias(self, field_name):
+        return self.fields.get(field_name, field_name)
+
+    def get_field_name(self, field_alias):
+        return self._field_names.get(field_alias, field_alias)
+
+    def join(self, *items):
+        return self.separator.join(items)
@@ -0,0 +1,97 @@
+"""
+Rename existing keys of the model after change of its key schema (see
+astra.key_schema). Keys are found by SCAN and renamed by pipelined RENAMENX
+per batch, so the database is not blocked and every key is moved
+atomically. Migration could be stopped and resumed from the last reported
+cursor:
+
+    for cursor, renamed, skipped in migrate_keys(UserObject, cursor=saved):
+        save_cursor(cursor)
+"""
+from astra import base_fields
+from astra.key_schema import KeySchema
+from astra.model import _escape_pattern
+
+
+def migrate_keys(model_cls, old_schema=None, cursor=0, batch_size=500):
+    """
+    Rename keys of the model from old_schema (default layout by default)
+    to the current key_schema of the model. Yield SCAN cursor, count of
+    renamed keys and count of skipped keys after every batch. Keys which
+    are already written in the new layout are not overwritten, old keys are
+    kept and counted as skipped. Index keys and keys of collections are
+    moved too
+    """
+    old_schema = old_schema or KeySchema()
+    old_head = old_schema.join(old_schema.get_prefix(model_cls), '')
+    db = model_cls._astra_probe()._astra_get_db()
+    while True:
+        cursor, keys = db.scan(cursor, match=_escape_pattern(old_head) + '*',
+                               count=batch_size)
+        renames = []
+        for key in keys:
+            new_key = _get_new_key_name(model_cls, old_schema,
+                                        key[len(old_head):])
+            if new_key is not None and new_key != key:
+                renames.append((key, new_key))
+        renamed = 0
+        if renames:
+            pipe = db.pipeline(transaction=False)
+            for key, new_key in renames:
+                pipe.renamenx(key, new_key)
+            # Key could be renamed already when SCAN returns it twice
+            answers = pipe.execute(raise_on_error=False)
+            renamed = sum(1 for answer in answers if answer is True)
+        yield cursor, renamed, len(renames) - renamed
+        if not cursor:
+            break
+
+
+def _get_new_key_name(model_cls, old_schema, tail):
+    # Key name in the new layout, None for unknown keys of the old layout
+    separator = old_schema.separator
+    type_tag, _, tail = tail.partition(separator)
+    type_name = old_schema.get_type_name(type_tag)
+    probe = model_cls._astra_probe()
+    if type_name in ('idx', 'ridx'):
+        field_alias, _, value = tail.partition(separator)
+        field = _get_field(model_cls, old_schema, field_alias)
+        if not isinstance(field, base_fields.BaseHash):
+            return None
+        if type_name == 'ridx':
+            return field.get_range_index_key_name(probe)
+        return field.get_index_key_name(probe, value)
+
+    if type_name == 'bucket':
+        if not model_cls.hash_bucket_size or \
+                not model_cls._astra_hash_field_names or \
+                not old_schema.untag_pk(tail).lstrip('-').isdigit():
+            return None
+        probe.pk = int(old_schema.untag_pk(tail)) * \
+            model_cls.hash_bucket_size  # First object in the bucket
+        return model_cls._astra_fields[
+            model_cls._astra_hash_field_names[0]].get_key_name(probe, True)
+
+    if type_name in ('hash', 'doc'):
+        probe.pk = old_schema.untag_pk(tail)
+        if type_name == 'hash' and model_cls._astra_hash_field_names and \
+                not model_cls.hash_bucket_size:
+            return model_cls._astra_fields[
+                model_cls._astra_hash_field_names[0]].get_key_name(probe, True)
+        if type_name == 'doc' and model_cls.document_storage and \
+                model_cls._astra_scalar_field_names:
+            return model_cls._astra_fields[
+                model_cls._astra_scalar_field_names[0]].get_key_name(probe)
+        return None
+
+    pk_item, _, field_alias = tail.rpartition(separator)
+    probe.pk = old_schema.untag_pk(pk_item)
+    field = _get_field(model_cls, old_schema, field_alias)
+    if field is None or field.field_type_name != type_name or \
+            (type_name == 'fld' and model_cls.document_storage):
+        return None  # Value of own key could not be moved to document
+    return field.get_key_name(probe)
+
+
+def _get_field(model_cls, old_schema, field_alias):
+    return model_cls._astra_fields.get(old_schema.get_field_name(field_alias))
@@ -1,6 +1,320 @@
-from astra import base_fields
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
 
+import six
+from redis.exceptions import WatchError
+from six import string_types
 
+from astra import base_fields, cluster, scripts, validators
+from astra.key_schema import KeySchema
+from astra.identity_map import get_identity_map
+
+
+class VersionConflict(WatchError):
+    """
+    Object was changed by other writer after its version was read. Refresh
+    the object and retry the change
+    """
+
+
+class WriteBuffer(object):
+    """
+    Collect write commands and send them by one pipeline. Consecutive HSET
+    and SET commands are merged into one multi-field HSET per hash and one
+    MSET, changes of documents into one script call per document, other
+    commands keep their order. Used scripts are loaded by SCRIPT LOAD at the
+    head of every pipeline which calls them, so the server which lost them
+    (restart, failover, SCRIPT FLUSH) doesn't apply the pipeline partially.
+
+    With version_check = (hash key, field, expected version or None when
+    it is not read) the hash is watched, commands are sent inside
+    MULTI/EXEC together with increment of the version and VersionConflict
+    is raised when other writer has changed the version
+
+    With new_key_ttl (seconds) existing keys keep their expiry (SET is sent
+    with KEEPTTL instead of MSET), keys created by the commands get
+    new_key_ttl. Written keys are watched and checked by EXISTS, then
+    commands are sent inside MULTI/EXEC together with EXPIRE of missing
+    keys, so created key never stays without expiry. The transaction is
+    retried when other writer has created or removed watched key
+
+    With Redis Cluster client commands are sent by pipelines to clients of
+    nodes of their keys (see astra.cluster), so transaction, version check
+    or new_key_ttl is possible only for keys of one slot
+    """
+
+    def __init__(self, db, transaction=False, version_check=None,
+                 new_key_ttl=None):
+        self.db = db
+        self.transaction = transaction
+        self.version_check = version_check
+        self.new_key_ttl = new_key_ttl
+        self.results = None  # Answers of the pipeline after execute()
+        self.version = None  # New version after checked execute()
+        self.hash_values = {}  # Written hash fields of the object, see batch
+        self.hash_reset = False  # Hash was changed by scripts, see batch
+        self._commands = []  # (command name, args, kwargs)
+        self._hashes = {}  # key -> {field: value}
+        self._values = {}  # key -> value
+        self._documents = {}  # key -> {field: value}
+        self._scripts = set()
+
+    def send(self, command_name, *args, **kwargs):
+        if command_name == 'evalsha' and args[0] is scripts.DOCUMENT_SET:
+            self._scripts.add(args[0])
+            self._documents.setdefault(args[2], {}).update(
+                zip(args[3::2], args[4::2]))
+        elif command_name == 'evalsha':
+            self._push_merged()
+            self._scripts.add(args[0])
+            self._commands.append(
+                ('evalsha', (args[0].sha,) + args[1:], kwargs))
+        elif command_name == 'hset' and len(args) == 3 and not kwargs:
+            key, field, value = args
+            self._hashes.setdefault(key, {})[field] = value
+        elif command_name == 'set' and len(args) == 2 and not kwargs:
+            key, value = args
+            self._values[key] = value
+        else:
+            self._push_merged()
+            self._commands.append((command_name, args, kwargs))
+
+    def _push_merged(self):
+        for key, mapping in self._hashes.items():
+            self._commands.append(('hset', (key,), {'mapping': mapping}))
+        if self._values and self.new_key_ttl is not None:
+            for key, value in self._values.items():
+                self._commands.append(('set', (key, value),
+                                       {'keepttl': True}))
+        elif self._values and cluster.is_cluster(self.db):
+            for key_names in cluster.group_by_slot(self._values):
+                self._commands.append(('mset', ({
+                    key: self._values[key] for key in key_names},), {}))
+        elif self._values:
+            self._commands.append(('mset', (self._values,), {}))
+        for key, mapping in self._documents.items():
+            args = [scripts.DOCUMENT_SET.sha, 1, key]
+            for item in mapping.items():
+                args.extend(item)
+            self._commands.append(('evalsha', tuple(args), {}))
+        self._hashes = {}
+        self._values = {}
+        self._documents = {}
+
+    def _queue(self, pipe, commands):
+        # Answers of scripts loading are skipped, see _answers
+        for script in self._scripts:
+            pipe.script_load(script.source)
+        for command_name, args, kwargs in commands:
+            getattr(pipe, command_name)(*args, **kwargs)
+
+    def _answers(self, results, commands):
+        # Skip answers of scripts loading and of commands added by execute
+        head = len(self._scripts)
+        return results[head:head + len(commands)]
+
+    def _get_new_key_names(self, commands):
+        # Keys which get new_key_ttl: checked ones when they are missing
+        # before the write, recreated ones (removed or their expiry is
+        # cleared by the previous command) always
+        checked_key_names = []
+        recreated_key_names = []
+        if self.new_key_ttl is None:
+            return checked_key_names, recreated_key_names
+        seen_key_names = set(args[0] for name, args, _ in commands
+                             if name in _OWN_TTL_COMMANDS)
+        removed_key_names = set()
+        for command_name, args, kwargs in commands:
+            if command_name in ('delete', 'unlink'):
+                seen_key_names.difference_update(args)
+                removed_key_names.update(args)
+                continue
+            if command_name in _NOT_CREATING_COMMANDS:
+                continue
+            key_name = _get_command_key(command_name, args, kwargs)
+            if key_name in removed_key_names or \
+                    command_name in _TTL_CLEARING_COMMANDS:
+                if key_name not in recreated_key_names:
+                    recreated_key_names.append(key_name)
+            elif key_name not in seen_key_names:
+                checked_key_names.append(key_name)
+            seen_key_names.add(key_name)
+        return checked_key_names, recreated_key_names
+
+    def _get_missing_key_names(self, pipe, key_names):
+        # Keys are read by the watching pipeline, usually all of them exist
+        if not key_names:
+            return []
+        count = pipe.exists(*key_names)
+        if count == len(key_names):
+            return []
+        if not count:
+            return list(key_names)
+        return [key_name for key_name in key_names
+                if not pipe.exists(key_name)]
+
+    def execute(self):
+        self._push_merged()
+        if cluster.is_cluster(self.db):
+            self.results = self._execute_by_nodes()
+        else:
+            self.results = self._execute_on(self.db, self._commands)
+        return self.results
+
+    def _execute_on(self, db, commands):
+        new_key_names = self._get_new_key_names(commands)
+        if self.version_check is None and not any(new_key_names):
+            pipe = db.pipeline(transaction=self.transaction)
+            self._queue(pipe, commands)
+            return self._answers(pipe.execute(), commands)
+        elif commands:
+            return self._execute_checked(db, commands, *new_key_names)
+        return []  # Nothing to write, version is not changed
+
+    def _execute_by_nodes(self):
+        # Pipeline per node, answers are returned in order of commands
+        nodes = OrderedDict()  # node client -> positions of commands
+        for position, command in enumerate(self._commands):
+            node_db = cluster.get_node_db(self.db, _get_command_key(*command))
+            nodes.setdefault(node_db, []).append(position)
+        if len(nodes) > 1 and (self.transaction or self.version_check):
+            raise ValueError('Transaction is not possible for keys of '
+                             'many cluster nodes')
+        results = [None] * len(self._commands)
+        for node_db, positions in nodes.items():
+            node_results = self._execute_on(
+                node_db, [self._commands[i] for i in positions])
+            for position, result in zip(positions, node_results):
+                results[position] = result
+        return results
+
+    def _execute_checked(self, db, commands, checked_key_names=(),
+                         recreated_key_names=()):
+        watched_key_names = list(checked_key_names)
+        if self.version_check is not None:
+            watched_key_names.append(self.version_check[0])
+        with db.pipeline(transaction=True) as pipe:
+            while True:
+                if watched_key_names:
+                    pipe.watch(*watched_key_names)
+                self._check_version(pipe)
+                created_key_names = self._get_missing_key_names(
+                    pipe, checked_key_names)
+                pipe.multi()
+                self._queue(pipe, commands)
+                self._queue_checked_tail(pipe, created_key_names,
+                                         recreated_key_names)
+                try:
+                    results = pipe.execute()
+                    break
+                except WatchError:
+                    self._raise_conflict()
+        return self._answers_checked(results, commands)
+
+    def _check_version(self, pipe):
+        if self.version_check is None:
+            return
+        key_name, field_name, expected = self.version_check
+        if expected is not None and \
+                (pipe.hget(key_name, field_name) or '0') != expected:
+            self._raise_conflict()
+
+    def _raise_conflict(self):
+        # Transaction is retried when other writer has created or removed
+        # checked key and the version is not checked
+        if self.version_check is not None:
+            raise VersionConflict('%s was changed' % self.version_check[0])
+
+    def _queue_checked_tail(self, pipe, created_key_names,
+                            recreated_key_names):
+        # Expiry of created keys and increment of the version go to the
+        # same transaction
+        for key_name in created_key_names:
+            pipe.expire(key_name, self.new_key_ttl)
+        for key_name in recreated_key_names:
+            if key_name not in created_key_names:
+                pipe.expire(key_name, self.new_key_ttl)
+        if self.version_check is not None:
+            key_name, field_name, _ = self.version_check
+            pipe.hincrby(key_name, field_name, 1)
+
+    def _answers_checked(self, results, commands):
+        if self.version_check is not None:
+            self.version = results[-1]
+        return self._answers(results, commands)
+
+    def is_empty(self):
+        return not (self._commands or self._hashes or self._values or
+                    self._documents)
+
+    def discard(self):
+        self._commands = []
+        self._hashes = {}
+        self._values = {}
+        self._documents = {}
+        self._scripts = set()
+        self.hash_values = {}
+        self.hash_reset = False
+
+
+class ModelMeta(type):
+    """
+    Compile model class once at definition: capture fields and name them,
+    generate getters, setters and helpers. Spent time is saved to
+    _astra_compile_time attribute of the class
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(ModelMeta, cls).__init__(name, bases, attrs)
+        started_at = default_timer()
+        cls._astra_capture_fields(attrs)
+        cls._astra_make_methods()
+        cls._astra_compile_time = default_timer() - started_at
+        cls._astra_version_stats = {'writes': 0, 'conflicts': 0}
+
+
+def get_compile_times(model_cls=None):
+    """
+    Return compilation time in seconds for every compiled subclass of the
+    model class (all models by default), e.g. for report import-time cost
+    """
+    model_cls = model_cls or Model
+    compile_times = {}
+    for subclass in model_cls.__subclasses__():
+        compile_times['%s.%s' % (subclass.__module__, subclass.__name__)] = \
+            subclass._astra_compile_time
+        compile_times.update(get_compile_times(subclass))
+    return compile_times
+
+
+def get_version_stats(model_cls=None):
+    """
+    Return counters of versioned writes and their conflicts for every
+    subclass of the model class with version_field, e.g. for monitoring of
+    contention on hot objects
+    """
+    model_cls = model_cls or Model
+    version_stats = {}
+    for subclass in model_cls.__subclasses__():
+        if subclass.version_field is not None:
+            with _version_stats_lock:
+                stats = dict(subclass._astra_version_stats)
+            stats['conflict_ratio'] = \
+                stats['conflicts'] / float(stats['writes'] or 1)
+            version_stats['%s.%s' % (subclass.__module__,
+                                     subclass.__name__)] = stats
+        version_stats.update(get_version_stats(subclass))
+    return version_stats
+
+
+_version_stats_lock = threading.Lock()
+
+
+@six.add_metaclass(ModelMeta)
 class Model(object):
     """
     Parent class for all user-defined objects.
@@ -14,110 +328,207 @@ class Model(object):
 
         def get_db(self):
             return db
+
+    Wide hashes could be loaded partially by HMGET with only requested
+    fields, set partial_hash_loading = True on the model or declare loaded
+    fields by only() method.
+
+    Fields are shared by all objects of the class and state of the object
+    is kept in slots. Declare __slots__ = () on the model for objects
+    without __dict__ when many of them are kept in memory.
+
+    Small objects could keep all scalar fields in one JSON document key
+    instead of key per field, set document_storage = True on the model.
+    Field helpers (incr, expire, ...) are not available for them.
+
+    Millions of tiny objects with integer pks could share bucket hashes by
+    ranges of pks, set hash_bucket_size on the model. Fields are kept as
+    "<pk offset>:<field>" in the bucket, so bucket with less fields than
+    hash-max-listpack-entries (hash-max-ziplist-entries before Redis 7.0)
+    is compactly encoded. iter_all() is not available for them.
+
+    Set default_ttl (seconds) for objects which expire together with all
+    their keys, e.g. sessions: expiry is set on creation with values or by
+    expire(). With ttl_write_through = True every write refreshes it by the
+    same pipeline, so forgotten objects are removed by Redis.
+
+    Set version_field to name of IntegerHash field for optimistic locking:
+    writes by update() and batch() increment the version and raise
+    VersionConflict when the object was changed by other writer after its
+    hash was read. cas(), update_if() and hincrby() increment the version
+    by their scripts.
     """
+    __slots__ = ('_astra_pk', '_astra_key_names', '_astra_hash',
+                 '_astra_hash_loaded', '_astra_hash_fields',
+                 '_astra_hash_only', '_astra_database', '_astra_hash_exist',
+                 '_astra_fld_cache', '_astra_buffer', '__weakref__')
+    partial_hash_loading = False
+    document_storage = False
+    hash_bucket_size = None
+    default_ttl = None
+    ttl_write_through = False
+    version_field = None
+    key_schema = KeySchema()
+    _astra_buffer_class = WriteBuffer
 
     def __init__(self, pk=None, **kwargs):
         self._astra_hash = {}  # Hash-object cache
-        self._astra_hash_loaded = False
+        self._astra_hash_loaded = False  # Whole hash is loaded
+        self._astra_hash_fields = set()  # Partially loaded hash fields
+        self._astra_hash_only = ()  # Declared set of hash fields, see only()
         self._astra_database = None
         self._astra_hash_exist = None
+        self._astra_fld_cache = {}  # Prefetched or cached scalar fields
+        self._astra_buffer = None  # Postponed writes, see update()
+        self._astra_key_names = None  # Built key names, see get_key_name
 
         if pk is None:
             raise ValueError('You must pass pk for new or existing object')
-        self.pk = str(pk)
-
-        self._capture_fields()
-        self._make_methods()
+        self._astra_pk = str(pk)
 
         # Load fields:
-        for k in kwargs:
-            setattr(self, k, kwargs.get(k))
-
-    def _capture_fields(self):
-        # Save original fields because they will be replaced to properties
-        cls = self.__class__
-        if not hasattr(cls, '_astra_fields'):
-            astra_fields = {}
+        if kwargs:
+            if self.default_ttl is None or self.ttl_write_through:
+                self.update(**kwargs)
+            else:
+                with self.batch():  # Values and expiry by one pipeline
+                    self.update(**kwargs)
+                    self.expire()
 
-            for k in dir(cls):  # vars() ignores parent variables
-                v = getattr(self.__class__, k)
+    @classmethod
+    def _astra_capture_fields(cls, attrs):
+        astra_fields = {}
+        for base in reversed(cls.__mro__[1:]):
+            if '_astra_fields' in vars(base):  # Already compiled model
+                astra_fields.update(vars(base)['_astra_fields'])
+                continue
+            for k, v in vars(base).items():  # Fields of mixins
                 if isinstance(v, base_fields.ModelField):
+                    v.set_name(k)
                     astra_fields[k] = v
+        for k, v in attrs.items():
+            if isinstance(v, base_fields.ModelField):
+                v.set_name(k)
+                astra_fields[k] = v
+            else:
+                astra_fields.pop(k, None)  # Overridden by other attribute
 
-            setattr(cls, '_astra_fields', astra_fields)
+        cls._astra_fields = astra_fields
+        cls._astra_hash_field_names = tuple(
+            k for k, v in astra_fields.items()
+            if isinstance(v, base_fields.BaseHash))
+        cls._astra_scalar_field_names = tuple(
+            k for k, v in astra_fields.items()
+            if isinstance(v, base_fields.BaseField))
+        cls._astra_indexed_field_names = tuple(
+            k for k in cls._astra_hash_field_names
+            if astra_fields[k].options.get('index') or
+            astra_fields[k].options.get('range_index'))
 
-    def _make_methods(self):
-        # Replace fields to properties, make setters and getters
-        cls = self.__class__
-        if hasattr(cls, '_astra_precompiled'):
-            return
+        if cls.version_field is not None and not (
+                cls.version_field in cls._astra_hash_field_names and
+                isinstance(astra_fields[cls.version_field],
+                           validators.IntegerValidatorMixin)):
+            raise AttributeError('version_field must be name of IntegerHash '
+                                 'field')
+        cls.key_schema.check(cls)
+        if cls.hash_bucket_size is not None and not (
+                isinstance(cls.hash_bucket_size, six.integer_types) and
+                cls.hash_bucket_size > 0):
+            raise AttributeError('hash_bucket_size must be positive integer')
+        if cls.ttl_write_through and cls.default_ttl is None:
+            raise AttributeError('ttl_write_through requires default_ttl')
+        if cls.default_ttl is not None and cls.hash_bucket_size and \
+                cls._astra_hash_field_names:
+            raise AttributeError('Objects in bucket hashes could not expire')
 
-        astra_fields = getattr(self.__class__, '_astra_fields')
-        src_lines = []
-        for fld in astra_fields.keys():
-            field = astra_fields[fld]
-
-            has_implement_get = hasattr(cls, 'get_%s' % fld)
-            has_implement_set = hasattr(cls, 'set_%s' % fld)
-            has_implement_del = hasattr(cls, 'del_%s' % fld)
-            getter_name = 'get_%s' % fld
-            setter_name = 'set_%s' % fld
-            deleter_name = 'del_%s' % fld
-
-            # o.field = 123 will call:
-            # setter for field -> set_field(123) -> setattr('field', 123)
-            if not has_implement_get:
-                src_lines.append('def get_%s(self):' % fld)
-                src_lines.append('  return self.getattr("%s")' % fld)
-            if not has_implement_set:
-                src_lines.append('def set_%s(self, value):' % fld)
-                src_lines.append('  return self.setattr("%s", value)' % fld)
-            if not has_implement_del:
-                src_lines.append('def del_%s(self):' % fld)
-                src_lines.append('  return self.setattr("%s", None)' % fld)
-
-            if has_implement_get:
-                getter_name = 'getattr(cls, "get_%s")' % fld
-            if has_implement_set:
-                setter_name = 'getattr(cls, "set_%s")' % fld
-            if has_implement_del:
-                setter_name = 'getattr(cls, "del_%s")' % fld
-            src_lines.append('%s = property(%s, %s, %s, "%s Property")' % (
-                fld, getter_name, setter_name, deleter_name,
-                fld,))
+    @classmethod
+    def _astra_make_methods(cls):
+        # Make setters and getters which are called by the field:
+        # o.field = 123 will call:
+        # field.__set__ -> set_field(123) -> setattr('field', 123)
+        for field_name, field in cls._astra_fields.items():
+            if not hasattr(cls, 'get_%s' % field_name):
+                setattr(cls, 'get_%s' % field_name, _make_getter(field_name))
+            if not hasattr(cls, 'set_%s' % field_name):
+                setattr(cls, 'set_%s' % field_name, _make_setter(field_name))
+            if not hasattr(cls, 'del_%s' % field_name):
+                setattr(cls, 'del_%s' % field_name,
+                        _make_deleter(field_name))
 
             # Helpers code
             for helper_name in field.directly_redis_helpers:
-                src_lines.append('def %s_%s(self, *args, **kwargs):' % (
-                    fld, helper_name))
-                src_lines.append('  return self.apply("%s", "%s", '
-                                 '*args, **kwargs)' % (fld,
-                                                       helper_name))
-
-        src_code = '\n'.join(src_lines)
-        global_scope = {'cls': cls}
-        local_scope = {}
-        exec(compile(src_code, '<string>', 'exec'), global_scope, local_scope)
-        for kkk in local_scope:
-            setattr(cls, kkk, local_scope[kkk])
-        setattr(cls, '_astra_precompiled', True)
+                method_name = '%s_%s' % (field_name, helper_name)
+                if not hasattr(cls, method_name):
+                    setattr(cls, method_name,
+                            _make_helper(field_name, helper_name))
+
+    @property
+    def pk(self):
+        return self._astra_pk
+
+    @pk.setter
+    def pk(self, value):
+        self._astra_pk = str(value)  # As passed to the constructor
+        self._astra_key_names = None  # Keys are built from pk
 
     def _get_original_field(self, field_name):
-        field_key = '_astra_field_%s' % field_name
-        if not hasattr(self, field_key):
-            # Create instance from original field on demand
-            astra_fields = getattr(self.__class__, '_astra_fields')
-            try:
-                target_field = astra_fields.get(field_name)
-            except KeyError as e:
-                raise AttributeError('%s key is not found' % field_name)
-            new_instance = target_field.__class__(instance=True, model=self,
-                                                  name=field_name,
-                                                  db=self._astra_get_db(),
-                                                  **target_field.options)
-            setattr(self, field_key, new_instance)
-            return new_instance
-        return getattr(self, field_key)
+        try:
+            return self._astra_fields[field_name]
+        except KeyError:
+            raise AttributeError('%s key is not found' % field_name)
+
+    def _astra_send(self, command_name, *args, **kwargs):
+        client_cache = self.get_client_cache()
+        if client_cache is not None:  # Don't wait invalidation message
+            if command_name in ('delete', 'unlink'):
+                client_cache.invalidate(*args)
+            elif command_name == 'evalsha':  # Script, numkeys, keys, ...
+                client_cache.invalidate(*args[2:2 + args[1]])
+            else:
+                client_cache.invalidate(args[0])
+
+        if self._astra_buffer is not None:
+            return self._astra_buffer.send(command_name, *args, **kwargs)
+        if self.default_ttl is not None and \
+                command_name not in _NO_TTL_COMMANDS:
+            return self._astra_send_with_ttl(command_name, *args, **kwargs)
+        if command_name == 'evalsha':
+            return scripts.run(self._astra_get_db(), *args)
+        return getattr(self._astra_get_db(), command_name)(*args, **kwargs)
+
+    def _astra_send_with_ttl(self, command_name, *args, **kwargs):
+        # Write and keep (or refresh) expiry of the object by one pipeline
+        write_buffer = self._astra_make_buffer()
+        write_buffer.send(command_name, *args, **kwargs)
+        if self.ttl_write_through:
+            self._astra_queue_for_keys(write_buffer, 'expire',
+                                       self.default_ttl)
+        return write_buffer.execute()[0]
+
+    def _astra_make_buffer(self, transaction=False, version_check=None):
+        # Without write-through keys of the object keep their expiry
+        new_key_ttl = None
+        if not self.ttl_write_through:
+            new_key_ttl = self.default_ttl
+        return self._astra_buffer_class(
+            self._astra_get_db(), transaction=transaction,
+            version_check=version_check, new_key_ttl=new_key_ttl)
+
+    def _astra_pack_field_name(self, field_name):
+        # Name of the field in the hash, prefixed by offset of pk in bucket
+        if not self.hash_bucket_size:
+            return field_name
+        return '%d:%s' % (int(self.pk) % self.hash_bucket_size, field_name)
+
+    def _astra_pack_field_names(self, field_names):
+        if not self.hash_bucket_size:
+            return field_names
+        return [self._astra_pack_field_name(n) for n in field_names]
+
+    @staticmethod
+    def _astra_unpack_field_names(hash_field_names):
+        return [n.rpartition(':')[2] for n in hash_field_names]
 
     def _astra_get_db(self):
         if not self._astra_database:
@@ -143,15 +554,334 @@ class Model(object):
     def __hash__(self):
         return hash('astra:%s:pk:%s' % (self.__class__.__name__, self.pk))
 
+    @classmethod
+    def get_many(cls, pks, fields=None):
+        """
+        Load objects by one pipelined round trip. Hash of every object and
+        values of the requested scalar fields (all by default) are fetched
+        together, so reading them later doesn't touch the database:
+
+            users = UserObject.get_many([1, 2, 3], fields=['name', 'is_admin'])
+        """
+        objects = [cls.from_pk(pk) for pk in pks]
+        cls.prefetch(objects, fields)
+        return objects
+
+    @classmethod
+    def from_pk(cls, pk):
+        """
+        Return object by pk. The same instance is returned while identity
+        map is active, see astra.identity_map.IdentityMap
+        """
+        identity_map = get_identity_map()
+        if identity_map is None:
+            return cls(pk)
+        obj = identity_map.get(cls, str(pk))
+        if obj is None:
+            obj = cls(pk)
+            identity_map.add(obj)
+        return obj
+
+    @classmethod
+    def filter(cls, prefetch=None, **conditions):
+        """
+        Find objects by values of indexed hash fields (index=True), passed
+        conditions are joined by SINTER:
+
+            pks = UserObject.filter(status='ACTIVATED', is_admin=True)
+            users = UserObject.filter(status='BANNED', prefetch=['name'])
+
+        Return sorted list of pks, or objects with loaded fields when
+        prefetch list (or True for all fields) is passed
+        """
+        probe = cls._astra_probe()
+        index_key_names = cls._astra_index_key_names(probe, conditions)
+        pks = sorted(probe._astra_get_db().sinter(index_key_names))
+        if not prefetch:
+            return pks
+        return cls.get_many(pks, None if prefetch is True else prefetch)
+
+    @classmethod
+    def _astra_index_key_names(cls, probe, conditions):
+        if not conditions:
+            raise ValueError('Conditions of filter are not passed')
+        index_key_names = []
+        for field_name, value in conditions.items():
+            field = cls._astra_fields.get(field_name)
+            if field is None or not field.options.get('index'):
+                raise AttributeError('%s field is not indexed' % field_name)
+            index_key_names.append(
+                field.get_index_key_name(probe, field._convert_set(value)))
+        return index_key_names
+
+    @classmethod
+    def range(cls, field_name, min=None, max=None, limit=None, offset=0,
+              reverse=False, prefetch=None):
+        """
+        Find objects by range of values of the hash field with
+        range_index=True. Objects are ordered by the value (descending for
+        reverse=True), bounds are inclusive and open when None is passed:
+
+            pks = UserObject.range('rating', 100, 500, limit=20, offset=40)
+            users = UserObject.range('last_login', hour_ago, prefetch=True)
+
+        Redis bounds syntax could be passed as strings, e.g. '(100'. Return
+        list of pks, or objects with loaded fields when prefetch list (or
+        True for all fields) is passed
+        """
+        probe = cls._astra_probe()
+        args = cls._astra_range_args(probe, field_name, min, max, limit,
+                                     offset, reverse)
+        db = probe._astra_get_db()
+        command = db.zrevrangebyscore if reverse else db.zrangebyscore
+        pks = command(*args)
+        if not prefetch:
+            return pks
+        return cls.get_many(pks, None if prefetch is True else prefetch)
+
+    @classmethod
+    def _astra_range_args(cls, probe, field_name, min, max, limit, offset,
+                          reverse):
+        field = cls._astra_fields.get(field_name)
+        if field is None or not field.options.get('range_index'):
+            raise AttributeError('%s field is not range indexed'
+                                 % field_name)
+
+        def to_score(value, infinity):
+            if value is None:
+                return infinity
+            if isinstance(value, string_types):
+                return value  # Redis syntax, e.g. '(100' or '+inf'
+            return field._convert_set(value)
+
+        min = to_score(min, '-inf')
+        max = to_score(max, '+inf')
+        if reverse:
+            min, max = max, min
+        if limit is None and offset:
+            limit = -1  # All after offset
+        if limit is None:
+            return field.get_range_index_key_name(probe), min, max
+        return field.get_range_index_key_name(probe), min, max, offset, limit
+
+    @classmethod
+    def iter_all(cls, batch_size=500, fields=None):
+        """
+        Iterate over all objects of the model. Keys are found by SCAN, so
+        the database is not blocked, and objects are loaded by get_many
+        with requested fields (all by default) for every batch_size pks:
+
+            for user in UserObject.iter_all(batch_size=1000, fields=['name']):
+                export(user.name)
+
+        Objects are found by their hash, objects of models without hash
+        fields by keys of all fields: the object is reported by the key of
+        its first existing field, checked by one pipelined EXISTS per page
+        of SCAN. As any SCAN, it could return the object twice when keys
+        are changed during the iteration. Primary nodes of Redis Cluster
+        are scanned one by one
+        """
+        probe = cls._astra_probe()
+        db = probe._astra_get_db()
+        match, key_parts = cls._astra_scan_pattern()
+        pks = []
+        for node_db in cluster.get_primary_dbs(db):
+            cursor = 0
+            while True:
+                cursor, keys = node_db.scan(cursor, match=match,
+                                            count=batch_size)
+                found = cls._astra_scan_found(keys, key_parts)
+                pipe = db.pipeline(transaction=False)
+                cls._astra_queue_earlier_keys(pipe, found, key_parts)
+                pks.extend(cls._astra_first_key_pks(found, pipe.execute()))
+                while len(pks) >= batch_size or (pks and not cursor):
+                    batch, pks = pks[:batch_size], pks[batch_size:]
+                    for obj in cls.get_many(batch, fields):
+                        yield obj
+                if not cursor:
+                    break
+
+    @classmethod
+    def _astra_scan_pattern(cls):
+        # Match pattern of keys of all objects and (head, tail) around pk
+        # for the hash or for keys of every field of models without hash
+        probe = cls._astra_probe('\0')  # Marker pk splits the key name
+        if cls._astra_hash_field_names and cls.hash_bucket_size:
+            raise TypeError('Objects in bucket hashes could not be found')
+        if cls._astra_hash_field_names:
+            key_names = [probe._astra_get_hash_field().get_key_name(
+                probe, True)]
+        elif cls._astra_fields:
+            key_names = probe.get_key_names()
+        else:
+            raise AttributeError('This model doesn\'t contain any field')
+        key_parts = [tuple(key_name.split('\0')) for key_name in key_names]
+        if len(key_parts) == 1:
+            head, tail = key_parts[0]
+            return _escape_pattern(head) + '*' + _escape_pattern(tail), \
+                key_parts
+        head = os.path.commonprefix([head for head, _ in key_parts])
+        return _escape_pattern(head) + '*', key_parts
+
+    @staticmethod
+    def _astra_scan_found(keys, key_parts):
+        # (pk, position of the key kind in key_parts) of found object keys
+        found = []
+        for key in keys:
+            for position, (head, tail) in enumerate(key_parts):
+                if key.startswith(head) and key.endswith(tail) and \
+                        len(key) >= len(head) + len(tail):
+                    found.append((key[len(head):len(key) - len(tail)],
+                                  position))
+                    break
+        return found
+
+    @staticmethod
+    def _astra_queue_earlier_keys(pipe, found, key_parts):
+        # Object is reported by its first existing key only, SCAN returns
+        # that key too
+        for pk, position in found:
+            for head, tail in key_parts[:position]:
+                pipe.exists(head + pk + tail)
+
+    @staticmethod
+    def _astra_first_key_pks(found, answers):
+        answers = iter(answers)
+        pks = []
+        for pk, position in found:
+            if not any([next(answers) for _ in range(position)]):
+                pks.append(pk)
+        return pks
+
+    @classmethod
+    def _astra_probe(cls, pk=''):
+        # Object without pk for class level commands, e.g. filter()
+        probe = cls.__new__(cls)
+        Model.__init__(probe, pk)
+        return probe
+
+    @classmethod
+    def prefetch(cls, objects, fields=None):
+        """
+        Load hash and requested scalar fields (all by default) of already
+        created objects by one pipelined round trip. See get_many
+        """
+        prefetch_plan = cls._astra_prefetch_plan(fields)
+        objects = cls._astra_not_loaded(objects, prefetch_plan)
+        if not objects:
+            return
+
+        pipe = objects[0]._astra_get_db().pipeline(transaction=False)
+        cls._astra_queue_prefetch(pipe, objects, prefetch_plan)
+        cls._astra_fill_prefetch(objects, prefetch_plan, pipe.execute())
+
+    @classmethod
+    def _astra_prefetch_plan(cls, fields):
+        # Version is loaded together with hash fields for checked writes
+        astra_fields = cls._astra_fields
+        # Requested hash fields are loaded by HMGET in partial mode
+        partial_hash = (cls.partial_hash_loading and fields is not None) or \
+            bool(cls.hash_bucket_size)
+        if fields is None:
+            fields = astra_fields.keys()
+
+        hash_field_names = []
+        scalar_field_names = []
+        for field_name in fields:
+            if field_name not in astra_fields:
+                raise AttributeError('%s key is not found' % field_name)
+            field = astra_fields[field_name]
+            if isinstance(field, base_fields.BaseHash):
+                hash_field_names.append(field_name)
+            elif isinstance(field, base_fields.BaseField):
+                scalar_field_names.append(field_name)
+        if partial_hash and hash_field_names and cls.version_field and \
+                cls.version_field not in hash_field_names:
+            hash_field_names.append(cls.version_field)
+        return hash_field_names, partial_hash, scalar_field_names
+
+    @classmethod
+    def _astra_not_loaded(cls, objects, prefetch_plan):
+        # Skip duplicates and objects which are loaded already (e.g. they
+        # are shared by identity map)
+        hash_field_names, partial_hash, scalar_field_names = prefetch_plan
+        not_loaded = []
+        seen_ids = set()
+        for obj in objects:
+            if id(obj) in seen_ids:
+                continue
+            seen_ids.add(id(obj))
+            if hash_field_names and not obj._astra_hash_loaded:
+                if not partial_hash or not obj._astra_hash_fields.issuperset(
+                        hash_field_names):
+                    not_loaded.append(obj)
+                    continue
+            for field_name in scalar_field_names:
+                if field_name not in obj._astra_fld_cache:
+                    not_loaded.append(obj)
+                    break
+        return not_loaded
+
+    @classmethod
+    def _astra_queue_prefetch(cls, pipe, objects, prefetch_plan):
+        hash_field_names, partial_hash, scalar_field_names = prefetch_plan
+        astra_fields = cls._astra_fields
+        for obj in objects:
+            if hash_field_names:
+                key_name = astra_fields[hash_field_names[0]].get_key_name(
+                    obj, True)
+                if partial_hash:
+                    pipe.hmget(key_name,
+                               obj._astra_pack_field_names(hash_field_names))
+                else:
+                    pipe.hgetall(key_name)
+            if scalar_field_names and cls.document_storage:
+                pipe.get(astra_fields[scalar_field_names[0]].get_key_name(obj))
+                continue
+            for field_name in scalar_field_names:
+                pipe.get(astra_fields[field_name].get_key_name(obj))
+
+    @classmethod
+    def _astra_fill_prefetch(cls, objects, prefetch_plan, answers):
+        hash_field_names, partial_hash, scalar_field_names = prefetch_plan
+        answers = iter(answers)
+        hash_field = hash_field_names and \
+            cls._astra_fields[hash_field_names[0]]
+        for obj in objects:
+            if hash_field:
+                if partial_hash:
+                    hash_field.fill_hash_fields(obj, hash_field_names,
+                                                next(answers))
+                else:
+                    hash_field.fill_hash(obj, next(answers))
+            if scalar_field_names and cls.document_storage:
+                document = json.loads(next(answers) or '{}')
+                for field_name in scalar_field_names:
+                    obj._astra_fld_cache[field_name] = document.get(field_name)
+                continue
+            for field_name in scalar_field_names:
+                obj._astra_fld_cache[field_name] = next(answers)
+
     def get_db(self):
         raise NotImplementedError('get_db method not implemented')
 
+    def get_client_cache(self):
+        """
+        Return astra.client_cache.ClientCache for share loaded values
+        between objects of read-mostly models
+        """
+        return None
+
     def get_key_prefix(self, ):
-        return '::'.join(['astra', self.__class__.__name__.lower()])
+        return self.key_schema.get_prefix(type(self))
 
     def setattr(self, field_name, value):
+        if self.version_field is not None and self._astra_buffer is None:
+            self.update(**{field_name: value})  # Checked write
+            return value
+
         field = self._get_original_field(field_name)
-        field.assign(value)
+        field.assign(self, value)
 
         if 'validators' in field.options:
             for validator in field.options['validators']:
@@ -160,38 +890,537 @@ class Model(object):
 
     def getattr(self, field_name):
         field = self._get_original_field(field_name)
-        return field.obtain()
+        return field.obtain(self)
 
     def apply(self, field_name, helper_name, *args, **kwargs):
         field = self._get_original_field(field_name)
-        f = field.get_helper_func(helper_name)
+        f = field.get_helper_func(self, helper_name)
         return f(*args, **kwargs)
 
+    def update(self, **kwargs):
+        """
+        Assign many fields by one round trip. All values are validated
+        before sending: hash fields are saved by one HSET and scalar fields
+        by one MSET. Nothing is written when some value is invalid
+        """
+        if self._astra_buffer is not None:  # Already buffered by the caller
+            for k in kwargs:
+                setattr(self, k, kwargs[k])
+            return
+
+        write_buffer = self._astra_make_buffer(
+            version_check=self._astra_get_version_check())
+        self._astra_buffer = write_buffer
+        try:
+            for k in kwargs:
+                setattr(self, k, kwargs[k])
+        except BaseException:
+            self._astra_reset_cache()  # Cache contains unsaved values
+            raise
+        finally:
+            self._astra_buffer = None
+        self._astra_execute(write_buffer)
+
+    def cas(self, field_name, expected, value):
+        """
+        Set hash field to value only when it has expected value (None for
+        not set field), checked and written atomically by one script.
+        Return True when value was set:
+
+            user.cas('status', 'REGISTERED', 'ACTIVATED')
+        """
+        return self.update_if({field_name: expected}, **{field_name: value})
+
+    def update_if(self, conditions, **values):
+        """
+        Set hash fields only when hash has expected values of conditions
+        ({field: value or None for not set field}), checked and written
+        atomically by one script. Return True when values were set:
+
+            user.update_if({'status': 'ACTIVATED'}, status='BANNED', rating=0)
+
+        Inside batch it returns None, the answer is in batch results
+        """
+        command_name, args, saved_values = \
+            self._astra_get_update_if_command(conditions, values)
+        answer = self._astra_send(command_name, *args)
+        return self._astra_fill_update_if(saved_values, answer)
+
+    def hincrby(self, field_name, amount=1, min=None, max=None):
+        """
+        Increment integer hash field only when new value is between
+        inclusive bounds (None for unbounded) by one atomic script. Return
+        new value or None when it would be out of bounds:
+
+            user.hincrby('credits', -10, min=0)
+        """
+        command_name, args = self._astra_get_hincrby_command(
+            field_name, amount, min, max)
+        answer = self._astra_send(command_name, *args)
+        return self._astra_fill_hincrby(field_name, answer)
+
+    def _astra_get_update_if_command(self, conditions, values):
+        if not values:
+            raise ValueError('Values for update are not passed')
+        args = [self.pk, self._astra_get_version_arg(), len(conditions)]
+        for field_name, expected in conditions.items():
+            field = self._astra_get_hash_field(field_name)
+            hash_field_name = self._astra_pack_field_name(field_name)
+            if expected is None:
+                args.extend((hash_field_name, '0', ''))
+            else:
+                args.extend((hash_field_name, '1',
+                             field._convert_set(expected)))
+
+        saved_values = {}
+        for field_name, value in values.items():
+            field = self._astra_get_hash_field(field_name)
+            saved_value = saved_values[field_name] = field._convert_set(value)
+            if field.options.get('index'):
+                index = 'idx', field._get_index_key_prefix(self)
+            elif field.options.get('range_index'):
+                index = 'ridx', field.get_range_index_key_name(self)
+            else:
+                index = '', ''
+            args.extend((self._astra_pack_field_name(field_name),
+                         saved_value) + index)
+        key_name = self._astra_get_hash_field().get_key_name(self, True)
+        return 'evalsha', (scripts.UPDATE_IF, 1, key_name) + tuple(args), \
+            saved_values
+
+    def _astra_fill_update_if(self, saved_values, answer):
+        if self._astra_buffer is not None:  # Answer is not known yet
+            self._astra_reset_buffered_hash()
+            return None
+        if not answer:
+            self._astra_reset_hash_cache()  # Changed by somebody else
+            return False
+        for field_name, saved_value in saved_values.items():
+            self._astra_fields[field_name]._cache_assigned(self, saved_value)
+        if self.version_field is not None:
+            self._astra_fill_script_version(answer)
+        return True
+
+    def _astra_get_hincrby_command(self, field_name, amount, min, max):
+        field = self._astra_get_hash_field(field_name)
+        if not isinstance(field, validators.IntegerValidatorMixin):
+            raise AttributeError('%s is not integer hash field' % field_name)
+        key_names = [field.get_key_name(self, True)]
+        if field.options.get('range_index'):
+            key_names.append(field.get_range_index_key_name(self))
+        args = (self._astra_pack_field_name(field_name),
+                field._convert_set(amount),
+                '' if min is None else field._convert_set(min),
+                '' if max is None else field._convert_set(max), self.pk,
+                self._astra_get_version_arg())
+        return 'evalsha', (scripts.HINCRBY_BOUNDED, len(key_names)) + \
+            tuple(key_names) + args
+
+    def _astra_fill_hincrby(self, field_name, answer):
+        if self._astra_buffer is not None:
+            self._astra_reset_buffered_hash()
+        elif answer is not None:
+            if self.version_field is not None:
+                answer, version = answer
+                self._astra_fill_script_version(version)
+            self._astra_fields[field_name]._cache_assigned(self, str(answer))
+        return answer
+
+    def _astra_reset_buffered_hash(self):
+        # Script result is known after the batch, hash is loaded again
+        self._astra_reset_hash_cache()
+        self._astra_buffer.hash_values.clear()
+        self._astra_buffer.hash_reset = True
+
+    def _astra_get_version_arg(self):
+        # Scripts increment the version of versioned hash
+        if self.version_field is None:
+            return ''
+        return self._astra_pack_field_name(self.version_field)
+
+    def _astra_fill_script_version(self, version):
+        # Cache is current only when nobody wrote between read and script
+        known_version = self._astra_hash.get(self.version_field)
+        if known_version is not None and \
+                int(known_version) != int(version) - 1:
+            self._astra_reset_hash_cache()
+        else:
+            self._astra_cache_version(version)
+
+    @contextmanager
+    def batch(self, transaction=False):
+        """
+        Buffer all writes of this object and send them by one round trip on
+        exit, optionally inside MULTI/EXEC:
+
+            with user.batch(transaction=True):
+                user.name = 'Alice'
+                user.sites_list.lpush(site)
+
+        Assigns, removes and collection mutators, pops too, are buffered
+        (they return None inside the block), while reads are still sent
+        immediately. Blocking pops raise TypeError inside the block.
+        Hash fields assigned in the block are read as assigned. Nothing is
+        sent when the block raises an exception.
+        """
+        if self._astra_buffer is not None:  # Nested batch joins outer one
+            yield self._astra_buffer
+            return
+
+        write_buffer = self._astra_make_buffer(
+            transaction=transaction,
+            version_check=self._astra_get_version_check())
+        self._astra_buffer = write_buffer
+        try:
+            yield write_buffer
+        except BaseException:
+            write_buffer.discard()
+            self._astra_reset_cache()  # Cache contains unsaved values
+            raise
+        finally:
+            self._astra_buffer = None
+        self._astra_execute(write_buffer)
+
+    def _astra_get_version_check(self):
+        if self.version_field is None:
+            return None
+        field = self._astra_fields[self.version_field]
+        expected = None  # Version is not read, nothing to compare with
+        if self._astra_hash_loaded or \
+                self.version_field in self._astra_hash_fields:
+            expected = self._astra_hash.get(self.version_field) or '0'
+        return field.get_key_name(self, True), \
+            self._astra_pack_field_name(self.version_field), expected
+
+    def _astra_refresh_version_check(self, write_buffer):
+        # Version could be read inside the batch, compare with it on flush
+        version_check = self._astra_get_version_check()
+        if version_check is not None and version_check[2] is not None:
+            write_buffer.version_check = version_check
+
+    def _astra_execute(self, write_buffer):
+        if self.ttl_write_through and not write_buffer.is_empty():
+            self._astra_queue_for_keys(write_buffer, 'expire',
+                                       self.default_ttl)
+        self._astra_refresh_version_check(write_buffer)
+        try:
+            write_buffer.execute()
+        except BaseException as exc:
+            if isinstance(exc, VersionConflict):
+                self._astra_count_version_write(conflict=True)
+            self._astra_reset_cache()  # Cache is not the database state
+            raise
+        if write_buffer.hash_reset:
+            self._astra_reset_hash_cache()
+        if write_buffer.version is not None:
+            self._astra_count_version_write(conflict=False)
+            self._astra_fill_version(write_buffer)
+
+    def _astra_fill_version(self, write_buffer):
+        client_cache = self.get_client_cache()
+        if client_cache is not None:
+            client_cache.invalidate(write_buffer.version_check[0])
+        self._astra_cache_version(write_buffer.version)
+
+    def _astra_cache_version(self, version):
+        self._astra_hash[self.version_field] = str(version)
+        if not self._astra_hash_loaded:
+            self._astra_hash_fields.add(self.version_field)
+        self._astra_hash_exist = True
+
+    def _astra_count_version_write(self, conflict):
+        with _version_stats_lock:
+            stats = type(self)._astra_version_stats
+            stats['writes'] += 1
+            if conflict:
+                stats['conflicts'] += 1
+
+    def expire(self, seconds=None):
+        """
+        Set expiry of all keys of the object (default_ttl by default) by one
+        pipeline. Return count of existing keys. Expired object is not
+        removed from indexes, filter() could return its pk
+        """
+        if seconds is None:
+            seconds = self.default_ttl
+        if seconds is None:
+            raise ValueError('Seconds are not passed and default_ttl is not '
+                             'set')
+        return self._astra_send_for_keys('expire', seconds)
+
+    def persist(self):
+        """
+        Remove expiry of all keys of the object by one pipeline. Return
+        count of keys which had expiry
+        """
+        return self._astra_send_for_keys('persist')
+
+    def _astra_send_for_keys(self, command_name, *args):
+        if self._astra_buffer is not None:
+            self._astra_queue_for_keys(self._astra_buffer, command_name,
+                                       *args)
+            return None
+        write_buffer = WriteBuffer(self._astra_get_db())
+        self._astra_queue_for_keys(write_buffer, command_name, *args)
+        return sum(1 for answer in write_buffer.execute() if answer)
+
+    def _astra_queue_for_keys(self, write_buffer, command_name, *args):
+        if self.hash_bucket_size and self._astra_hash_field_names:
+            raise TypeError('Objects in bucket hashes could not expire')
+        for key_name in self.get_key_names():
+            write_buffer.send(command_name, key_name, *args)
+
+    def _astra_reset_cache(self):
+        self._astra_reset_hash_cache()
+        self._astra_fld_cache = {}
+
+    def _astra_reset_hash_cache(self):
+        self._astra_hash = {}
+        self._astra_hash_loaded = False
+        self._astra_hash_fields = set()
+        self._astra_hash_exist = None
+
+    def only(self, *field_names):
+        """
+        Declare hash fields which will be loaded together by one HMGET on
+        first read of any of them, other hash fields are loaded on demand:
+
+            user = UserObject(1).only('name', 'login')
+        """
+        for field_name in field_names:
+            if field_name not in self._astra_hash_field_names:
+                raise AttributeError('%s hash field is not found'
+                                     % field_name)
+        self._astra_hash_only = field_names
+        return self
+
+    def refresh(self, *field_names):
+        """
+        Drop cached values of passed fields (all by default), they will be
+        loaded again on next read
+        """
+        if not field_names:
+            self._astra_reset_cache()
+            return
+
+        for field_name in field_names:
+            if field_name not in self._astra_fields:
+                raise AttributeError('%s key is not found' % field_name)
+            if field_name in self._astra_hash_field_names:
+                self._astra_reset_hash_cache()
+            else:
+                self._astra_fld_cache.pop(field_name, None)
+                if self.document_storage:  # Other values of the document
+                    self._astra_fields[field_name].reset_document_cache(self)
+
+    def get_key_names(self):
+        """
+        All database keys of this object, hash key goes once. Shared bucket
+        hash is not included
+        """
+        key_names = []
+        if self._astra_hash_field_names and not self.hash_bucket_size:
+            key_names.append(
+                self._astra_get_hash_field().get_key_name(self, True))
+        for field_name, field in self._astra_fields.items():
+            if field_name not in self._astra_hash_field_names:
+                key_name = field.get_key_name(self)
+                if key_name not in key_names:  # Document is shared
+                    key_names.append(key_name)
+        return key_names
+
     def remove(self):
-        # Remove all fields and one time delete entire hash
-        is_hash_deleted = False
+        # Unindex, remove fields from the bucket hash and unlink keys by one
+        # transaction as remove_many does, keys alone by one UNLINK
+        db = self._astra_get_db()
+        key_groups = self._astra_get_remove_key_groups(db)
+        if self._astra_buffer is not None:
+            self._astra_queue_remove(self._astra_buffer, [self], key_groups)
+        elif self._astra_indexed_field_names or self.hash_bucket_size or \
+                len(key_groups) > 1:
+            write_buffer = WriteBuffer(
+                db, transaction=not cluster.is_cluster(db))
+            self._astra_queue_remove(write_buffer, [self], key_groups)
+            write_buffer.execute()
+        elif key_groups:
+            db.unlink(*key_groups[0])
+        self._astra_mark_removed()
 
-        astra_fields = getattr(self.__class__, '_astra_fields')
-        for field_name in astra_fields.keys():
-            field = self._get_original_field(field_name)
-            if isinstance(field, base_fields.BaseHash):
-                if not is_hash_deleted:
-                    is_hash_deleted = True
-                    field.db.delete(field.get_key_name(True))
+    def _astra_get_remove_key_groups(self, db):
+        # Keys of the object grouped as in remove_many, client cache
+        # doesn't wait invalidation message of them
+        key_groups = self._astra_chunk_key_groups([self], db)
+        client_cache = self.get_client_cache()
+        if client_cache is not None:
+            for key_names in key_groups:
+                client_cache.invalidate(*key_names)
+            if self.hash_bucket_size and self._astra_hash_field_names:
+                client_cache.invalidate(
+                    self._astra_get_hash_field().get_key_name(self, True))
+        return key_groups
+
+    def _astra_get_bucket_remove_command(self):
+        # Remove fields of the object from the shared bucket hash
+        key_name = self._astra_get_hash_field().get_key_name(self, True)
+        return 'hdel', (key_name,) + tuple(
+            self._astra_pack_field_names(self._astra_hash_field_names))
+
+    def _astra_get_unindex_command(self):
+        # Remove pk from indexes of all indexed fields
+        key_names = [self._astra_get_hash_field().get_key_name(self, True)]
+        args = [self.pk]
+        for field_name in self._astra_indexed_field_names:
+            field = self._astra_fields[field_name]
+            if field.options.get('range_index'):
+                key_names.append(field.get_range_index_key_name(self))
             else:
-                field.remove()
+                args.extend((self._astra_pack_field_name(field_name),
+                             field._get_index_key_prefix(self)))
+        return 'evalsha', (scripts.UNINDEX, len(key_names)) + \
+            tuple(key_names) + tuple(args)
+
+    def _astra_mark_removed(self):
+        self._astra_hash = {}
+        self._astra_hash_loaded = True
+        self._astra_hash_fields = set()
         self._astra_hash_exist = False
+        self._astra_fld_cache = {}
+
+    @classmethod
+    def remove_many(cls, pks, chunk_size=500):
+        """
+        Remove many objects. Keys are deleted by one UNLINK per chunk of
+        objects (per slot with Redis Cluster client, see astra.cluster).
+        Return count of removed keys
+        """
+        removed_count = 0
+        for chunk in cls._astra_chunks(pks, chunk_size):
+            db = chunk[0]._astra_get_db()
+            key_groups = cls._astra_chunk_key_groups(chunk, db)
+            if cls._astra_indexed_field_names or cls.hash_bucket_size or \
+                    len(key_groups) > 1:
+                write_buffer = WriteBuffer(db)
+                cls._astra_queue_remove(write_buffer, chunk, key_groups)
+                removed_count += cls._astra_count_removed(
+                    chunk, key_groups, write_buffer.execute())
+            elif key_groups:
+                removed_count += db.unlink(*key_groups[0])
+        return removed_count
+
+    @classmethod
+    def _astra_queue_remove(cls, write_buffer, objects, key_groups):
+        if cls._astra_indexed_field_names:
+            for obj in objects:
+                command_name, args = obj._astra_get_unindex_command()
+                write_buffer.send(command_name, *args)
+        if cls.hash_bucket_size and cls._astra_hash_field_names:
+            for obj in objects:
+                command_name, args = obj._astra_get_bucket_remove_command()
+                write_buffer.send(command_name, *args)
+        for key_names in key_groups:
+            write_buffer.send('unlink', *key_names)
+
+    @classmethod
+    def _astra_count_removed(cls, objects, key_groups, results):
+        # Object in bucket hash is counted as one removed key
+        removed_count = 0
+        if key_groups:
+            removed_count = sum(results[-len(key_groups):])
+            results = results[:-len(key_groups)]
+        if cls.hash_bucket_size and cls._astra_hash_field_names:
+            removed_count += sum(1 for result in results[-len(objects):]
+                                 if result)
+        return removed_count
+
+    @classmethod
+    def _astra_chunks(cls, pks, chunk_size):
+        # Lists of objects with chunk_size length
+        chunk = []
+        for pk in pks:
+            chunk.append(cls(pk))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _astra_chunk_key_groups(objects, db):
+        # Keys of objects, grouped by slot for multi-key commands in cluster
+        key_names = []
+        for obj in objects:
+            key_names.extend(obj.get_key_names())
+        if not key_names:
+            return []
+        if cluster.is_cluster(db):
+            return cluster.group_by_slot(key_names)
+        return [key_names]
 
     def hash_exist(self):
         if self._astra_hash_exist is None:
-            hash_found = False
-            astra_fields = getattr(self.__class__, '_astra_fields')
-            for field_name in astra_fields.keys():
-                field = self._get_original_field(field_name)
-                if isinstance(field, base_fields.BaseHash):
-                    field.force_check_hash_exists()
-                    hash_found = True
-                    break
-            if not hash_found:
-                raise AttributeError('This model doesn\'t contain any hash')
+            self._astra_get_hash_field().force_check_hash_exists(self)
         return self._astra_hash_exist
+
+    def _astra_get_hash_field(self, field_name=None):
+        # Hash field by name, or any of them for hash-wide commands
+        if field_name is not None:
+            if field_name not in self._astra_hash_field_names:
+                raise AttributeError('%s hash field is not found'
+                                     % field_name)
+            return self._astra_fields[field_name]
+        if not self._astra_hash_field_names:
+            raise AttributeError('This model doesn\'t contain any hash')
+        return self._astra_fields[self._astra_hash_field_names[0]]
+
+
+# Commands which set expiry of the key themselves
+_OWN_TTL_COMMANDS = ('expire', 'setex')
+# Commands which don't create keys, see WriteBuffer.new_key_ttl
+_NOT_CREATING_COMMANDS = ('persist', 'hdel') + _OWN_TTL_COMMANDS
+# Commands which clear expiry of existing key
+_TTL_CLEARING_COMMANDS = ('getset',)
+# Commands which are sent without expiry of the object, see Model._astra_send
+_NO_TTL_COMMANDS = ('delete', 'unlink') + _OWN_TTL_COMMANDS
+
+
+def _get_command_key(command_name, args, kwargs):
+    # First key of the command queued by WriteBuffer
+    if command_name == 'evalsha':
+        return args[2]  # Script, numkeys, keys...
+    if command_name == 'mset':
+        return next(iter(args[0]))
+    return args[0]
+
+
+def _escape_pattern(value):
+    for char in ('\\', '*', '?', '[', ']'):
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+def _make_getter(field_name):
+    def getter(self):
+        return self.getattr(field_name)
+    getter.__name__ = 'get_%s' % field_name
+    return getter
+
+
+def _make_setter(field_name):
+    def setter(self, value):
+        return self.setattr(field_name, value)
+    setter.__name__ = 'set_%s' % field_name
+    return setter
+
+
+def _make_deleter(field_name):
+    def deleter(self):
+        return self.setattr(field_name, None)
+    deleter.__name__ = 'del_%s' % field_name
+    return deleter
+
+
+def _make_helper(field_name, helper_name):
+    def helper(self, *args, **kwargs):
+        return self.apply(field_name, helper_name, *args, **kwargs)
+    helper.__name__ = '%s_%s' % (field_name, helper_name)
+    return helper
@@ -1,2 +1,3 @@
-from astra.model import Model  # NOQA
+from astra.model import Model, VersionConflict  # NOQA
+from astra.key_schema import KeySchema, SHORT_TYPE_TAGS  # NOQA
 from astra.fields import *  # NOQA
@@ -0,0 +1,185 @@
+"""
+Lua scripts for atomic changes of several keys. Scripts are called by
+EVALSHA: single calls send only the sha and load the script when the
+server doesn't know it. Pipelines send SCRIPT LOAD of used scripts at their
+head (see astra.model.WriteBuffer), the source goes with every such
+pipeline: NOSCRIPT answer doesn't stop other commands of the pipeline, so
+it could not be retried. Fields and models send them as command
+('evalsha', (script, numkeys, keys..., args...))
+"""
+import hashlib
+
+from redis.exceptions import NoScriptError
+
+
+class Script(object):
+    def __init__(self, source):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def run(db, script, *args):
+    """ Call the script, it is loaded when the server doesn't know it """
+    try:
+        return db.evalsha(script.sha, *args)
+    except NoScriptError:
+        db.script_load(script.source)
+        return db.evalsha(script.sha, *args)
+
+
+# KEYS: hash, index set of the new value
+# ARGV: field, new value, index key prefix, pk
+ASSIGN_INDEXED = Script("""
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if old then
+    redis.call('SREM', ARGV[3] .. old, ARGV[4])
+end
+local added = redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[4])
+return added
+""")
+
+# KEYS: hash
+# ARGV: field, index key prefix, pk
+REMOVE_INDEXED = Script("""
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if not old then
+    return 0
+end
+redis.call('SREM', ARGV[2] .. old, ARGV[3])
+return redis.call('HDEL', KEYS[1], ARGV[1])
+""")
+
+# KEYS: hash, sorted set of the range index
+# ARGV: field, new value, pk
+ASSIGN_RANGE_INDEXED = Script("""
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+return redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+""")
+
+# KEYS: hash, sorted set of the range index
+# ARGV: field, pk
+REMOVE_RANGE_INDEXED = Script("""
+redis.call('ZREM', KEYS[2], ARGV[2])
+return redis.call('HDEL', KEYS[1], ARGV[1])
+""")
+
+# Remove pk from indexes before the object removal
+# KEYS: hash, then sorted sets of range indexes
+# ARGV: pk, then pairs of field and index key prefix
+UNINDEX = Script("""
+for i = 2, #ARGV, 2 do
+    local old = redis.call('HGET', KEYS[1], ARGV[i])
+    if old then
+        redis.call('SREM', ARGV[i + 1] .. old, ARGV[1])
+    end
+end
+for i = 2, #KEYS do
+    redis.call('ZREM', KEYS[i], ARGV[1])
+end
+return 0
+""")
+
+# Set hash fields when all conditions are true. Return 1 (new version
+# when version field is passed) or 0
+# KEYS: hash
+# ARGV: pk, version field or '', count of conditions, conditions as
+#     triples: field, '1' and expected value (or '0' and '' for not set
+#     field), then values as quads: field, value, index kind ('idx',
+#     'ridx' or ''), index key prefix or sorted set of the range index
+UPDATE_IF = Script("""
+local i = 4
+for _ = 1, tonumber(ARGV[3]) do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if ARGV[i + 1] == '1' then
+        if current ~= ARGV[i + 2] then
+            return 0
+        end
+    elseif current then
+        return 0
+    end
+    i = i + 3
+end
+while i <= #ARGV do
+    local field, value, index = ARGV[i], ARGV[i + 1], ARGV[i + 3]
+    if ARGV[i + 2] == 'idx' then
+        local old = redis.call('HGET', KEYS[1], field)
+        if old then
+            redis.call('SREM', index .. old, ARGV[1])
+        end
+        redis.call('SADD', index .. value, ARGV[1])
+    elseif ARGV[i + 2] == 'ridx' then
+        redis.call('ZADD', index, value, ARGV[1])
+    end
+    redis.call('HSET', KEYS[1], field, value)
+    i = i + 4
+end
+if ARGV[2] ~= '' then
+    return redis.call('HINCRBY', KEYS[1], ARGV[2], 1)
+end
+return 1
+""")
+
+# Increment integer hash field when result is in bounds. Return new value
+# (with new version when version field is passed) or nil when it is out of
+# bounds
+# KEYS: hash, optionally sorted set of the range index
+# ARGV: field, increment, min or '', max or '', pk, version field or ''
+HINCRBY_BOUNDED = Script("""
+local value = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+value = value + tonumber(ARGV[2])
+if (ARGV[3] ~= '' and value < tonumber(ARGV[3])) or
+        (ARGV[4] ~= '' and value > tonumber(ARGV[4])) then
+    return nil
+end
+local saved_value = string.format('%d', value)
+redis.call('HSET', KEYS[1], ARGV[1], saved_value)
+if KEYS[2] then
+    redis.call('ZADD', KEYS[2], saved_value, ARGV[5])
+end
+if ARGV[6] ~= '' then
+    return {value, redis.call('HINCRBY', KEYS[1], ARGV[6], 1)}
+end
+return value
+""")
+
+# Set fields of the JSON document with scalar fields of the object, expiry
+# of the document is kept
+# KEYS: document
+# ARGV: pairs of field and value
+DOCUMENT_SET = Script("""
+local document = redis.call('GET', KEYS[1])
+local ttl = redis.call('PTTL', KEYS[1])
+document = document and cjson.decode(document) or {}
+for i = 1, #ARGV, 2 do
+    document[ARGV[i]] = ARGV[i + 1]
+end
+local result = redis.call('SET', KEYS[1], cjson.encode(document))
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[1], ttl)
+end
+return result
+""")
+
+# Remove fields of the document, the key is removed with the last field
+# KEYS: document
+# ARGV: fields
+DOCUMENT_DEL = Script("""
+local document = redis.call('GET', KEYS[1])
+if not document then
+    return 0
+end
+document = cjson.decode(document)
+for i = 1, #ARGV do
+    document[ARGV[i]] = nil
+end
+if next(document) == nil then
+    return redis.call('DEL', KEYS[1])
+end
+local ttl = redis.call('PTTL', KEYS[1])
+redis.call('SET', KEYS[1], cjson.encode(document))
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[1], ttl)
+end
+return 1
+""")
@@ -78,16 +78,15 @@ class DateTimeValidatorMixin(DateValidatorMixin):
 
 class EnumValidatorMixin(object):
     def __init__(self, enum=list(), default='', **kwargs):
-        if 'instance' not in kwargs:
-            # Instant when user define EnumHash. Definition test
-            if len(enum) < 1:
-                raise AttributeError('You\'re must define enum list')
-            for item in enum:
-                if not isinstance(item, string_types) or item == '':
-                    raise ValueError('Enum list item must be string')
-            if default not in enum:
-                raise ValueError('The default value is not present '
-                                 'in the enum list')
+        # Field is created once when user define EnumHash. Definition test
+        if len(enum) < 1:
+            raise AttributeError('You\'re must define enum list')
+        for item in enum:
+            if not isinstance(item, string_types) or item == '':
+                raise ValueError('Enum list item must be string')
+        if default not in enum:
+            raise ValueError('The default value is not present '
+                             'in the enum list')
         self._enum = enum
         self._enum_default = default
         super(EnumValidatorMixin, self).__init__(
@@ -103,38 +102,16 @@ class EnumValidatorMixin(object):
 
 
 class ForeignObjectValidatorMixin(object):
-    def __init__(self, to=None, defaultPk=None, **kwargs):
+    def __init__(self, to=None, defaultPk=None, prefetch=None, **kwargs):
         super(ForeignObjectValidatorMixin, self).__init__(
-            to=to, defaultPk=defaultPk, **kwargs)
+            to=to, defaultPk=defaultPk, prefetch=prefetch, **kwargs)
         self._defaultPk = defaultPk
+        self._prefetch_fields = prefetch  # Fields list or True for all
 
-        if to is None:
-            return
-
-        if 'instance' in kwargs:
-            # Replace _to method to foreign constructor
-            if isinstance(to, string_types):
-                import sys
-                to_path = to.split('.')
-                object_rel = to_path.pop()
-                package_rel = '.'.join(to_path)
-
-                if PY2:
-                    import imp as _imp
-                else:
-                    import _imp
-
-                _imp.acquire_lock()
-                module1 = __import__('.'.join(to_path))
-                _imp.release_lock()
-
-                try:
-                    self._to = getattr(sys.modules[package_rel], object_rel)
-                except AttributeError:
-                    raise AttributeError('Package "%s" not contain model %s' %
-                                        (package_rel, object_rel))
-            else:
-                self._to = to
+        # Model could be passed by import path, e.g. 'app.models.User',
+        # it is imported on first use (see _get_related_model)
+        self._to_path = to if isinstance(to, string_types) else None
+        self._to = None if self._to_path else to
 
     def _convert_set(self, value):
         from astra import model
@@ -150,16 +127,74 @@ class ForeignObjectValidatorMixin(object):
     def _convert_get(self, value):
         return value
 
-    def _to(self, key):
-        # Return string key when for models.ForeignKey not specified "to"
-        # attribute. e.g. author_id = models.ForeignKey()
-        return key
+    def _get_related_model(self):
+        if self._to is None and self._to_path is not None:
+            self._to = _import_model(self._to_path)
+        return self._to
+
+    def _prefetch_related(self, objects, prefetch=None):
+        """
+        Load related objects by one pipelined round trip. prefetch is list
+        of fields or True for all of them, field's option is used for None
+        """
+        prefetch_plan = self._get_prefetch_plan(objects, prefetch)
+        if prefetch_plan:
+            model_cls, objects, fields = prefetch_plan
+            model_cls.prefetch(objects, fields)
+
+    def _get_prefetch_plan(self, objects, prefetch):
+        if prefetch is None:
+            prefetch = self._prefetch_fields
+        if not prefetch:
+            return None
+
+        from astra import model
+        related_model = self._get_related_model()
+        if not (isinstance(related_model, type) and
+                issubclass(related_model, model.Model)):
+            return None  # Plain keys without relation model
+        objects = [obj for obj in objects if obj is not None]
+        return related_model, objects, None if prefetch is True else prefetch
 
     def _to_wrapper(self, key):
         if key is None:
             if self._defaultPk is not None:
-                return self._to(self._defaultPk)
+                return self._make_related(self._defaultPk)
             else:
                 return None
 
-        return self._to(key)
+        return self._make_related(key)
+
+    def _make_related(self, key):
+        from astra import model
+        related_model = self._get_related_model()
+        if related_model is None:
+            # Return string key when for models.ForeignKey not specified "to"
+            # attribute. e.g. author_id = models.ForeignKey()
+            return key
+        if isinstance(related_model, type) and \
+                issubclass(related_model, model.Model):
+            return related_model.from_pk(key)  # Shared by identity map
+        return related_model(key)
+
+
+def _import_model(to):
+    import sys
+    to_path = to.split('.')
+    object_rel = to_path.pop()
+    package_rel = '.'.join(to_path)
+
+    if PY2:
+        import imp as _imp
+    else:
+        import _imp
+
+    _imp.acquire_lock()
+    module1 = __import__('.'.join(to_path))
+    _imp.release_lock()
+
+    try:
+        return getattr(sys.modules[package_rel], object_rel)
+    except AttributeError:
+        raise AttributeError('Package "%s" not contain model %s' %
+                             (package_rel, object_rel))
@@ -53,10 +53,11 @@ setup(
         'Programming Language :: Python :: 3.5',
         ],
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
-    install_requires=['redis>=2.9.1', 'six>=1.10.0'],
+    install_requires=['redis>=3.5.0', 'six>=1.10.0'],
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage', 'mock'],
+        'asyncio': ['redis>=4.2.0'],
     },
     tests_require=['pytest>=2.5.0'],
     cmdclass={'test': PyTest},
@@ -0,0 +1,343 @@
+import asyncio
+import pytest
+
+redis_asyncio = pytest.importorskip('redis.asyncio')
+
+from astra import aio  # NOQA
+
+
+class AsyncSiteObject(aio.Model):
+    name = aio.CharHash()
+
+    def get_db(self):
+        return db
+
+
+class AsyncUserObject(aio.Model):
+    name = aio.CharHash()
+    rating = aio.IntegerHash()
+    credits_test = aio.IntegerField()
+    is_admin = aio.BooleanField()
+    site = aio.ForeignHash(to=AsyncSiteObject)
+    site_field = aio.ForeignField(to=AsyncSiteObject)
+    sites_list = aio.List(to=AsyncSiteObject)
+    sites_set = aio.Set(to=AsyncSiteObject)
+    sites_sorted_set = aio.SortedSet(to=AsyncSiteObject)
+
+    def get_db(self):
+        return db
+
+
+class AsyncIndexedObject(aio.Model):
+    login = aio.CharHash(index=True)
+    active = aio.BooleanHash(index=True)
+    rating = aio.IntegerHash(range_index=True)
+
+    def get_db(self):
+        return db
+
+
+class AsyncVersionedObject(aio.Model):
+    name = aio.CharHash()
+    version = aio.IntegerHash()
+    version_field = 'version'
+
+    def get_db(self):
+        return db
+
+
+def run(coroutine_function):
+    async def wrapper():
+        global db
+        db = redis_asyncio.Redis(host='127.0.0.1', decode_responses=True)
+        await db.flushall()
+        try:
+            await coroutine_function()
+        finally:
+            await db.connection_pool.disconnect()
+    asyncio.run(wrapper())
+
+
+class TestAsyncModel(object):
+    def test_set_and_read_attrs(self):
+        async def test():
+            user1 = await AsyncUserObject.create(1, name='Alice', rating=5)
+            assert await user1.name == 'Alice'
+            await user1.set_credits_test(10)
+            await user1.setattr('is_admin', True)
+
+            user1_read = AsyncUserObject(1)
+            assert await user1_read.name == 'Alice'
+            assert await user1_read.rating == 5
+            assert await user1_read.credits_test == 10
+            assert await user1_read.is_admin is True
+            assert await user1_read.hash_exist() is True
+        run(test)
+
+    def test_direct_assign_is_forbidden(self):
+        async def test():
+            user1 = AsyncUserObject(1)
+            with pytest.raises(AttributeError):
+                user1.name = 'Alice'
+            with pytest.raises(TypeError):
+                AsyncUserObject(1, name='Alice')
+        run(test)
+
+    def test_validation(self):
+        async def test():
+            user1 = AsyncUserObject(1)
+            assert await user1.name == ''  # Hash is loaded and cached
+            with pytest.raises(ValueError):
+                await user1.update(name='Alice', rating='invalid')
+            assert await db.keys() == []
+            assert await user1.name == ''  # Earlier value is not cached
+        run(test)
+
+    def test_helpers(self):
+        async def test():
+            user1 = await AsyncUserObject.create(1, credits_test=1)
+            assert await user1.credits_test_incr(2) == 3
+            assert await user1.credits_test == 3
+        run(test)
+
+    def test_foreign_fields(self):
+        async def test():
+            site = await AsyncSiteObject.create(1, name='redis.io')
+            await AsyncUserObject.create(1, site=site, site_field=site)
+            user1 = AsyncUserObject(1)
+            assert await (await user1.site).name == 'redis.io'
+            assert (await user1.site_field).pk == '1'
+            await user1.set_site(None)
+            assert await user1.site is None
+        run(test)
+
+    def test_collections(self):
+        async def test():
+            user1 = AsyncUserObject(1)
+            sites = [await AsyncSiteObject.create(i, name='site%s' % i)
+                     for i in range(3)]
+            await user1.sites_list.rpush(*sites)
+            await user1.sites_set.sadd(sites[0])
+            await user1.sites_sorted_set.zadd({sites[1]: 5})
+
+            assert await user1.sites_list.llen() == 3
+            read_sites = await user1.sites_list.lrange(0, -1, prefetch=True)
+            assert [await s.name for s in read_sites] == \
+                ['site0', 'site1', 'site2']
+            assert (await user1.sites_list[1]).pk == '1'
+            assert await user1.sites_set.smembers() == [sites[0]]
+            assert (await user1.sites_sorted_set[5]).pk == '1'
+        run(test)
+
+    def test_batch_and_remove(self):
+        async def test():
+            user1 = AsyncUserObject(1)
+            async with user1.batch(transaction=True):
+                await user1.update(name='Alice', credits_test=5)
+                assert await user1.sites_set.sadd('1') is None
+            assert await AsyncUserObject(1).name == 'Alice'
+            assert len(await db.keys()) == 3
+
+            await user1.remove()
+            assert await db.keys() == []
+        run(test)
+
+    def test_get_many_and_remove_many(self):
+        async def test():
+            for i in range(3):
+                await AsyncUserObject.create(i, name='User%s' % i,
+                                             credits_test=i)
+            users = await AsyncUserObject.get_many(range(3))
+            assert [await u.name for u in users] == ['User0', 'User1',
+                                                     'User2']
+            assert await users[2].credits_test == 2
+            assert await AsyncUserObject.remove_many(range(3)) == 6
+        run(test)
+
+    def test_filter(self):
+        async def test():
+            await AsyncIndexedObject.create(1, login='alice', active=True)
+            obj = await AsyncIndexedObject.create(2, login='bob', active=True)
+            await obj.set_active(False)
+            assert await AsyncIndexedObject.filter(active=True) == ['1']
+            objects = await AsyncIndexedObject.filter(active=False,
+                                                      prefetch=True)
+            assert [await o.login for o in objects] == ['bob']
+
+            await obj.remove()
+            assert await AsyncIndexedObject.remove_many([1]) == 1
+            assert await AsyncIndexedObject.filter(active=True) == []
+            assert await db.keys() == []
+        run(test)
+
+    def test_range(self):
+        async def test():
+            for i in range(3):
+                await AsyncIndexedObject.create(i, login='u%s' % i,
+                                                rating=i * 10)
+            assert await AsyncIndexedObject.range('rating', 10) == ['1', '2']
+            objects = await AsyncIndexedObject.range('rating', reverse=True,
+                                                     limit=1, prefetch=True)
+            assert [await o.login for o in objects] == ['u2']
+            assert await AsyncIndexedObject.remove_many(range(3)) == 3
+            assert await db.keys() == []
+        run(test)
+
+    def test_iter_all(self):
+        async def test():
+            for i in range(5):
+                await AsyncSiteObject.create(i, name='Site%s' % i)
+            names = [await site.name async for site in
+                     AsyncSiteObject.iter_all(batch_size=2)]
+            assert sorted(names) == ['Site%s' % i for i in range(5)]
+        run(test)
+
+    def test_collection_iteration(self):
+        async def test():
+            user1 = AsyncUserObject(1)
+            for i in range(5):
+                await AsyncSiteObject.create(i, name='Site%s' % i)
+                await user1.sites_list.rpush(AsyncSiteObject(i))
+                await user1.sites_set.sadd(AsyncSiteObject(i))
+            assert [site.pk async for site in user1.sites_list] == \
+                [str(i) for i in range(5)]
+            names = []
+            async for chunk in user1.sites_set.iter_chunks(2,
+                                                           prefetch=True):
+                names.extend([await site.name for site in chunk])
+            assert sorted(names) == ['Site%s' % i for i in range(5)]
+        run(test)
+
+    def test_conditional_update(self):
+        async def test():
+            obj = await AsyncIndexedObject.create(1, login='alice', rating=1)
+            assert await obj.cas('login', 'alice', 'bob') is True
+            assert await obj.cas('login', 'alice', 'carol') is False
+            assert await AsyncIndexedObject.filter(login='bob') == ['1']
+            assert await obj.hincrby('rating', 5, max=6) == 6
+            assert await obj.hincrby('rating', 1, max=6) is None
+            assert await obj.update_if({'rating': 6}, active=True) is True
+            assert await AsyncIndexedObject.filter(active=True) == ['1']
+        run(test)
+
+    def test_version(self):
+        async def test():
+            await AsyncVersionedObject.create(1, name='a')
+            first = AsyncVersionedObject(1)
+            second = AsyncVersionedObject(1)
+            assert await first.name == 'a'
+            assert await second.name == 'a'
+            async with first.batch():
+                await first.set_name('b')
+            with pytest.raises(aio.model.VersionConflict):
+                await second.setattr('name', 'c')
+            assert await second.name == 'b'
+            await second.update(name='c')
+            assert await AsyncVersionedObject(1).version == 3
+            third = AsyncVersionedObject(1)
+            with pytest.raises(aio.model.VersionConflict):
+                async with third.batch():
+                    name = await third.name  # Read inside the batch
+                    await AsyncVersionedObject(1).update(name='d')
+                    await third.set_name(name + 'e')
+            assert await AsyncVersionedObject(1).name == 'd'
+        run(test)
+
+    def test_document_storage(self):
+        class AsyncDocumentObject(aio.Model):
+            name = aio.CharField()
+            credits = aio.IntegerField()
+            document_storage = True
+
+            def get_db(self):
+                return db
+
+        async def test():
+            obj = await AsyncDocumentObject.create(1, name='Alice',
+                                                   credits=10)
+            assert await db.keys() == ['astra::asyncdocumentobject::doc::1']
+            obj_read = AsyncDocumentObject(1)
+            assert await obj_read.credits == 10
+            await db.delete('astra::asyncdocumentobject::doc::1')
+            assert await obj_read.name == 'Alice'  # Read by the same GET
+            await obj.update(name='Alice', credits=10)
+            await AsyncDocumentObject.name.remove(obj)
+            objects = await AsyncDocumentObject.get_many([1])
+            assert await objects[0].name == ''
+            assert await objects[0].credits == 10
+        run(test)
+
+    def test_hash_bucket(self):
+        class AsyncBucketObject(aio.Model):
+            name = aio.CharHash()
+            hash_bucket_size = 10
+
+            def get_db(self):
+                return db
+
+        async def test():
+            await AsyncBucketObject.create(1, name='Alice')
+            await AsyncBucketObject.create(2, name='Bob')
+            assert await db.keys() == ['astra::asyncbucketobject::bucket::0']
+            assert await AsyncBucketObject(1).name == 'Alice'
+            assert await AsyncBucketObject(3).hash_exist() is False
+            await AsyncBucketObject(1).remove()
+            assert await AsyncBucketObject(1).hash_exist() is False
+            assert await AsyncBucketObject.remove_many([2]) == 1
+            assert await db.keys() == []
+        run(test)
+
+    def test_expire(self):
+        class AsyncSessionObject(aio.Model):
+            token = aio.CharField()
+            pages = aio.List()
+            default_ttl = 100
+            ttl_write_through = True
+
+            def get_db(self):
+                return db
+
+        async def test():
+            session = await AsyncSessionObject.create(1, token='abc')
+            assert await db.ttl('astra::asyncsessionobject::fld::1::token') \
+                == 100
+            assert await session.pages.rpush('/') == 1
+            assert await db.ttl('astra::asyncsessionobject::list::1::pages') \
+                == 100
+            assert await session.persist() == 2
+            assert await session.expire(10) == 2
+
+            AsyncSessionObject.ttl_write_through = False
+            await session.set_token('def')  # Keeps expiry
+            assert await db.ttl('astra::asyncsessionobject::fld::1::token') \
+                == 10
+            async with session.batch():
+                await session.set_token('ghi')
+                await session.del_pages()
+                await session.pages.rpush('/')  # Created again
+            assert await db.ttl('astra::asyncsessionobject::list::1::pages') \
+                == 100
+            await db.expire('astra::asyncsessionobject::fld::1::token', 10)
+            assert await session.token_append('jkl') == 6  # Keeps expiry
+            assert await db.ttl('astra::asyncsessionobject::fld::1::token') \
+                == 10
+            await AsyncSessionObject.token.remove(session)
+            assert await session.token_setnx('abc') is True
+            assert await db.ttl('astra::asyncsessionobject::fld::1::token') \
+                == 100
+        run(test)
+
+    def test_identity_map_per_task(self):
+        from astra.identity_map import IdentityMap, get_identity_map
+
+        async def task(started, other_started):
+            with IdentityMap() as identity_map:
+                started.set()
+                await other_started.wait()
+                assert get_identity_map() is identity_map
+            assert get_identity_map() is None
+
+        async def test():
+            first, second = asyncio.Event(), asyncio.Event()
+            await asyncio.gather(task(first, second), task(second, first))
+        run(test)
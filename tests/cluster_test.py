@@ -0,0 +1,162 @@
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import pytest
+
+redis_cluster = pytest.importorskip('redis.cluster')
+
+import redis  # NOQA
+from astra import models  # NOQA
+from astra.cluster import get_primary_dbs, key_slot  # NOQA
+
+if not shutil.which('redis-server'):
+    pytest.skip('redis-server is not found', allow_module_level=True)
+
+NODES_COUNT = 3
+
+
+def _free_port():
+    while True:
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        if port + 10000 <= 65535:  # Port of the cluster bus
+            return port
+
+
+@pytest.fixture(scope='module')
+def cluster_db():
+    """ Local cluster of primary nodes, each one is a redis-server process """
+    work_dir = tempfile.mkdtemp()
+    ports = [_free_port() for _ in range(NODES_COUNT)]
+    processes = [subprocess.Popen(
+        ['redis-server', '--port', str(port), '--cluster-enabled', 'yes',
+         '--cluster-config-file', 'nodes-%s.conf' % port, '--save', '',
+         '--appendonly', 'no'],
+        cwd=work_dir, stdout=subprocess.DEVNULL) for port in ports]
+    try:
+        nodes = [redis.Redis(host='127.0.0.1', port=port) for port in ports]
+        for node in nodes:
+            _wait(lambda: node.ping())
+        slots = list(range(redis_cluster.REDIS_CLUSTER_HASH_SLOTS))
+        for i, node in enumerate(nodes):
+            node.cluster('SET-CONFIG-EPOCH', i + 1)
+            node.cluster('ADDSLOTS', *slots[i::NODES_COUNT])
+            node.cluster('MEET', '127.0.0.1', ports[0])
+        for node in nodes:
+            _wait(lambda: node.cluster('INFO')['cluster_state'] == 'ok')
+        db = redis_cluster.RedisCluster(host='127.0.0.1', port=ports[0],
+                                        decode_responses=True)
+        yield db
+        db.close()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work_dir)
+
+
+def _wait(condition, timeout=10):
+    started_at = time.time()
+    while time.time() - started_at < timeout:
+        try:
+            if condition():
+                return
+        except redis.ConnectionError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError('Cluster is not ready')
+
+
+class ClusterSite(models.Model):
+    name = models.CharHash()
+    key_schema = models.KeySchema(hash_tags=True)
+
+    def get_db(self):
+        return db
+
+
+class ClusterUser(models.Model):
+    name = models.CharHash()
+    balance = models.IntegerHash()
+    version = models.IntegerHash()
+    credits_test = models.IntegerField()
+    site = models.ForeignField(to=ClusterSite)
+    sites_list = models.List(to=ClusterSite)
+    key_schema = models.KeySchema(hash_tags=True)
+    version_field = 'version'
+
+    def get_db(self):
+        return db
+
+
+class ClusterDocument(models.Model):
+    name = models.CharField()
+    credits = models.IntegerField()
+    key_schema = models.KeySchema(hash_tags=True)
+    document_storage = True
+    default_ttl = 100
+
+    def get_db(self):
+        return db
+
+
+class TestCluster(object):
+    @pytest.fixture(autouse=True)
+    def setup_db(self, cluster_db):
+        global db
+        db = cluster_db
+        for node_db in get_primary_dbs(db):
+            node_db.flushall()
+
+    def test_objects_on_all_nodes(self):
+        for i in range(30):
+            user = ClusterUser(i, name='Name%s' % i, credits_test=i,
+                               site=ClusterSite(i, name='Site'))
+            user.sites_list.rpush(ClusterSite(i))
+            assert len(set(key_slot(key)
+                           for key in user.get_key_names())) == 1
+        assert all(node_db.dbsize() for node_db in get_primary_dbs(db))
+        users = ClusterUser.get_many(range(30), ['name', 'credits_test'])
+        assert [(u.name, u.credits_test) for u in users] == \
+            [('Name%s' % i, i) for i in range(30)]
+        assert sorted(int(u.pk) for u in ClusterUser.iter_all(
+            batch_size=7)) == list(range(30))
+        assert ClusterUser(3).sites_list.lrange(0, -1)[0].pk == '3'
+
+    def test_update_and_batch(self):
+        user = ClusterUser(1, name='Alice', balance=10, credits_test=1)
+        user.update(balance=20, credits_test=2)
+        with user.batch(transaction=True):
+            user.name = 'Bob'
+            user.credits_test = 3
+        user = ClusterUser(1)
+        assert (user.name, user.balance, user.credits_test) == \
+            ('Bob', 20, 3)
+        assert user.version == 3
+        stale = ClusterUser(1)
+        stale.balance  # Version is read
+        user.update(balance=30)
+        with pytest.raises(models.VersionConflict):
+            stale.update(balance=40)
+
+    def test_document_and_ttl(self):
+        doc = ClusterDocument(1, name='Alice', credits=10)
+        key_name, = doc.get_key_names()
+        assert 0 < db.ttl(key_name) <= 100
+        assert doc.persist() == 1
+        assert db.ttl(key_name) == -1
+        doc.credits = 20
+        ClusterDocument.name.remove(doc)
+        doc = ClusterDocument(1)
+        assert (doc.name, doc.credits) == ('', 20)
+
+    def test_remove_many(self):
+        for i in range(30):
+            ClusterUser(i, name='Name%s' % i, credits_test=i)
+        assert ClusterUser.remove_many(range(30), chunk_size=10) == 60
+        assert not any(node_db.dbsize() for node_db in get_primary_dbs(db))
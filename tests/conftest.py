@@ -0,0 +1,6 @@
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    collect_ignore.append('aio_test.py')  # asyncio models syntax
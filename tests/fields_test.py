@@ -23,6 +23,23 @@ def patched_send_command(self, *args):
 redis.Connection.send_command = patched_send_command
 
 
+# Pipelines send all commands by one packed request, collect them too
+def patch_pipeline_method(method_name):
+    original_method = getattr(redis.client.Pipeline, method_name)
+
+    def patched_method(self, connection, stack, raise_on_error):
+        if 'commands' in globals():
+            pipelines.append([args for args, options in stack])
+            commands.extend(pipelines[-1])
+        return original_method(self, connection, stack, raise_on_error)
+
+    setattr(redis.client.Pipeline, method_name, patched_method)
+
+
+patch_pipeline_method('_execute_pipeline')
+patch_pipeline_method('_execute_transaction')
+
+
 # Common class for simplify testing
 class CommonHelper(object):
     def setup(self):
@@ -33,7 +50,7 @@ class CommonHelper(object):
         return db
 
     def setup_method(self, test_method):
-        global db, commands
+        global db, commands, pipelines
         db = redis.StrictRedis(host='127.0.0.1', decode_responses=True)
 
         UserObject.get_db = self._get_db
@@ -42,6 +59,7 @@ class CommonHelper(object):
 
         db.flushall()
         commands = []
+        pipelines = []
 
     def teardown_method(self, test_method):
         pass
@@ -50,6 +68,9 @@ class CommonHelper(object):
     def assert_commands_count(self, count):
         assert len(commands) == count, commands
 
+    def assert_pipelines_count(self, count):
+        assert len(pipelines) == count, pipelines
+
     def assert_keys_count(self, count):
         assert len(db.keys()) == count
 
@@ -341,6 +362,28 @@ class TestEnumHash(CommonHelper):
 
 
 class TestHashDelete(CommonHelper):
+    def test_remove_by_one_unlink(self):
+        user1 = UserObject(1, name='Alice', credits_test=5, is_admin=True)
+        user1.sites_list.lpush('1')
+        user1.sites_set.sadd('1')
+        user1.sites_sorted_set.zadd({'1': 1})
+        del commands[:]
+        user1.remove()
+        self.assert_commands_count(1)
+        assert commands[0][0] == 'UNLINK'
+        assert 'astra::userobject::hash::1' in commands[0]
+        assert 'astra::userobject::list::1::sites_list' in commands[0]
+        self.assert_keys_count(0)
+
+    def test_remove_many(self):
+        for i in range(5):
+            UserObject(i, name='User%s' % i, credits_test=i)
+        SiteObject(1, name='redis.io')
+        del commands[:]
+        assert UserObject.remove_many(range(5), chunk_size=2) == 10
+        self.assert_commands_count(3)  # chunks: 2 + 2 + 1 objects
+        self.assert_keys_count(1)  # site is still here
+
     def test_deleted_operations_count(self):
         class SampleObject1(models.Model):
             name = models.CharHash()
@@ -350,9 +393,9 @@ class TestHashDelete(CommonHelper):
             def get_db(self):
                 return db
         test_object = SampleObject1(1, name='Alice', rating=22, field1='test')
-        self.assert_commands_count(3)  # two times set hash + field
+        self.assert_commands_count(2)  # one time set hash + field
         test_object.remove()
-        self.assert_commands_count(5)  # one time delete entire hash + field
+        self.assert_commands_count(3)  # one UNLINK for hash and field
 
 
 class TestLinkField(CommonHelper):
@@ -552,6 +595,55 @@ class TestList(CommonHelper):
         self.assert_keys_count(0)
 
 
+class TestCollectionIteration(CommonHelper):
+    def test_list(self):
+        user1 = UserObject(1)
+        for i in range(7):
+            SiteObject(i, name='Site%s' % i)
+            user1.sites_list.rpush(SiteObject(i))
+
+        chunks = list(user1.sites_list.iter_chunks(3))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert [site.pk for site in user1.sites_list] == \
+            [str(i) for i in range(7)]
+
+    def test_chunks_prefetch(self):
+        user1 = UserObject(1)
+        for i in range(4):
+            SiteObject(i, name='Site%s' % i)
+            user1.sites_list.rpush(SiteObject(i))
+
+        global pipelines, commands
+        pipelines = []
+        names = []
+        for chunk in user1.sites_list.iter_chunks(2, prefetch=['name']):
+            commands = []
+            names.extend(site.name for site in chunk)
+            assert commands == []  # Loaded by chunk
+        assert names == ['Site0', 'Site1', 'Site2', 'Site3']
+        self.assert_pipelines_count(2)
+
+    def test_sets(self):
+        user1 = UserObject(1)
+        pks = ['site%s' % i for i in range(300)]  # Not compact intset
+        for i, pk in enumerate(pks):
+            user1.sites_set.sadd(SiteObject(pk))
+            user1.sites_sorted_set.zadd({SiteObject(pk): i})
+
+        assert sorted(site.pk for site in user1.sites_set) == sorted(pks)
+        assert sorted(site.pk for site in user1.sites_sorted_set) == \
+            sorted(pks)
+        chunks = list(user1.sites_set.iter_chunks(100))
+        assert len(chunks) > 1
+        assert sum(len(chunk) for chunk in chunks) == 300
+
+    def test_empty(self):
+        user1 = UserObject(1)
+        assert list(user1.sites_list) == []
+        assert list(user1.sites_set.iter_chunks()) == []
+        assert list(user1.sites_sorted_set) == []
+
+
 class TestSimpleSet(CommonHelper):
     def test_without_foreign(self):
         site = SiteObject(1)
@@ -947,3 +1039,1457 @@ class TestValidators(CommonHelper):
 
         test_object = SampleObject1(1, value=1234)
         mock.assert_called_once_with(1234)
+
+
+class TestGetMany(CommonHelper):
+    def test_load_many_objects(self):
+        UserObject(1, name='Alice', credits_test=5)
+        UserObject(2, name='Bob', is_admin=True)
+        del pipelines[:]
+
+        users = UserObject.get_many([1, 2, 3])
+        self.assert_pipelines_count(1)
+        del commands[:]
+        assert [u.pk for u in users] == ['1', '2', '3']
+        assert users[0].name == 'Alice'
+        assert users[0].credits_test == 5
+        assert users[1].name == 'Bob'
+        assert users[1].is_admin is True
+        assert users[2].name == ''
+        assert users[2].hash_exist() is False
+        self.assert_commands_count(0)  # Nothing was loaded lazily
+
+    def test_load_only_requested_fields(self):
+        UserObject(1, name='Alice', credits_test=5, is_admin=True)
+        user1 = UserObject.get_many([1], fields=['name', 'credits_test'])[0]
+        del commands[:]
+        assert user1.name == 'Alice'
+        assert user1.credits_test == 5
+        self.assert_commands_count(0)
+        assert user1.is_admin is True
+        self.assert_commands_count(1)
+
+    def test_prefetched_value_after_changes(self):
+        UserObject(1, credits_test=5)
+        user1 = UserObject.get_many([1])[0]
+        user1.credits_test = 7
+        assert user1.credits_test == 7
+        user1.credits_test_incr(3)
+        assert user1.credits_test == 10
+        user1.remove()
+        assert user1.credits_test == 0
+
+    def test_empty_pks_and_unknown_field(self):
+        assert UserObject.get_many([]) == []
+        with pytest.raises(AttributeError):
+            UserObject.get_many([1], fields=['unknown'])
+
+
+class TestUpdate(CommonHelper):
+    def test_constructor_one_round_trip(self):
+        UserObject(1, name='Alice', login='alice@null.com', rating=5,
+                   paid=True, credits_test=10, is_admin=True)
+        self.assert_pipelines_count(1)
+        self.assert_commands_count(2)  # one HSET and one MSET
+        assert commands[0][:2] == ('HSET', 'astra::userobject::hash::1')
+        assert commands[1][0] == 'MSET'
+
+        user1 = UserObject(1)
+        assert user1.name == 'Alice'
+        assert user1.rating == 5
+        assert user1.paid is True
+        assert user1.credits_test == 10
+        assert user1.is_admin is True
+
+    def test_update_many_fields(self):
+        site = SiteObject(1, name='redis.io')
+        user1 = UserObject(1, name='Alice', site1=site)
+        assert user1.name == 'Alice'
+        user1.update(name='Bob', rating=3, site1=None)
+        assert user1.name == 'Bob'  # cache was updated
+
+        user1_read = UserObject(1)
+        assert user1_read.name == 'Bob'
+        assert user1_read.rating == 3
+        assert user1_read.site1 is None
+
+    def test_nothing_written_on_invalid_value(self):
+        user1 = UserObject(1)
+        assert user1.name == ''  # Hash is loaded and cached
+        del commands[:]
+        with pytest.raises(ValueError):
+            user1.update(name='Alice', credits_test='invalid')
+        self.assert_commands_count(0)
+        self.assert_keys_count(0)
+        assert user1.name == ''  # Earlier value is not cached
+
+    def test_nothing_written_on_validator_error(self):
+        with pytest.raises(ValueError):
+            SiteObject(1, name='x'*33)
+        self.assert_keys_count(0)
+
+
+class TestBatch(CommonHelper):
+    def test_writes_by_one_round_trip(self):
+        site1 = SiteObject(1, name='redis.io')
+        user1 = UserObject(1, name='Alice', credits_test=1)
+        assert user1.name == 'Alice'
+        del commands[:]
+        del pipelines[:]
+
+        with user1.batch():
+            user1.name = 'Bob'
+            user1.rating = 10
+            user1.credits_test = 5
+            assert user1.sites_list.lpush(site1, site1) is None
+            user1.sites_set.sadd(site1)
+            user1.sites_sorted_set.zadd({site1: 10})
+            user1.site1 = None
+            assert user1.name == 'Bob'  # cache is up to date
+            self.assert_commands_count(0)
+        self.assert_pipelines_count(1)
+
+        user1_read = UserObject(1)
+        assert user1_read.name == 'Bob'
+        assert user1_read.rating == 10
+        assert user1_read.credits_test == 5
+        assert len(user1_read.sites_list) == 2
+        assert len(user1_read.sites_set) == 1
+        assert user1_read.sites_sorted_set.zscore(site1) == 10
+
+    def test_transaction(self):
+        user1 = UserObject(1)
+        with user1.batch(transaction=True) as batch:
+            user1.name = 'Alice'
+            user1.sites_set.sadd('1', '2')
+        assert batch.results == [1, 2]
+        assert UserObject(1).name == 'Alice'
+
+    def test_pops_are_buffered(self):
+        user1 = UserObject(1)
+        user1.sites_list.rpush('old')
+        user1.sites_sorted_set.zadd({'1': 1})
+        with user1.batch(transaction=True) as batch:
+            user1.sites_list.rpush('new')
+            user1.sites_list.lpush('first')
+            assert user1.sites_list.lpop() is None
+            assert user1.sites_sorted_set.zpopmin() is None
+            with pytest.raises(TypeError):
+                user1.sites_sorted_set.bzpopmin(timeout=1)
+        assert batch.results == [2, 3, 'first', [('1', 1.0)]]
+        assert [site.pk for site in user1.sites_list] == ['old', 'new']
+        assert user1.sites_list.lpop().pk == 'old'
+
+    def test_remove_in_batch(self):
+        user1 = UserObject(1, name='Alice', credits_test=3)
+        with user1.batch():
+            user1.name = 'Bob'
+            user1.remove()
+        self.assert_keys_count(0)
+        assert user1.hash_exist() is False
+        assert user1.name == ''
+
+    def test_nothing_sent_on_exception(self):
+        user1 = UserObject(1, name='Alice')
+        assert user1.name == 'Alice'
+        with pytest.raises(ValueError):
+            with user1.batch():
+                user1.name = 'Bob'
+                user1.rating = 'invalid'
+        assert user1.name == 'Alice'  # cache was dropped
+        assert UserObject(1).name == 'Alice'
+
+    def test_hash_read_after_buffered_write(self):
+        UserObject(1, name='orig', login='orig', rating=1)
+        user1 = UserObject(1)
+        with user1.batch():
+            user1.name = 'new'
+            UserObject.login.remove(user1)
+            assert user1.name == 'new'  # Loaded hash is not older
+            assert user1.login == ''
+        assert (user1.name, user1.login, user1.rating) == ('new', '', 1)
+        assert UserObject(1).name == 'new'
+
+        with user1.batch():
+            user1.name = 'newer'
+            user1.cas('name', 'newer', 'newest')
+        assert user1.name == 'newest'  # Changed by the script
+
+    @pytest.mark.skipif(PY2, reason="requires python3")
+    def test_cache_reset_on_failed_execute(self):
+        UserObject(1, name='orig')
+        user1 = UserObject(1)
+        assert user1.name == 'orig'
+        error = redis.exceptions.ConnectionError()
+        with patch.object(redis.client.Pipeline, 'execute',
+                          side_effect=error):
+            with pytest.raises(redis.exceptions.ConnectionError):
+                with user1.batch():
+                    user1.name = 'new'
+        assert user1.name == 'orig'
+
+    def test_update_joins_batch(self):
+        user1 = UserObject(1)
+        with user1.batch():
+            user1.update(name='Alice', rating=5)
+            user1.login = 'alice@null.com'
+        self.assert_pipelines_count(1)
+        user1_read = UserObject(1)
+        assert user1_read.name == 'Alice'
+        assert user1_read.login == 'alice@null.com'
+
+
+class TestPrefetch(CommonHelper):
+    def _create_sites(self, user1, count):
+        for i in range(count):
+            site = SiteObject(i, name='site%s.com' % i)
+            user1.sites_list.rpush(site)
+            user1.sites_set.sadd(site)
+            user1.sites_sorted_set.zadd({site: i})
+
+    def test_list_prefetch(self):
+        user1 = UserObject(1)
+        self._create_sites(user1, 5)
+        del pipelines[:]
+        sites = user1.sites_list.lrange(0, -1, prefetch=['name'])
+        self.assert_pipelines_count(1)
+        del commands[:]
+        assert [site.name for site in sites] == \
+            ['site%s.com' % i for i in range(5)]
+        self.assert_commands_count(0)
+
+    def test_set_and_sorted_set_prefetch(self):
+        user1 = UserObject(1)
+        self._create_sites(user1, 3)
+        sites = user1.sites_set.smembers(prefetch=True)
+        sites_with_scores = user1.sites_sorted_set.zrange(
+            0, -1, withscores=True, prefetch=['name'])
+        del commands[:]
+        assert sorted(site.name for site in sites) == \
+            ['site0.com', 'site1.com', 'site2.com']
+        assert sites_with_scores[2][0].name == 'site2.com'
+        assert sites_with_scores[2][1] == 2
+        self.assert_commands_count(0)
+
+    def test_single_object_prefetch(self):
+        user1 = UserObject(1)
+        self._create_sites(user1, 2)
+        site = user1.sites_list.lpop(prefetch=['name'])
+        del commands[:]
+        assert site.name == 'site0.com'
+        self.assert_commands_count(0)
+
+    def test_without_prefetch(self):
+        user1 = UserObject(1)
+        self._create_sites(user1, 2)
+        sites = user1.sites_list.lrange(0, -1)
+        del commands[:]
+        assert sites[0].name == 'site0.com'
+        self.assert_commands_count(1)
+
+    @pytest.mark.parametrize('field_type', [
+        models.ForeignField,
+        models.ForeignHash
+    ])
+    def test_foreign_prefetch(self, field_type):
+        class SampleObject(models.Model):
+            site = field_type(to=SiteObject, prefetch=['name', 'site_color'])
+            site_lazy = field_type(to=SiteObject)
+            def get_db(self):
+                return db
+
+        site = SiteObject(1, name='redis.io')
+        SampleObject(1, site=site, site_lazy=site)
+        obj_read = SampleObject(1)
+        related = obj_read.site
+        del commands[:]
+        assert related.name == 'redis.io'
+        assert related.site_color.pk == '2'
+        self.assert_commands_count(0)
+
+        related = obj_read.site_lazy
+        del commands[:]
+        assert related.name == 'redis.io'
+        self.assert_commands_count(1)
+
+    def test_plain_keys_prefetch(self):
+        site = SiteObject(1)
+        site.tags.sadd('redis', 'nosql')
+        assert sorted(site.tags.smembers(prefetch=True)) == ['nosql', 'redis']
+
+
+class TestFieldCache(CommonHelper):
+    class CachedObject(models.Model):
+        is_admin = models.BooleanField(cache=True)
+        credits = models.IntegerField(cache=True)
+        name = models.CharHash()
+
+        def get_db(self):
+            return db
+
+    def test_read_once(self):
+        self.CachedObject(1, is_admin=True)
+        obj = self.CachedObject(1)
+        del commands[:]
+        assert obj.is_admin and obj.is_admin and obj.is_admin
+        self.assert_commands_count(1)
+
+    def test_cache_updated_on_assign(self):
+        obj = self.CachedObject(1)
+        obj.credits = 5
+        del commands[:]
+        assert obj.credits == 5
+        self.assert_commands_count(0)
+
+    def test_cache_cleared_by_helpers_and_remove(self):
+        obj = self.CachedObject(1, credits=5)
+        assert obj.credits == 5
+        obj.credits_incr(2)
+        assert obj.credits == 7
+        obj.credits_setex(10, 1)
+        assert obj.credits == 1
+        obj.remove()
+        assert obj.credits == 0
+
+    def test_refresh(self):
+        obj = self.CachedObject(1, credits=5, name='Alice')
+        assert obj.credits == 5
+        assert obj.name == 'Alice'
+        self.CachedObject(1, credits=10, name='Bob')  # other instance
+        assert obj.credits == 5
+        obj.refresh('credits')
+        assert obj.credits == 10
+        assert obj.name == 'Alice'
+        obj.refresh()
+        assert obj.name == 'Bob'
+        with pytest.raises(AttributeError):
+            obj.refresh('unknown')
+
+    def test_not_cached_by_default(self):
+        UserObject(1, is_admin=True)
+        user1 = UserObject(1)
+        del commands[:]
+        assert user1.is_admin and user1.is_admin
+        self.assert_commands_count(2)
+
+
+class TestPartialHash(CommonHelper):
+    class WideObject(models.Model):
+        partial_hash_loading = True
+
+        name = models.CharHash()
+        login = models.CharHash()
+        about = models.CharHash()
+        rating = models.IntegerHash()
+
+        def get_db(self):
+            return db
+
+    def test_load_only_requested_field(self):
+        self.WideObject(1, name='Alice', about='x' * 1000, rating=5)
+        obj = self.WideObject(1)
+        del commands[:]
+        assert obj.name == 'Alice'
+        assert obj.name == 'Alice'
+        assert obj.login == ''
+        assert obj.login == ''
+        self.assert_commands_count(2)
+        assert commands[0] == ('HMGET', 'astra::wideobject::hash::1', 'name')
+        assert obj.hash_exist() is True
+
+    def test_declared_fields(self):
+        UserObject(1, name='Alice', login='alice@null.com', rating=5)
+        user1 = UserObject(1).only('name', 'rating')
+        del commands[:]
+        assert user1.name == 'Alice'
+        assert user1.rating == 5
+        self.assert_commands_count(1)
+        assert commands[0] == ('HMGET', 'astra::userobject::hash::1',
+                               'name', 'rating')
+        assert user1.login == 'alice@null.com'
+        assert commands[1] == ('HMGET', 'astra::userobject::hash::1',
+                               'login')
+        with pytest.raises(AttributeError):
+            user1.only('credits_test')
+
+    def test_assign_and_remove(self):
+        obj = self.WideObject(1, name='Alice')
+        assert obj.name == 'Alice'
+        obj.name = 'Bob'
+        assert obj.name == 'Bob'
+        obj.about = 'About'
+        assert obj.about == 'About'
+        obj.remove()
+        assert obj.about == ''
+        assert obj.hash_exist() is False
+
+    def test_hash_not_exists(self):
+        obj = self.WideObject(1)
+        assert obj.name == ''
+        assert obj.hash_exist() is False
+
+    def test_get_many(self):
+        self.WideObject(1, name='Alice', about='x' * 1000)
+        del commands[:]
+        obj = self.WideObject.get_many([1], fields=['name'])[0]
+        assert commands[0] == ('HMGET', 'astra::wideobject::hash::1', 'name')
+        assert obj.name == 'Alice'
+        self.assert_commands_count(1)
+        assert obj.about == 'x' * 1000
+
+
+class TestClientCache(CommonHelper):
+    def setup_method(self, test_method):
+        super(TestClientCache, self).setup_method(test_method)
+        if int(db.info()['redis_version'].split('.')[0]) < 6:
+            pytest.skip('requires redis-server >= 6.0')
+
+        from astra.client_cache import ClientCache
+        self.cache = ClientCache(db, max_size=2)
+        cache = self.cache
+
+        class CachedSite(models.Model):
+            name = models.CharHash()
+            color = models.CharField()
+
+            def get_db(self):
+                return db
+
+            def get_client_cache(self):
+                return cache
+
+        self.CachedSite = CachedSite
+
+    def teardown_method(self, test_method):
+        self.cache.close()
+
+    def _wait_invalidation(self, read):
+        import time
+        for _ in range(50):
+            value = read()
+            if self.cache.stats()['invalidations']:
+                return value
+            time.sleep(0.01)
+        return read()
+
+    def test_shared_between_objects(self):
+        self.CachedSite(1, name='redis.io', color='red')
+        assert self.CachedSite(1).name == 'redis.io'
+        assert self.CachedSite(1).color == 'red'
+        del commands[:]
+        assert self.CachedSite(1).name == 'redis.io'
+        assert self.CachedSite(1).color == 'red'
+        self.assert_commands_count(0)
+        stats = self.cache.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 2
+        assert stats['hit_ratio'] == 0.5
+
+    def test_invalidated_by_own_writes(self):
+        site = self.CachedSite(1, name='redis.io')
+        assert self.CachedSite(1).name == 'redis.io'
+        site.name = 'redis.com'
+        assert self.CachedSite(1).name == 'redis.com'
+        site.color_setex(10, 'blue')
+        assert self.CachedSite(1).color == 'blue'
+        site.remove()
+        assert self.CachedSite(1).name == ''
+
+    def test_invalidated_by_other_clients(self):
+        self.CachedSite(1, name='redis.io')
+        assert self.CachedSite(1).name == 'redis.io'
+        db.hset('astra::cachedsite::hash::1', 'name', 'redis.com')
+        name = self._wait_invalidation(lambda: self.CachedSite(1).name)
+        assert name == 'redis.com'
+
+    def test_lru_eviction(self):
+        for i in range(3):
+            self.CachedSite(i, name='site%s' % i)
+            assert self.CachedSite(i).name == 'site%s' % i
+        stats = self.cache.stats()
+        assert stats['size'] == 2
+        assert stats['evictions'] == 1
+
+
+class TestIdentityMap(CommonHelper):
+    def test_same_instance_for_foreign_objects(self):
+        from astra.identity_map import IdentityMap
+        site = SiteObject(1, name='redis.io')
+        UserObject(1, site1=site)
+        UserObject(2, site1=site)
+
+        with IdentityMap():
+            user1, user2 = UserObject.get_many([1, 2])
+            assert user1.site1 is user2.site1
+            del commands[:]
+            assert user1.site1.name == 'redis.io'
+            assert user2.site1.name == 'redis.io'
+            self.assert_commands_count(1)
+            assert UserObject.get_many([1])[0] is user1
+
+        assert UserObject.from_pk(1) is not user1
+
+    def test_collections_and_prefetch(self):
+        from astra.identity_map import IdentityMap
+        user1 = UserObject(1)
+        for i in range(3):
+            user1.sites_list.rpush(SiteObject(i, name='site%s' % i))
+
+        with IdentityMap():
+            sites = user1.sites_list.lrange(0, -1, prefetch=['name'])
+            del commands[:]
+            del pipelines[:]
+            assert user1.sites_list.lrange(0, -1, prefetch=['name']) == sites
+            assert user1.sites_list[1] is sites[1]
+            self.assert_pipelines_count(0)  # already loaded
+
+    def test_lru_and_scopes(self):
+        from astra.identity_map import IdentityMap, get_identity_map
+        assert get_identity_map() is None
+        with IdentityMap(max_size=2) as identity_map:
+            site0 = SiteObject.from_pk(0)
+            SiteObject.from_pk(1)
+            assert SiteObject.from_pk(0) is site0  # recently used now
+            SiteObject.from_pk(2)
+            assert len(identity_map) == 2
+            assert site0 in identity_map
+            assert identity_map.get(SiteObject, '1') is None  # evicted
+
+            with IdentityMap() as inner_map:
+                assert get_identity_map() is inner_map
+                assert SiteObject.from_pk(0) is not site0
+            assert get_identity_map() is identity_map
+        assert get_identity_map() is None
+
+
+class TestModelCompilation(CommonHelper):
+    def test_compiled_at_definition(self):
+        class SampleObject(models.Model):
+            name = models.CharHash()
+            credits = models.IntegerField()
+
+            def get_db(self):
+                return db
+
+        assert set(SampleObject._astra_fields) == {'name', 'credits'}
+        assert SampleObject._astra_hash_field_names == ('name',)
+        assert isinstance(SampleObject.name, models.CharHash)
+        assert callable(SampleObject.credits_incr)
+        assert SampleObject._astra_compile_time >= 0
+
+    def test_inherited_and_mixin_fields(self):
+        class NameMixin(object):
+            name = models.CharHash()
+
+        class ChildObject(NameMixin, ChildExample):
+            field3 = models.CharField()
+
+        assert set(ChildObject._astra_fields) == {
+            '_ts', 'parent_field', 'field1', 'field2', 'field3', 'name'}
+        ChildObject(1, name='Alice', field1='f1', field3='f3')
+        child_read = ChildObject(1)
+        assert child_read.name == 'Alice'
+        assert child_read.field1 == 'f1'
+        assert child_read.field3 == 'f3'
+
+    def test_custom_deleter(self):
+        class SampleObject(models.Model):
+            site = models.ForeignHash(to=SiteObject)
+            def get_db(self):
+                return db
+            def del_site(self):
+                self.setattr('site', None)
+                self.deleted = True
+
+        obj = SampleObject(1, site=SiteObject(1))
+        assert obj.site.pk == '1'
+        del obj.site
+        assert obj.deleted
+        assert obj.site is None
+
+    def test_shared_fields(self):
+        class SampleObject(models.Model):
+            __slots__ = ()
+            name = models.CharHash()
+            tags = models.Set()
+
+            def get_db(self):
+                return db
+
+        obj1 = SampleObject(1, name='Alice')
+        obj2 = SampleObject(2)
+        obj1.tags.sadd('a', 'b')
+        assert not hasattr(obj1, '__dict__')
+        assert obj1.name == 'Alice'
+        assert obj2.name == ''
+        assert len(obj1.tags) == 2
+        assert len(obj2.tags) == 0
+        assert SampleObject.name.name == 'name'
+        with pytest.raises(AttributeError):
+            obj1.tags.unknown_method
+
+    def test_key_names_built_once(self):
+        user = UserObject(1)
+        field = UserObject._astra_fields['name']
+        key_name = field.get_key_name(user, True)
+        assert key_name == 'astra::userobject::hash::1'
+        assert field.get_key_name(user, True) is key_name
+        user.pk = 2  # Keys are built again for new pk
+        assert user.pk == '2'
+        assert field.get_key_name(user, True) == 'astra::userobject::hash::2'
+
+    def test_collection_methods_compiled_once(self):
+        sadd1 = UserObject(1).sites_set.sadd
+        sadd2 = UserObject(2).sites_set.sadd
+        assert sadd1.func is sadd2.func
+        assert sadd1.func is not UserObject(1).sites_set.smembers.func
+        sadd2(SiteObject(1), SiteObject(2))
+        assert sorted(site.pk for site in UserObject(2).sites_set) == \
+            ['1', '2']
+
+    def test_compile_times_report(self):
+        from astra.model import get_compile_times
+        compile_times = get_compile_times()
+        assert 'tests.sample_models.UserObject' in compile_times
+        assert 'tests.sample_models.ChildExample' in compile_times
+
+
+class IndexedObject(models.Model):
+    status = models.EnumHash(enum=('NEW', 'ACTIVE', 'BANNED'), default='NEW',
+                             index=True)
+    login = models.CharHash(index=True)
+    is_admin = models.BooleanHash(index=True)
+    site = models.ForeignHash(to=SiteObject, index=True)
+    rating = models.IntegerHash()
+
+    def get_db(self):
+        return db
+
+
+class TestIndex(CommonHelper):
+    def test_lost_scripts(self):
+        IndexedObject(1, login='one')
+        db.script_flush()  # E.g. restart or failover
+        IndexedObject(2, login='two', rating=2, status='BANNED')
+        assert db.hgetall('astra::indexedobject::hash::2') == \
+            {'login': 'two', 'rating': '2', 'status': 'BANNED'}
+        assert IndexedObject.filter(status='BANNED') == ['2']
+
+    def test_filter(self):
+        IndexedObject(1, status='ACTIVE', login='alice', is_admin=True)
+        IndexedObject(2, status='ACTIVE', login='bob', is_admin=False)
+        IndexedObject(3, status='BANNED', login='carol', is_admin=False)
+
+        assert IndexedObject.filter(status='ACTIVE') == ['1', '2']
+        assert IndexedObject.filter(status='ACTIVE', is_admin=False) == ['2']
+        assert IndexedObject.filter(login='carol') == ['3']
+        assert IndexedObject.filter(status='NEW') == []
+
+    def test_index_follows_changes(self):
+        obj = IndexedObject(1, status='ACTIVE', site=SiteObject(5))
+        obj.status = 'BANNED'
+        assert IndexedObject.filter(status='ACTIVE') == []
+        assert IndexedObject.filter(status='BANNED') == ['1']
+        assert IndexedObject.filter(site=SiteObject(5)) == ['1']
+
+        obj.site = None
+        assert IndexedObject.filter(site=5) == []
+        assert IndexedObject(1).site is None
+
+        with obj.batch():
+            obj.update(status='ACTIVE', login='alice', rating=3)
+        assert IndexedObject.filter(status='ACTIVE', login='alice') == ['1']
+        assert IndexedObject(1).rating == 3
+
+        obj.remove()
+        assert IndexedObject.filter(status='ACTIVE') == []
+        assert db.keys() == []
+
+    @pytest.mark.skipif(PY2, reason="requires python3")
+    def test_remove_by_one_transaction(self):
+        obj = IndexedObject(1, status='ACTIVE', login='alice')
+        global pipelines
+        pipelines = []
+        execute_transaction = redis.client.Pipeline._execute_transaction
+        with patch.object(redis.client.Pipeline, '_execute_transaction',
+                          autospec=True,
+                          side_effect=execute_transaction) as mock_method:
+            obj.remove()
+        assert mock_method.call_count == 1
+        self.assert_pipelines_count(1)
+        assert [command[0] for command in pipelines[0]][-2:] == \
+            ['EVALSHA', 'UNLINK']
+        assert IndexedObject.filter(status='ACTIVE') == []
+        assert db.keys() == []
+
+    def test_remove_many(self):
+        for i in range(3):
+            IndexedObject(i, status='ACTIVE', rating=i)
+        assert IndexedObject.remove_many(range(3), chunk_size=2) == 3
+        assert IndexedObject.filter(status='ACTIVE') == []
+        assert db.keys() == []
+
+    def test_filter_prefetch(self):
+        IndexedObject(1, status='ACTIVE', login='alice')
+        IndexedObject(2, status='ACTIVE', login='bob')
+        objects = IndexedObject.filter(status='ACTIVE', prefetch=True)
+        global commands
+        commands = []
+        assert [obj.login for obj in objects] == ['alice', 'bob']
+        assert commands == []  # Loaded already
+
+    def test_wrong_filter(self):
+        with pytest.raises(AttributeError):
+            IndexedObject.filter(rating=5)
+        with pytest.raises(ValueError):
+            IndexedObject.filter(status='UNKNOWN')
+        with pytest.raises(ValueError):
+            IndexedObject.filter()
+        with pytest.raises(AttributeError):
+            models.IntegerHash(index=True)
+
+
+class RangeObject(models.Model):
+    rating = models.IntegerHash(range_index=True)
+    last_login = models.DateTimeHash(range_index=True)
+    name = models.CharHash()
+
+    def get_db(self):
+        return db
+
+
+class TestRangeIndex(CommonHelper):
+    def test_range(self):
+        for i in range(5):
+            RangeObject(i, rating=i * 100)
+        RangeObject(2).rating = 250
+
+        assert RangeObject.range('rating', 100, 300) == ['1', '2', '3']
+        assert RangeObject.range('rating', 100, 300, reverse=True) == \
+            ['3', '2', '1']
+        assert RangeObject.range('rating', 100) == ['1', '2', '3', '4']
+        assert RangeObject.range('rating', max=100) == ['0', '1']
+        assert RangeObject.range('rating', '(100', 300) == ['2', '3']
+        assert RangeObject.range('rating', limit=2, offset=1) == ['1', '2']
+        assert RangeObject.range('rating', offset=3) == ['3', '4']
+
+    def test_dates_and_prefetch(self):
+        now = dt.datetime.now().replace(microsecond=0)
+        RangeObject(1, name='old', last_login=now - dt.timedelta(days=1))
+        RangeObject(2, name='new', last_login=now)
+        hour_ago = now - dt.timedelta(hours=1)
+
+        objects = RangeObject.range('last_login', hour_ago, prefetch=['name'])
+        global commands
+        commands = []
+        assert [obj.name for obj in objects] == ['new']
+        assert commands == []
+
+    def test_remove(self):
+        RangeObject(1, rating=5)
+        RangeObject(2, rating=6)
+        RangeObject(3, rating=7, name='third')
+        RangeObject.rating.remove(RangeObject(1))
+        RangeObject(2).remove()
+        assert RangeObject.remove_many([3]) == 1
+        assert RangeObject.range('rating') == []
+        assert db.keys() == []
+
+    def test_wrong_range(self):
+        with pytest.raises(AttributeError):
+            RangeObject.range('name')
+        with pytest.raises(AttributeError):
+            models.CharHash(range_index=True)
+
+
+class TestIterAll(CommonHelper):
+    def test_iter_all(self):
+        for i in range(7):
+            UserObject(i, name='User%s' % i)
+        SiteObject(1, name='Site')  # Other model
+
+        global pipelines
+        pipelines = []
+        users = list(UserObject.iter_all(batch_size=3, fields=['name']))
+        assert sorted(user.pk for user in users) == [str(i) for i in range(7)]
+        self.assert_pipelines_count(3)  # Loaded by batches
+        global commands
+        commands = []
+        assert sorted(user.name for user in users) == \
+            ['User%s' % i for i in range(7)]
+        assert commands == []
+
+    def test_without_hash(self):
+        class SampleObject(models.Model):
+            title = models.CharField()
+            tags = models.Set()
+
+            def get_db(self):
+                return db
+
+        for i in range(4):
+            SampleObject(i, title='Title%s' % i)
+            SampleObject(i).tags.sadd('tag')
+        SampleObject(10).tags.sadd('tag')  # Without the first field
+        db.set('astra::sampleobject::fld::x::other', '1')  # Other key
+
+        objects = list(SampleObject.iter_all(batch_size=2))
+        assert sorted(obj.pk for obj in objects) == ['0', '1', '10', '2', '3']
+        assert sorted(obj.title for obj in objects) == \
+            ['', 'Title0', 'Title1', 'Title2', 'Title3']
+
+    def test_empty(self):
+        assert list(UserObject.iter_all()) == []
+
+
+class TestConditionalUpdate(CommonHelper):
+    def test_cas(self):
+        user = UserObject(1, status='REGISTERED')
+        assert user.cas('status', 'REGISTERED', 'ACTIVATED') is True
+        assert user.cas('status', 'REGISTERED', 'ACTIVATED') is False
+        assert UserObject(1).status == 'ACTIVATED'
+        assert user.cas('rating', None, 10) is True  # Not set field
+        assert user.cas('rating', None, 20) is False
+        assert UserObject(1).rating == 10
+
+    def test_cas_by_one_round_trip(self):
+        user = UserObject(1, status='REGISTERED')
+        assert user.status == 'REGISTERED'  # Hash is loaded
+        global commands
+        commands = []
+        user.cas('status', 'REGISTERED', 'ACTIVATED')
+        assert [command[0] for command in commands] == ['EVALSHA']
+        commands = []
+        assert user.status == 'ACTIVATED'  # Cached
+        assert commands == []
+
+    def test_script_is_loaded_again(self):
+        user = UserObject(1, status='REGISTERED')
+        db.script_flush()
+        assert user.cas('status', 'REGISTERED', 'BANNED') is True
+        db.script_flush()  # Loaded by the same pipeline
+        with user.batch():
+            user.name = 'Alice'
+            user.cas('status', 'BANNED', 'ACTIVATED')
+        obj_read = UserObject(1)
+        assert (obj_read.name, obj_read.status) == ('Alice', 'ACTIVATED')
+
+    def test_update_if(self):
+        user = UserObject(1, status='ACTIVATED', rating=5)
+        assert user.update_if({'status': 'ACTIVATED', 'rating': 4},
+                              status='BANNED') is False
+        assert user.update_if({'status': 'ACTIVATED', 'rating': 5},
+                              status='BANNED', rating=0, paid=True) is True
+        user_read = UserObject(1)
+        assert user_read.status == 'BANNED'
+        assert user_read.rating == 0
+        assert user_read.paid is True
+        with pytest.raises(ValueError):
+            user.update_if({'status': 'BANNED'}, status='UNKNOWN')
+        with pytest.raises(AttributeError):
+            user.update_if({'credits_test': 1}, status='BANNED')
+
+    def test_indexes(self):
+        obj = IndexedObject(1, status='NEW')
+        RangeObject(1, rating=5)
+        assert obj.cas('status', 'NEW', 'ACTIVE') is True
+        assert IndexedObject.filter(status='NEW') == []
+        assert IndexedObject.filter(status='ACTIVE') == ['1']
+        assert RangeObject(1).hincrby('rating', 10) == 15
+        assert RangeObject.range('rating', 15, 15) == ['1']
+
+    def test_hincrby(self):
+        user = UserObject(1)
+        assert user.hincrby('rating', 5, max=10) == 5
+        assert user.hincrby('rating', 5, max=10) == 10
+        assert user.hincrby('rating', 1, max=10) is None
+        assert user.hincrby('rating', -11, min=0) is None
+        assert user.hincrby('rating', -10, min=0) == 0
+        assert UserObject(1).rating == 0
+        with pytest.raises(AttributeError):
+            user.hincrby('status')
+        with pytest.raises(ValueError):
+            user.hincrby('rating', 'one')
+
+
+class VersionedObject(models.Model):
+    name = models.CharHash()
+    balance = models.IntegerHash()
+    version = models.IntegerHash()
+    tags = models.Set()
+    version_field = 'version'
+
+    def get_db(self):
+        return db
+
+
+class TestVersion(CommonHelper):
+    def test_writes_increment_version(self):
+        obj = VersionedObject(1, name='a', balance=10)
+        assert VersionedObject(1).version == 1
+        obj.name = 'b'
+        with obj.batch():
+            obj.balance = 20
+            obj.tags.sadd('x')
+        obj_read = VersionedObject(1)
+        assert obj_read.version == 3
+        assert obj_read.name == 'b'
+        assert obj_read.balance == 20
+        assert obj.version == 3  # Known without reading
+
+    def test_conflict(self):
+        VersionedObject(1, name='a')
+        first = VersionedObject(1)
+        second = VersionedObject(1)
+        assert first.name == 'a'
+        assert second.name == 'a'
+        first.name = 'b'
+        with pytest.raises(models.VersionConflict):
+            second.name = 'c'
+        assert isinstance(models.VersionConflict(),
+                          redis.exceptions.WatchError)  # Retryable
+        assert second.name == 'b'  # Cache is reset
+        second.name = 'c'
+        assert VersionedObject(1).name == 'c'
+        assert VersionedObject(1).version == 3
+
+    def test_conflict_discards_batch(self):
+        VersionedObject(1, name='a', balance=10)
+        obj = VersionedObject(1)
+        assert obj.balance == 10
+        VersionedObject(1).update(balance=0)
+        with pytest.raises(models.VersionConflict):
+            with obj.batch():
+                obj.balance = obj.balance - 5
+                obj.tags.sadd('x')
+        obj_read = VersionedObject(1)
+        assert obj_read.balance == 0
+        assert not obj_read.tags.smembers()
+
+    def test_scripts_increment_version(self):
+        VersionedObject(1, name='a', balance=10)
+        obj = VersionedObject(1)
+        stale = VersionedObject(1)
+        assert stale.balance == 10  # Version 1 is read
+        assert obj.cas('name', 'a', 'b') is True
+        assert obj.version == 2
+        assert obj.hincrby('balance', 5) == 15
+        assert obj.update_if({'name': 'b'}, balance=20) is True
+        assert obj.version == 4
+        assert VersionedObject(1).version == 4
+        with pytest.raises(models.VersionConflict):
+            stale.balance = 0
+        obj.balance = 30  # Cache of obj is current
+        assert VersionedObject(1).version == 5
+        VersionedObject(1).update(name='c')
+        assert obj.hincrby('balance', 1) == 31
+        assert obj.name == 'c'  # Cache was older than the script result
+
+    def test_read_inside_batch(self):
+        VersionedObject(1, name='a', balance=100)
+        first = VersionedObject(1)
+        second = VersionedObject(1)
+        with pytest.raises(models.VersionConflict):
+            with second.batch():
+                balance = second.balance  # Both objects read 100
+                with first.batch():
+                    first.balance = first.balance - 30
+                second.balance = balance - 10
+        with second.batch():  # Retry reads the current value
+            second.balance = second.balance - 10
+        assert VersionedObject(1).balance == 60
+
+    @pytest.mark.skipif(PY2, reason="requires python3")
+    def test_changed_between_read_and_exec(self):
+        VersionedObject(1, name='a')
+        obj = VersionedObject(1)
+        assert obj.name == 'a'
+
+        original_multi = redis.client.Pipeline.multi
+
+        def multi(pipe):  # Other writer after the version check
+            db.hset('astra::versionedobject::hash::1', 'name', 'c')
+            original_multi(pipe)
+        with patch.object(redis.client.Pipeline, 'multi', multi):
+            with pytest.raises(models.VersionConflict):
+                obj.name = 'b'
+        assert VersionedObject(1).name == 'c'
+
+    def test_not_read_object(self):
+        VersionedObject(1, name='a')
+        obj = VersionedObject(1)
+        obj.name = 'b'  # Nothing to compare with, version is incremented
+        assert VersionedObject(1).version == 2
+
+    def test_partial_loading_reads_version(self):
+        VersionedObject(1, name='a', balance=10)
+        obj = VersionedObject(1).only('balance')
+        global commands
+        commands = []
+        assert obj.balance == 10
+        assert commands == [('HMGET', 'astra::versionedobject::hash::1',
+                             'balance', 'version')]
+        VersionedObject(1).update(balance=0)
+        with pytest.raises(models.VersionConflict):
+            obj.balance = 5
+
+    def test_stats(self):
+        from astra.model import get_version_stats
+        VersionedObject._astra_version_stats.update(writes=0, conflicts=0)
+        VersionedObject(1, name='a')
+        obj = VersionedObject(1)
+        assert obj.name == 'a'
+        VersionedObject(1).name = 'b'
+        with pytest.raises(models.VersionConflict):
+            obj.name = 'c'
+        stats = get_version_stats()['tests.fields_test.VersionedObject']
+        assert stats == {'writes': 3, 'conflicts': 1, 'conflict_ratio': 1 / 3.}
+        assert 'tests.sample_models.UserObject' not in get_version_stats()
+
+    def test_wrong_version_field(self):
+        with pytest.raises(AttributeError):
+            class WrongVersion(models.Model):
+                version = models.CharHash()
+                version_field = 'version'
+
+
+class DocumentObject(models.Model):
+    name = models.CharField()
+    credits = models.IntegerField()
+    is_admin = models.BooleanField(cache=True)
+    joined = models.DateField()
+    site = models.ForeignField(to=SiteObject)
+    title = models.CharHash()
+    document_storage = True
+
+    def get_db(self):
+        return db
+
+
+class TestDocumentStorage(CommonHelper):
+    def test_assign_and_read(self):
+        joined = dt.date(2020, 1, 2)
+        DocumentObject(1, name='Alice', credits=10, joined=joined,
+                       site=SiteObject(5), title='Title')
+        assert db.keys('astra::documentobject::doc::*') == \
+            ['astra::documentobject::doc::1']
+        obj_read = DocumentObject(1)
+        assert obj_read.name == 'Alice'
+        assert obj_read.credits == 10
+        assert obj_read.joined == joined
+        assert obj_read.site.pk == '5'
+        assert obj_read.is_admin is False  # Not set
+        obj_read.credits = 20
+        assert DocumentObject(1).credits == 20
+        assert DocumentObject(1).name == 'Alice'
+
+    def test_one_command(self):
+        obj = DocumentObject(1, name='')  # Script is loaded
+        global commands
+        commands = []
+        obj.update(name='Alice', credits=10, is_admin=True)
+        assert [command[0] for command in commands] == \
+            ['SCRIPT LOAD', 'EVALSHA']  # One pipeline
+        commands = []
+        assert obj.name == 'Alice'
+        assert [command[0] for command in commands] == ['GET']
+        commands = []
+        assert obj.is_admin is True  # Cached
+        assert commands == []
+
+    def test_fields_read_by_one_get(self):
+        joined = dt.date(2020, 1, 2)
+        DocumentObject(1, name='Alice', credits=10, joined=joined)
+        obj = DocumentObject(1)
+        global commands
+        commands = []
+        assert (obj.name, obj.credits, obj.joined, obj.site) == \
+            ('Alice', 10, joined, None)
+        assert [command[0] for command in commands] == ['GET']
+        obj.credits = 20  # Values read by GET are dropped
+        commands = []
+        assert (obj.name, obj.credits) == ('Alice', 20)
+        assert [command[0] for command in commands] == ['GET']
+        DocumentObject(1).name = 'Bob'
+        obj.refresh('credits')
+        commands = []
+        assert (obj.name, obj.credits) == ('Bob', 20)
+        assert [command[0] for command in commands] == ['GET']
+
+    def test_read_inside_batch_is_not_cached(self):
+        obj = DocumentObject(1, name='Alice', credits=10)
+        with obj.batch():
+            obj.name = 'Bob'
+            assert obj.credits == 10
+        assert (obj.name, obj.credits) == ('Bob', 10)
+
+    def test_remove(self):
+        obj = DocumentObject(1, name='Alice', credits=10)
+        DocumentObject.name.remove(obj)
+        obj_read = DocumentObject(1)
+        assert obj_read.name == ''
+        assert obj_read.credits == 10
+        obj.site = None
+        DocumentObject.credits.remove(obj)
+        self.assert_keys_count(0)
+
+        obj = DocumentObject(1, name='Alice', title='Title')
+        assert obj.get_key_names() == ['astra::documentobject::hash::1',
+                                       'astra::documentobject::doc::1']
+        obj.remove()
+        self.assert_keys_count(0)
+
+    def test_get_many(self):
+        DocumentObject(1, name='Alice', credits=10)
+        DocumentObject(2, name='Bob')
+        global commands
+        commands = []
+        objects = DocumentObject.get_many([1, 2, 3], fields=['name',
+                                                             'credits'])
+        assert [command[0] for command in commands] == ['GET'] * 3
+        commands = []
+        assert [(o.name, o.credits) for o in objects] == \
+            [('Alice', 10), ('Bob', 0), ('', 0)]
+        assert commands == []
+
+    def test_helpers_are_not_available(self):
+        obj = DocumentObject(1, credits=10)
+        with pytest.raises(AttributeError):
+            obj.credits_incr()
+
+
+class CompactObject(models.Model):
+    name = models.CharHash(index=True)
+    rating = models.IntegerHash(range_index=True)
+    credits_test = models.IntegerField()
+    sites_list = models.List(to=SiteObject)
+    key_schema = models.KeySchema(prefix='a', alias='c', separator=':',
+                                  type_tags=models.SHORT_TYPE_TAGS,
+                                  fields={'credits_test': 'ct',
+                                          'sites_list': 'sl'})
+
+    def get_db(self):
+        return db
+
+
+class TestKeySchema(CommonHelper):
+    def test_key_names(self):
+        obj = CompactObject(1, name='Alice', rating=5, credits_test=10)
+        obj.sites_list.rpush(SiteObject(1))
+        assert sorted(db.keys()) == ['a:c:f:1:ct', 'a:c:h:1',
+                                     'a:c:i:name:Alice', 'a:c:l:1:sl',
+                                     'a:c:r:rating']
+        assert CompactObject.filter(name='Alice') == ['1']
+        assert CompactObject.range('rating', 5, 5) == ['1']
+        assert [o.pk for o in CompactObject.iter_all()] == ['1']
+        obj.remove()
+        self.assert_keys_count(0)
+
+    def test_wrong_schema(self):
+        with pytest.raises(AttributeError):  # Alias clashes with field
+            class WrongAlias(models.Model):
+                name = models.CharHash()
+                title = models.CharHash()
+                key_schema = models.KeySchema(fields={'title': 'name'})
+        with pytest.raises(AttributeError):
+            class WrongSeparator(models.Model):
+                name = models.CharHash()
+                key_schema = models.KeySchema(separator=':',
+                                              fields={'name': 'n:1'})
+        with pytest.raises(AttributeError):  # Subclass keys would clash
+            class CompactChild(CompactObject):
+                pass
+
+    def test_migrate_keys(self):
+        from astra.migration import migrate_keys
+        old_schema = models.KeySchema(alias='legacy')
+        for i in range(10):
+            db.hset('astra::legacy::hash::%s' % i, 'name', 'Name%s' % i)
+            db.sadd('astra::legacy::idx::name::Name%s' % i, i)
+            db.set('astra::legacy::fld::%s::credits_test' % i, i)
+        db.zadd('astra::legacy::ridx::rating', {'1': 1})
+        db.rpush('astra::legacy::list::1::sites_list', '2')
+        db.set('astra::legacy::fld::1::unknown', '1')
+        db.set('a:c:f:2:ct', 20)  # Written in the new layout already
+
+        batches = list(migrate_keys(CompactObject, old_schema, batch_size=5))
+        assert batches[-1][0] == 0
+        assert sum(renamed for _, renamed, _ in batches) == 31
+        assert sum(skipped for _, _, skipped in batches) == 1
+        assert sorted(db.keys('astra::*')) == [
+            'astra::legacy::fld::1::unknown',
+            'astra::legacy::fld::2::credits_test']
+        obj = CompactObject(3)
+        assert obj.name == 'Name3'
+        assert obj.credits_test == 3
+        assert CompactObject(2).credits_test == 20
+        assert CompactObject(1).sites_list.lrange(0, -1)[0].pk == '2'
+        assert CompactObject.filter(name='Name3') == ['3']
+        assert CompactObject.range('rating', 1, 1) == ['1']
+        assert list(migrate_keys(CompactObject, old_schema))[-1][1] == 0
+
+
+class BucketObject(models.Model):
+    name = models.CharHash()
+    status = models.EnumHash(enum=('NEW', 'ACTIVE'), default='NEW',
+                             index=True)
+    rating = models.IntegerHash(range_index=True)
+    credits_test = models.IntegerField()
+    hash_bucket_size = 100
+
+    def get_db(self):
+        return db
+
+
+class TestHashBucket(CommonHelper):
+    def test_assign_and_read(self):
+        BucketObject(1, name='Alice', status='ACTIVE', rating=5)
+        BucketObject(2, name='Bob')
+        BucketObject(150, name='Carol')
+        assert db.hgetall('astra::bucketobject::bucket::0') == {
+            '1:name': 'Alice', '1:status': 'ACTIVE', '1:rating': '5',
+            '2:name': 'Bob'}
+        assert db.hgetall('astra::bucketobject::bucket::1') == {
+            '50:name': 'Carol'}
+        obj = BucketObject(1)
+        global commands
+        commands = []
+        assert obj.name == 'Alice'
+        assert obj.status == 'ACTIVE'
+        assert obj.rating == 5
+        self.assert_commands_count(1)  # HMGET of all fields
+        assert BucketObject(2).status == 'NEW'
+        assert BucketObject.filter(status='ACTIVE') == ['1']
+        assert BucketObject.range('rating', 5, 5) == ['1']
+
+    def test_remove_and_exist(self):
+        obj = BucketObject(1, name='Alice', status='ACTIVE', credits_test=1)
+        BucketObject(2, name='Bob')
+        assert BucketObject(1).hash_exist() is True
+        assert BucketObject(3).hash_exist() is False
+        BucketObject.name.remove(obj)
+        assert BucketObject(1).name == ''
+        obj.remove()
+        assert BucketObject(1).hash_exist() is False
+        assert BucketObject.filter(status='ACTIVE') == []
+        assert db.keys() == ['astra::bucketobject::bucket::0']
+        assert BucketObject(2).name == 'Bob'
+        BucketObject(3, name='Carol', credits_test=3)
+        assert BucketObject.remove_many([2, 3, 4]) == 3
+        self.assert_keys_count(0)
+
+    def test_get_many_and_conditional_update(self):
+        for i in range(3):
+            BucketObject(i, name='Name%s' % i, rating=i)
+        global commands
+        commands = []
+        objects = BucketObject.get_many([0, 1, 2], fields=['name'])
+        assert [o.name for o in objects] == ['Name0', 'Name1', 'Name2']
+        self.assert_commands_count(3)
+        assert objects[1].cas('name', 'Name1', 'New') is True
+        assert objects[1].hincrby('rating', 5) == 6
+        assert BucketObject(1).name == 'New'
+        assert BucketObject(1).rating == 6
+        assert BucketObject(0).rating == 0
+
+    def test_not_integer_pk(self):
+        with pytest.raises(ValueError):
+            BucketObject('one', name='Alice')
+        with pytest.raises(TypeError):
+            list(BucketObject.iter_all())
+
+
+class SessionObject(models.Model):
+    user = models.ForeignHash(to=UserObject)
+    token = models.CharField()
+    pages = models.List()
+    default_ttl = 100
+
+    def get_db(self):
+        return db
+
+
+class SlidingSessionObject(SessionObject):
+    ttl_write_through = True
+
+
+class SessionDocument(models.Model):
+    token = models.CharField()
+    page = models.CharField()
+    document_storage = True
+    default_ttl = 100
+
+    def get_db(self):
+        return db
+
+
+class TestExpire(CommonHelper):
+    def test_default_ttl_on_creation(self):
+        session = SessionObject(1, user=UserObject(1), token='abc')
+        self.assert_pipelines_count(1)
+        assert sorted(db.ttl(key) for key in db.keys()) == [100, 100]
+        global pipelines
+        pipelines = []
+        session.pages.rpush('/')  # Created key gets default_ttl
+        assert db.ttl('astra::sessionobject::list::1::pages') == 100
+        assert [[command[0] for command in pipeline]
+                for pipeline in pipelines] == [['RPUSH', 'EXPIRE']]
+
+    def test_writes_keep_ttl(self):
+        session = SessionObject(1, user=UserObject(1), token='abc')
+        db.expire('astra::sessionobject::fld::1::token', 10)
+        global pipelines
+        pipelines = []
+        session.token = 'def'
+        with session.batch():
+            session.user = UserObject(2)
+            session.token = 'ghi'
+        self.assert_pipelines_count(2)  # Existing keys only
+        assert db.ttl('astra::sessionobject::fld::1::token') == 10
+        assert db.ttl('astra::sessionobject::hash::1') == 100
+        assert SessionObject(1).token == 'ghi'
+        session.persist()
+        session.token = 'jkl'
+        assert db.ttl('astra::sessionobject::fld::1::token') == -1
+
+    def test_helpers_keep_ttl(self):
+        session = SessionObject(1)
+        assert session.token_append('abc') == 3
+        assert db.ttl('astra::sessionobject::fld::1::token') == 100
+        db.expire('astra::sessionobject::fld::1::token', 10)
+        assert session.token_setnx('def') is False
+        assert session.token_append('def') == 6
+        assert db.ttl('astra::sessionobject::fld::1::token') == 10
+        with session.batch():
+            session.token_setex(5, 'ghi')
+            assert session.token_append('jkl') is None  # Buffered
+        assert db.ttl('astra::sessionobject::fld::1::token') == 5
+        assert SessionObject(1).token == 'ghijkl'
+
+    @pytest.mark.skipif(PY2, reason="requires python3")
+    def test_key_removed_by_other_writer(self):
+        from astra.model import WriteBuffer
+        session = SessionObject(1, token='abc')
+        original_method = WriteBuffer._get_missing_key_names
+
+        def get_missing_key_names(write_buffer, pipe, key_names):
+            missing_key_names = original_method(write_buffer, pipe, key_names)
+            if not missing_key_names:  # Removed after the check
+                db.delete('astra::sessionobject::fld::1::token')
+            return missing_key_names
+
+        with patch.object(WriteBuffer, '_get_missing_key_names',
+                          get_missing_key_names):
+            session.token = 'def'  # Transaction is retried
+        assert db.ttl('astra::sessionobject::fld::1::token') == 100
+        assert SessionObject(1).token == 'def'
+
+    def test_helpers_write_through(self):
+        session = SlidingSessionObject(1, token='abc')
+        db.expire('astra::slidingsessionobject::fld::1::token', 10)
+        assert session.token_append('def') == 6
+        assert db.ttl('astra::slidingsessionobject::fld::1::token') == 100
+        assert session.token_expire(5) is True
+        assert db.ttl('astra::slidingsessionobject::fld::1::token') == 5
+
+    def test_expire_and_persist(self):
+        session = SessionObject(1)
+        session.token = 'abc'
+        session.pages.rpush('/')
+        global pipelines
+        pipelines = []
+        assert session.expire(10) == 2
+        assert session.expire() == 2
+        self.assert_pipelines_count(2)
+        assert [db.ttl(key) for key in session.get_key_names()] == \
+            [-2, 100, 100]
+        assert session.persist() == 2
+        assert db.ttl('astra::sessionobject::fld::1::token') == -1
+        with session.batch():
+            session.token = 'def'
+            assert session.expire(5) is None
+        assert db.ttl('astra::sessionobject::fld::1::token') == 5
+        with pytest.raises(ValueError):
+            UserObject(1).expire()
+
+    def test_write_through(self):
+        session = SlidingSessionObject(1, token='abc')
+        assert db.ttl('astra::slidingsessionobject::fld::1::token') == 100
+        db.expire('astra::slidingsessionobject::fld::1::token', 10)
+        global commands
+        commands = []
+        session.user = UserObject(1)
+        assert [command[0] for command in commands] == \
+            ['HSET', 'EXPIRE', 'EXPIRE', 'EXPIRE']
+        assert db.ttl('astra::slidingsessionobject::fld::1::token') == 100
+        assert session.pages.rpush('/') == 1  # Answer of the command
+        assert db.ttl('astra::slidingsessionobject::list::1::pages') == 100
+        session.update(token='def')
+        assert db.ttl('astra::slidingsessionobject::fld::1::token') == 100
+
+    def test_document_keeps_ttl(self):
+        session = SessionDocument(1, token='abc', page='/')
+        session.token = 'def'
+        SessionDocument.page.remove(session)
+        assert db.ttl('astra::sessiondocument::doc::1') == 100
+        assert SessionDocument(1).token == 'def'
+
+    def test_wrong_options(self):
+        with pytest.raises(AttributeError):
+            class NoDefaultTTL(models.Model):
+                token = models.CharField()
+                ttl_write_through = True
+        with pytest.raises(AttributeError):
+            class BucketWithTTL(models.Model):
+                name = models.CharHash()
+                hash_bucket_size = 10
+                default_ttl = 10
+
+
+class TaggedObject(models.Model):
+    name = models.CharHash()
+    credits_test = models.IntegerField()
+    sites_list = models.List(to=SiteObject)
+    key_schema = models.KeySchema(hash_tags=True)
+
+    def get_db(self):
+        return db
+
+
+class TestHashTags(CommonHelper):
+    def test_key_names(self):
+        from astra.cluster import key_slot
+        obj = TaggedObject(1, name='Alice', credits_test=10)
+        obj.sites_list.rpush(SiteObject(1))
+        key_names = obj.get_key_names()
+        assert key_names == ['astra::taggedobject::hash::{1}',
+                             'astra::taggedobject::fld::{1}::credits_test',
+                             'astra::taggedobject::list::{1}::sites_list']
+        assert len(set(key_slot(key) for key in key_names)) == 1
+        assert key_slot(key_names[0]) == key_slot('1')
+        assert [o.pk for o in TaggedObject.iter_all()] == ['1']
+        assert TaggedObject(1).name == 'Alice'
+
+    def test_group_by_slot(self):
+        from astra.cluster import group_by_slot, key_slot
+        assert key_slot('123456789') == 12739  # Check value of CRC16
+        assert key_slot('a{user1000}b') == key_slot('user1000')
+        assert key_slot('a{}b') != key_slot('')  # Empty tag is not used
+        assert group_by_slot(['{1}a', '{2}a', '{1}b']) == \
+            [['{1}a', '{1}b'], ['{2}a']]
+
+    def test_indexes_are_not_available(self):
+        with pytest.raises(AttributeError):
+            class TaggedIndex(models.Model):
+                name = models.CharHash(index=True)
+                key_schema = models.KeySchema(hash_tags=True)
+
+    def test_migrate_keys(self):
+        from astra.migration import migrate_keys
+        db.hset('astra::taggedobject::hash::1', 'name', 'Alice')
+        db.set('astra::taggedobject::fld::1::credits_test', 10)
+        assert list(migrate_keys(TaggedObject))[-1][1:] == (2, 0)
+        assert sorted(db.keys()) == [
+            'astra::taggedobject::fld::{1}::credits_test',
+            'astra::taggedobject::hash::{1}']
+        assert TaggedObject(1).credits_test == 10